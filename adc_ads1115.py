@@ -6,6 +6,31 @@
 #
 # Description: This library supports getting temperature in F from the ADS1115
 #
+#  The ADS1115 is run in continuous conversion mode by a background thread,
+#  which visits each channel in turn (round robin), collects a number of
+#  back-to-back conversions and stores them in a per-channel buffer.
+#  ReadAllPorts() returns the average of the buffered samples immediately,
+#  instead of blocking on single shot conversions.
+#
+#  The end of each conversion is detected by waiting on the ALERT/RDY pin
+#  (if connected to a GPIO), otherwise by waiting for the conversion time
+#  at the configured data rate.
+#
+#  Probe channels can be spread over several ADS1115 devices at different
+#  I2C addresses (four channels per device, numbered in the order of the
+#  addresses).  Each device has its own acquisition thread, so the conversions
+#  on the different devices run concurrently.
+#
+#  Register accesses go through the I2C bus arbiter with the highest
+#  priority, the bus is not held while waiting for a conversion.
+#
+#  Faults are isolated per channel.  A channel that fails to read is retried
+#  with an exponential backoff while the other channels keep being read, and
+#  each reading is classified as 'ok', 'shorted', 'disconnected',
+#  'out_of_range' or 'error' (no recent samples).  While a channel is faulted,
+#  its last good temperature is reported for up to fault_hold seconds, after
+#  which it is reported as 0 (as before).
+#
 # *****************************************
 
 # *****************************************
@@ -14,97 +39,258 @@
 
 import ADS1115
 import time
-import math
-import datetime
+import threading
+from collections import deque
+from probe_table import GetTable
+from i2c_arbiter import BusTransaction, PRIORITY_ADC
+from common import WriteLog
+
+# ADS1115 Registers
+REG_CONVERSION = 0x00
+REG_CONFIG = 0x01
+REG_LO_THRESH = 0x02
+REG_HI_THRESH = 0x03
+
+# Config register values
+MUX_SINGLE = [0x4000, 0x5000, 0x6000, 0x7000]  # AINx vs. GND
+MODE_CONTIN = 0x0000
+COMP_QUE_1CONV = 0x0000  # Assert ALERT/RDY after each conversion
+COMP_QUE_DISABLE = 0x0003
+
+PGA_CONFIG = {
+	6144 : 0x0000,
+	4096 : 0x0200,
+	2048 : 0x0400,
+	1024 : 0x0600,
+	512 : 0x0800,
+	256 : 0x0A00
+}
+
+SPS_CONFIG = {
+	8 : 0x0000,
+	16 : 0x0020,
+	32 : 0x0040,
+	64 : 0x0060,
+	128 : 0x0080,
+	250 : 0x00A0,
+	475 : 0x00C0,
+	860 : 0x00E0
+}
 
 class ReadADC:
 
-	def __init__(self, grill_probe_profile, probe_01_profile, probe_02_profile, units='F'):
-		self.ads = ADS1115.ADS1115()
+	def __init__(self, grill_probe_profile, probe_01_profile, probe_02_profile, *extra_profiles, units='F', sps=250, pga=6144, rdy_pin=0, oversample=4, buffer_size=16, fault_hold=30, addresses=[0x48]):
+		# extra_profiles: Probe profiles of any channels after probe 2 (probe 3, probe 4, ...)
+		# sps: Data rate in samples per second (8, 16, 32, 64, 128, 250, 475, 860)
+		# pga: Full scale range in mV (6144, 4096, 2048, 1024, 512, 256)
+		# rdy_pin: GPIO (BCM) connected to the ALERT/RDY pin (0 = not connected), or a list with one GPIO per device
+		# oversample: Number of conversions taken from a channel before moving to the next channel
+		# buffer_size: Number of samples per channel that are averaged by ReadAllPorts()
+		# fault_hold: Seconds to report the last good temperature of a faulted channel
+		# addresses: I2C addresses of the ADS1115 devices, four channels per device
 		self.units = units 
-		self.SetProfiles(grill_probe_profile, probe_01_profile, probe_02_profile)
+		self.SetProfiles(grill_probe_profile, probe_01_profile, probe_02_profile, *extra_profiles)
 
-	def SetProfiles(self, grill_probe_profile, probe_01_profile, probe_02_profile):
-		self.grill_probe_profile = grill_probe_profile
-		self.probe_01_profile = probe_01_profile
-		self.probe_02_profile = probe_02_profile
+		channels = 3 + len(extra_profiles)
+		num_devices = (channels + 3) // 4
+		if len(addresses) < num_devices:
+			WriteLog('WARNING: Only ' + str(len(addresses)) + ' ADS1115 address(es) configured, probe channels ' + str(len(addresses) * 4) + ' and above will not be read.')
+			num_devices = len(addresses)
+			channels = num_devices * 4
+		self.channels = channels
 
-	def adctotemp(self, adc_value, probe_profile):
-		if(adc_value > 0) and (adc_value < (probe_profile['Vs'] * 1000)):
-			# Voltage at the divider (i.e. input to the ADC)
-			Vo = (adc_value / 1000) # mV to V of ADC (at the divider)
+		if sps not in SPS_CONFIG:
+			sps = 250
+		if pga not in PGA_CONFIG:
+			pga = 6144
+		self.sps = sps
+		self.pga = pga
+		self.oversample = max(int(oversample), 1)
+		self.conversion_time = 1.0 / sps
+
+		self.devices = [ADS1115.ADS1115(address=address) for address in addresses[0:num_devices]]
+		self.bus_names = ['ads1115@' + hex(address) for address in addresses[0:num_devices]]  # Device names for the bus statistics
+		# Channels read by each device, as (channel, mux input) pairs
+		self.device_channels = [[(channel, channel % 4) for channel in range(device * 4, min((device + 1) * 4, channels))] for device in range(num_devices)]
+
+		if not isinstance(rdy_pin, list):
+			rdy_pin = [rdy_pin]
+		self.rdy_pins = (rdy_pin + [0] * num_devices)[0:num_devices]
+		if any(self.rdy_pins):
+			import RPi.GPIO as GPIO
+			self.GPIO = GPIO
+			self.GPIO.setmode(GPIO.BCM)
+			for device in range(num_devices):
+				if self.rdy_pins[device]:
+					self.GPIO.setup(self.rdy_pins[device], GPIO.IN, pull_up_down=GPIO.PUD_UP)
+					# Conversion ready: Hi_thresh MSB = 1, Lo_thresh MSB = 0
+					self.WriteRegister(device, REG_HI_THRESH, 0x8000)
+					self.WriteRegister(device, REG_LO_THRESH, 0x0000)
 
-			# Thermistor Resistor Value Ohms (R1)
-			# R1 = ( (Vin * R2) - (Vout * R2) ) / Vout
-			# Tr = ((probe_profile['Vs'] * probe_profile['Rd']) - (Vo * probe_profile['Rd'])) / Vo
-			# R2 = ( Vout * R1 ) / ( Vin - Vout )
-			Tr = ( Vo * probe_profile['Rd']) / ( probe_profile['Vs'] - Vo )
-			#print('Probe: ' + probe_profile['name'])
-			#print('Probe Resistance: ' + str(Tr))
-			# Coefficient a, b, & c values
+		self.lock = threading.Lock()
+		self.buffers = [deque(maxlen=buffer_size) for channel in range(channels)]
+		self.last_sample = [0] * channels  # Time of the last good sample of each channel
 
-			a = probe_profile['A']
-			b = probe_profile['B']
-			c = probe_profile['C']
+		# Per channel fault handling
+		self.fault_hold = fault_hold
+		self.retry_time = [0] * channels  # Time of the next read attempt after an error
+		self.retry_delay = [0] * channels  # Current backoff delay after consecutive errors
+		self.status = ['ok'] * channels
+		self.fault_count = [0] * channels  # Number of times each channel entered a fault state
+		self.last_good = [None] * channels  # (temperature, Tr, time) of the last good reading
+		self.ready = threading.Event()  # Set once every channel has at least one sample
+		self.running = True
+		self.threads = []
+		for device in range(num_devices):
+			thread = threading.Thread(target=self.Acquire, args=(device,), daemon=True)
+			thread.start()
+			self.threads.append(thread)
+		self.ready.wait(timeout=2)
 
-		    #Steinhart Hart Equation
+	def WriteRegister(self, device, register, value):
+		ads = self.devices[device]
+		with BusTransaction(self.bus_names[device], PRIORITY_ADC):
+			ads.i2c.write_i2c_block_data(ads.address, register, [(value >> 8) & 0xFF, value & 0xFF])
 
-			# 1/T = A + B(ln(R)) + C(ln(R))^3
+	def ReadConversion(self, device):
+		ads = self.devices[device]
+		with BusTransaction(self.bus_names[device], PRIORITY_ADC):
+			data = ads.i2c.read_i2c_block_data(ads.address, REG_CONVERSION, 2)
+		raw = (data[0] << 8) | data[1]
+		if raw > 0x7FFF:
+			raw -= 0x10000
+		return raw * self.pga / 32768.0  # Convert to mV
 
-		    # T = 1/(a + b[ln(ohm)] + c[ln(ohm)]^3)
+	def WaitConversion(self, device):
+		if self.rdy_pins[device]:
+			# ALERT/RDY pulses low at the end of each conversion
+			timeout = int(self.conversion_time * 3000) + 10
+			if self.GPIO.wait_for_edge(self.rdy_pins[device], self.GPIO.FALLING, timeout=timeout) is None:
+				raise IOError('Timeout waiting for ADS1115 conversion ready.')
+		else:
+			# Conversion time plus 10% for the tolerance of the internal oscillator
+			time.sleep(self.conversion_time * 1.1)
+
+	def Acquire(self, device):
+		# Background thread (one per device): round robin over the device channels in continuous conversion mode
+		comp_que = COMP_QUE_1CONV if self.rdy_pins[device] else COMP_QUE_DISABLE
+		channels = self.device_channels[device]
+		while self.running:
+			for channel, mux in channels:
+				if time.time() < self.retry_time[channel]:
+					continue  # Backing off after errors on this channel
+				try:
+					config = MUX_SINGLE[mux] | PGA_CONFIG[self.pga] | MODE_CONTIN | SPS_CONFIG[self.sps] | comp_que
+					self.WriteRegister(device, REG_CONFIG, config)
+					# The ADS1115 settles in a single cycle, so the first conversion after the mux change is valid
+					samples = []
+					for index in range(self.oversample):
+						self.WaitConversion(device)
+						samples.append(self.ReadConversion(device))
+				except:
+					if self.retry_delay[channel] == 0:
+						# Only the first failed read is logged, the retries are logged as a fault by ReadChannel
+						WriteLog('ERROR: Error Reading Temperature on channel ' + str(channel) + '.')
+					# Exponential backoff for this channel (0.1s doubling up to 5s)
+					self.retry_delay[channel] = min(max(self.retry_delay[channel] * 2, 0.1), 5.0)
+					self.retry_time[channel] = time.time() + self.retry_delay[channel]
+					continue
 
-			lnohm = math.log(Tr) # ln(ohms)
+				self.retry_delay[channel] = 0
+				with self.lock:
+					self.buffers[channel].extend(samples)
+					self.last_sample[channel] = time.time()
 
-			t1 = (b*lnohm) # b[ln(ohm)]
+			if not self.ready.is_set():
+				with self.lock:
+					if all(len(buffer) > 0 for buffer in self.buffers):
+						self.ready.set()
+
+			if min(self.retry_time[channel] for channel, mux in channels) > time.time():
+				# Every channel on this device is backing off
+				time.sleep(0.05)
 
-			t2 = c * math.pow(lnohm,3) # c[ln(ohm)]^3
+	def GetAverages(self, max_age=2.0):
+		# Returns the average mV of the buffered samples of each channel, or None if there is no recent data
+		now = time.time()
+		averages = []
+		with self.lock:
+			for channel in range(self.channels):
+				if (len(self.buffers[channel]) > 0) and (now - self.last_sample[channel] < max_age):
+					averages.append(sum(self.buffers[channel]) / len(self.buffers[channel]))
+				else:
+					averages.append(None)
+		return averages
 
-			tempK = 1/(a + t1 + t2) # calculate temperature in Kelvin
+	def Stop(self):
+		self.running = False
+		for thread in self.threads:
+			thread.join(timeout=2)
 
-			tempC = tempK - 273.15 # Kelvin to Celsius
+	def SetProfiles(self, grill_probe_profile, probe_01_profile, probe_02_profile, *extra_profiles):
+		self.grill_probe_profile = grill_probe_profile
+		self.probe_01_profile = probe_01_profile
+		self.probe_02_profile = probe_02_profile
+		self.profiles = [grill_probe_profile, probe_01_profile, probe_02_profile] + list(extra_profiles)
+		self.BuildTables()
 
-			tempF = tempC * (9/5) + 32 # Celsius to Farenheit
+	def BuildTables(self):
+		# Build the mV to temperature lookup tables up front, so the first reading is not delayed
+		for probe_profile in self.profiles:
+			GetTable(probe_profile, self.units)
 
-			# Check bounds for realistic temperature values (0-600F), else report 0F
-			if (tempF < 0) or (tempF > 600):
-				tempF = 0
+	def adctotemp(self, adc_value, probe_profile):
+		# Return Calculated Temperature and Thermistor Value in Ohms, from the lookup table for this profile and units
+		return GetTable(probe_profile, self.units).Convert(adc_value)
 
+	def ReadChannel(self, channel, adc_value, probe_profile, now):
+		# Returns the temperature, Tr, status and held flag for a channel
+		if adc_value is None:
+			status = 'error'
 		else:
-			tempF = 0.0
-			tempC = 0.0
-			Tr = 0
+			status = GetTable(probe_profile, self.units).Status(adc_value)
 
-		if self.units == 'F':
-			return tempF, Tr  # Return Calculated Temperature and Thermistor Value in Ohms
-		else: 
-			return tempC, Tr  # Return Calculated Temperature and Thermistor Value in Ohms
+		if status != self.status[channel]:
+			if status != 'ok':
+				if self.status[channel] == 'ok':
+					self.fault_count[channel] += 1
+				event = 'WARNING: Probe channel ' + str(channel) + ' fault: ' + status
+			else:
+				event = 'Probe channel ' + str(channel) + ' recovered from fault: ' + self.status[channel]
+			WriteLog(event)
+			self.status[channel] = status
 
-	def ReadAllPorts(self):
-		adc_value = [0,0,0]
+		if status == 'ok':
+			temp, Tr = self.adctotemp(adc_value, probe_profile)
+			self.last_good[channel] = (temp, Tr, now)
+			return temp, Tr, status, False
 
-		try:
-			for index in range(3):
-				time.sleep(0.05)
-				adc_value[index] = self.ads.readADCSingleEnded(index)
-		except:
-			now = str(datetime.datetime.now())
-			now = now[0:19] # Truncate the microseconds
-			print(str(now) + ' Error Reading Temperature.')
-			adc_data = {}
-			adc_data['GrillTemp'] = 0
-			adc_data['GrillTr'] = 0 
-			adc_data['Probe1Temp'] = 0
-			adc_data['Probe1Tr'] = 0
-			adc_data['Probe2Temp'] = 0
-			adc_data['Probe2Tr'] = 0
-			return(adc_data)
+		# Last good value policy
+		if (self.last_good[channel] is not None) and (now - self.last_good[channel][2] < self.fault_hold):
+			return self.last_good[channel][0], self.last_good[channel][1], status, True
 
-		adc_data = {}
-		adc_data['GrillTemp'], adc_data['GrillTr'] = self.adctotemp(adc_value[0], self.grill_probe_profile)
+		return 0, 0, status, False
 
-		adc_data['Probe1Temp'], adc_data['Probe1Tr'] = self.adctotemp(adc_value[1], self.probe_01_profile)
+	def ReadAllPorts(self):
+		adc_value = self.GetAverages()
+		now = time.time()
+
+		# Channels are added at startup, so only the profiles of the channels being read are used
+		channels = min(self.channels, len(self.profiles))
+		profiles = self.profiles
+		temps = [0] * channels
+		trs = [0] * channels
+		status = ['ok'] * channels
+		held = [False] * channels
+		for channel in range(channels):
+			temps[channel], trs[channel], status[channel], held[channel] = self.ReadChannel(channel, adc_value[channel], profiles[channel], now)
 
-		adc_data['Probe2Temp'], adc_data['Probe2Tr'] = self.adctotemp(adc_value[2], self.probe_02_profile)
+		adc_data = {}
+		adc_data['Temps'] = temps  # Temperature of each channel (grill, probe 1, probe 2, ...)
+		adc_data['Trs'] = trs
+		adc_data['ProbeStatus'] = status  # 'ok', 'shorted', 'disconnected', 'out_of_range' or 'error' per channel
+		adc_data['ProbeHeld'] = held  # True if the last good value is being reported for a faulted channel
+		adc_data['ProbeFaults'] = list(self.fault_count)
 
 		return (adc_data)
 
@@ -112,4 +298,5 @@ class ReadADC:
 		if units == 'C':
 			self.units = 'C'
 		else: 
-			self.units = 'F'
\ No newline at end of file
+			self.units = 'F'
+		self.BuildTables()
\ No newline at end of file
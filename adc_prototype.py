@@ -16,27 +16,27 @@ import time
 import math
 import random
 
-class ReadADC:
+START_TEMPS = {'F' : [55, 32, 42], 'C' : [12, 0, 5.5]}  # Fake starting temperatures (grill, probe 1, probe 2) for prototype only
 
-	def __init__(self, grill_probe_profile, probe_01_profile, probe_02_profile, units='F'):
-		self.SetProfiles(grill_probe_profile, probe_01_profile, probe_02_profile)
+class ReadADC:
 
-		self.adc_data = {}
+	def __init__(self, grill_probe_profile, probe_01_profile, probe_02_profile, *extra_profiles, units='F'):
 		self.units = units 
-		if self.units == 'F':
-			self.adc_data['GrillTemp'] = 55		# Fake starting temperature for prototype only
-			self.adc_data['Probe1Temp'] = 32	# Fake starting temperature for prototype only
-			self.adc_data['Probe2Temp'] = 42	# Fake starting temperature for prototype only
-		else:
-			self.adc_data['GrillTemp'] = 12		# Fake starting temperature for prototype only
-			self.adc_data['Probe1Temp'] = 0	# Fake starting temperature for prototype only
-			self.adc_data['Probe2Temp'] = 5.5	# Fake starting temperature for prototype only
+		self.temps = []
+		self.SetProfiles(grill_probe_profile, probe_01_profile, probe_02_profile, *extra_profiles)
 
-
-	def SetProfiles(self, grill_probe_profile, probe_01_profile, probe_02_profile):
+	def SetProfiles(self, grill_probe_profile, probe_01_profile, probe_02_profile, *extra_profiles):
 		self.grill_probe_profile = grill_probe_profile
 		self.probe_01_profile = probe_01_profile
 		self.probe_02_profile = probe_02_profile
+		self.profiles = [grill_probe_profile, probe_01_profile, probe_02_profile] + list(extra_profiles)
+		# One simulated temperature per channel, additional probes start at the probe 2 temperature
+		while len(self.temps) < len(self.profiles):
+			self.temps.append(self.StartTemp(len(self.temps)))
+		del self.temps[len(self.profiles):]
+
+	def StartTemp(self, channel):
+		return START_TEMPS[self.units][min(channel, 2)]
 
 	def adctotemp(self, temp, probe_profile):
 		# Since this is just a prototype module, and data is simulated, this function is used to determine the resistance value
@@ -65,11 +65,6 @@ class ReadADC:
 
 	def ReadAllPorts(self):
 		# This is my attemp at making a psuedo-random temperature that will generally rise
-		adc_value = [0,0,0] # Using this to populate random numbers from 0-9
-
-		for index in range(3):
-			adc_value[index] = random.randint(0,9)
-
 		if self.units == 'F':
 			maxGrillTemp = 425 
 			minGrillTemp = 50 
@@ -83,36 +78,30 @@ class ReadADC:
 			minProbeTemp = 0
 			changeFactor = 0.5
 
-		if (adc_value[0] > 7) and (self.adc_data['GrillTemp'] < maxGrillTemp):
-			self.adc_data['GrillTemp'] += changeFactor # raise temperature by changeFactor degree
-		elif (adc_value[0] < 1) and (self.adc_data['GrillTemp'] > minGrillTemp):
-			self.adc_data['GrillTemp'] -= changeFactor # reduce temperature by changeFactor degree
-
-		if (adc_value[1] > 7) and (self.adc_data['Probe1Temp'] < maxProbeTemp):
-			self.adc_data['Probe1Temp'] += changeFactor # raise temperature by changeFactor degree
-		elif (adc_value[1] < 1) and (self.adc_data['Probe1Temp'] > minProbeTemp):
-			self.adc_data['Probe1Temp'] -= changeFactor # reduce temperature by changeFactor degree
-
-		if (adc_value[2] > 7) and (self.adc_data['Probe2Temp'] < maxProbeTemp):
-			self.adc_data['Probe2Temp'] += changeFactor # raise temperature by changeFactor degree
-		elif (adc_value[2] < 1) and (self.adc_data['Probe2Temp'] > minProbeTemp):
-			self.adc_data['Probe2Temp'] -= changeFactor # reduce temperature by changeFactor degree
+		for channel in range(len(self.temps)):
+			adc_value = random.randint(0,9)
+			if channel == 0:
+				maxTemp, minTemp = maxGrillTemp, minGrillTemp
+			else:
+				maxTemp, minTemp = maxProbeTemp, minProbeTemp
+			if (adc_value > 7) and (self.temps[channel] < maxTemp):
+				self.temps[channel] += changeFactor # raise temperature by changeFactor degree
+			elif (adc_value < 1) and (self.temps[channel] > minTemp):
+				self.temps[channel] -= changeFactor # reduce temperature by changeFactor degree
 
 		# Thermistor data is not useful in prototype mode
-		self.adc_data['GrillTr'] = self.adctotemp(self.adc_data['GrillTemp'], self.grill_probe_profile) # Resistance of Grill Thermistor
-		self.adc_data['Probe1Tr'] = self.adctotemp(self.adc_data['Probe1Temp'], self.probe_01_profile) # Resistance of Probe Thermistor
-		self.adc_data['Probe2Tr'] = self.adctotemp(self.adc_data['Probe2Temp'], self.probe_02_profile) # Resistance of Probe Thermistor
+		return self.ChannelData(self.temps)
 
-		return (self.adc_data)
+	def ChannelData(self, temps):
+		# Temperature and thermistor resistance of each channel (grill, probe 1, probe 2, ...)
+		adc_data = {}
+		adc_data['Temps'] = list(temps)
+		adc_data['Trs'] = [self.adctotemp(temp, profile) for temp, profile in zip(temps, self.profiles)]
+		return (adc_data)
 
 	def update_units(self, units):
 		if units == 'C':
 			self.units = 'C'
-			self.adc_data['GrillTemp'] = 12		# Fake starting temperature for prototype only
-			self.adc_data['Probe1Temp'] = 0	 	# Fake starting temperature for prototype only
-			self.adc_data['Probe2Temp'] = 5.5	# Fake starting temperature for prototype only
 		else: 
 			self.units = 'F'
-			self.adc_data['GrillTemp'] = 55		# Fake starting temperature for prototype only
-			self.adc_data['Probe1Temp'] = 32	# Fake starting temperature for prototype only
-			self.adc_data['Probe2Temp'] = 42	# Fake starting temperature for prototype only
+		self.temps = [self.StartTemp(channel) for channel in range(len(self.profiles))]
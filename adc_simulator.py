@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire ADC Simulator Interface Library
+# *****************************************
+#
+# Description: This library simulates the temperatures of a pellet grill
+#  using a simple physical model, and exposes the same interface as the other
+#  ADC libraries.  The model is driven by the relay states of the grill
+#  platform object (auger, fan, igniter, power), so that the control modes
+#  (Smoke, Hold, etc.) can be evaluated in prototype mode.
+#
+#  Model overview (all internal values in Celsius / SI units):
+#   * Auger feeds pellets from the hopper into the firepot while it is ON.
+#   * The igniter rod heats up while ON and lights the pellets in the firepot.
+#   * Burning pellets are consumed at a rate proportional to the pellets in
+#     the firepot and to the airflow (fan ON = forced draft, OFF = natural).
+#   * The cooking chamber is heated by a fraction of the combustion heat and
+#     loses heat to ambient (more with the fan running or the lid open).
+#   * The grill probe and the meat probes follow the chamber temperature with
+#     first order lags.
+#
+#  The simulation is deterministic for a given seed and clock.
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import random
+from clock import SystemClock
+from adc_prototype import ReadADC as PrototypeADC
+
+class GrillModel:
+
+	def __init__(self, ambient=20.0, seed=None, params=None):
+		self.rng = random.Random(seed)
+
+		self.params = {
+			'auger_feed' : 0.8,			# Pellet feed rate of the auger while ON (g/s)
+			'hhv' : 19000.0,			# Heating value of wood pellets (J/g)
+			'heat_fraction' : 0.6,		# Fraction of the combustion heat that goes into the cooking chamber
+			'burn_rate' : 0.03,			# Fraction of the firepot pellets burned per second with full airflow (1/s)
+			'natural_draft' : 0.2,		# Relative airflow with the fan OFF
+			'chamber_capacity' : 25000.0,	# Heat capacity of the cooking chamber (J/C)
+			'chamber_ua' : 15.0,		# Heat loss coefficient of the cooking chamber to ambient (W/C)
+			'chamber_ua_nonlinear' : 300.0,	# Temperature difference (C) at which the heat loss coefficient doubles
+			'fan_ua' : 6.0,				# Additional heat loss through the flue with the fan ON (W/C)
+			'lid_open_factor' : 8.0,	# Heat loss multiplier while the lid is open
+			'igniter_max' : 800.0,		# Igniter rod temperature when fully heated (C)
+			'igniter_tau' : 30.0,		# Igniter rod heat up time constant (s)
+			'ignition_temp' : 400.0,	# Igniter rod temperature required to light the pellets (C)
+			'ignition_mass' : 1.0,		# Minimum pellets in the firepot to light (g)
+			'flameout_mass' : 0.05,		# Fire goes out below this amount of pellets in the firepot (g)
+			'grill_probe_tau' : 15.0,	# Grill RTD probe time constant (s)
+			'probe1_tau' : 9000.0,		# Food probe 1 time constant (s)
+			'probe2_tau' : 5400.0,		# Food probe 2 time constant (s)
+			'food_start' : 4.0,			# Starting temperature of the food (C)
+			'noise' : 0.3,				# Standard deviation of the probe reading noise (C)
+			'max_step' : 0.5			# Maximum integration step (s)
+		}
+		if params is not None:
+			self.params.update(params)
+
+		self.ambient = ambient			# Ambient temperature (C)
+		self.hopper_mass = 9000.0		# Pellets remaining in the hopper (g)
+		self.lid_open = False
+
+		self.chamber_temp = ambient
+		self.igniter_temp = ambient
+		self.firepot_mass = 0.0
+		self.burning = False
+		self.grill_probe = ambient
+		self.probe1 = self.params['food_start']
+		self.probe2 = self.params['food_start']
+
+		# Totals for analysis
+		self.pellets_fed = 0.0			# Total pellets fed into the firepot (g)
+		self.pellets_burned = 0.0		# Total pellets burned (g)
+		self.auger_on_time = 0.0		# Total time the auger has been running (s)
+		self.elapsed = 0.0				# Total simulated time (s)
+
+	def Step(self, dt, auger, fan, igniter):
+		# Advance the model by dt seconds with the given output states (True = ON)
+		p = self.params
+
+		while dt > 0:
+			h = min(dt, p['max_step'])
+			dt -= h
+
+			# Auger feed from hopper to firepot
+			if auger and (self.hopper_mass > 0):
+				fed = min(p['auger_feed'] * h, self.hopper_mass)
+				self.hopper_mass -= fed
+				self.firepot_mass += fed
+				self.pellets_fed += fed
+			if auger:
+				self.auger_on_time += h
+
+			# Igniter rod temperature
+			if igniter:
+				target = p['igniter_max']
+			else:
+				target = self.chamber_temp
+			self.igniter_temp += (target - self.igniter_temp) * min(h / p['igniter_tau'], 1)
+
+			# Ignition / flameout
+			if (not self.burning) and (self.igniter_temp >= p['ignition_temp']) and (self.firepot_mass >= p['ignition_mass']):
+				self.burning = True
+			elif (self.burning) and (self.firepot_mass < p['flameout_mass']):
+				self.burning = False
+
+			# Combustion
+			heat = 0.0
+			if self.burning:
+				airflow = 1.0 if fan else p['natural_draft']
+				burned = min(self.firepot_mass * p['burn_rate'] * airflow * h, self.firepot_mass)
+				self.firepot_mass -= burned
+				self.pellets_burned += burned
+				heat = burned * p['hhv'] * p['heat_fraction'] / h
+
+			# Cooking chamber energy balance
+			delta = self.chamber_temp - self.ambient
+			ua = p['chamber_ua'] * (1 + abs(delta) / p['chamber_ua_nonlinear'])
+			if fan:
+				ua += p['fan_ua']
+			if self.lid_open:
+				ua *= p['lid_open_factor']
+			self.chamber_temp += (heat - ua * delta) * h / p['chamber_capacity']
+
+			# Probe lags
+			self.grill_probe += (self.chamber_temp - self.grill_probe) * min(h / p['grill_probe_tau'], 1)
+			self.probe1 += (self.chamber_temp - self.probe1) * min(h / p['probe1_tau'], 1)
+			self.probe2 += (self.chamber_temp - self.probe2) * min(h / p['probe2_tau'], 1)
+
+			self.elapsed += h
+
+	def ReadProbes(self):
+		# Returns noisy probe readings in Celsius (grill, probe1, probe2)
+		noise = self.params['noise']
+		return (self.grill_probe + self.rng.gauss(0, noise),
+				self.probe1 + self.rng.gauss(0, noise),
+				self.probe2 + self.rng.gauss(0, noise))
+
+	def GetState(self):
+		state = {
+			'chamber_temp' : self.chamber_temp,
+			'ambient' : self.ambient,
+			'burning' : self.burning,
+			'firepot_mass' : self.firepot_mass,
+			'hopper_mass' : self.hopper_mass,
+			'lid_open' : self.lid_open,
+			'pellets_fed' : self.pellets_fed,
+			'pellets_burned' : self.pellets_burned,
+			'auger_on_time' : self.auger_on_time,
+			'elapsed' : self.elapsed
+		}
+		return state
+
+class ReadADC(PrototypeADC):
+
+	def __init__(self, grill_probe_profile, probe_01_profile, probe_02_profile, *extra_profiles, units='F', grill_platform=None, clock=None, seed=None, ambient=20.0, params=None):
+		# grill_platform: Grill platform object whose output states drive the model (None = all outputs OFF)
+		# clock: Time source shared with the control program (SystemClock by default)
+		# seed: Random seed for the probe noise, for repeatable simulations
+		self.units = units
+		self.temps = []
+		self.SetProfiles(grill_probe_profile, probe_01_profile, probe_02_profile, *extra_profiles)
+		self.grill_platform = grill_platform
+		if clock is None:
+			clock = SystemClock()
+		self.clock = clock
+		self.model = GrillModel(ambient=ambient, seed=seed, params=params)
+		self.last_update = self.clock.time()
+
+	def GetOutputs(self):
+		# Returns the (auger, fan, igniter) states of the grill platform as booleans
+		if self.grill_platform is None:
+			return False, False, False
+
+		current = self.grill_platform.GetOutputStatus()
+		relay_on = self.grill_platform.RELAY_ON
+		if current['power'] != relay_on:
+			return False, False, False
+		return (current['auger'] == relay_on), (current['fan'] == relay_on), (current['igniter'] == relay_on)
+
+	def Update(self):
+		# Integrate the model from the last update up to the current clock time
+		now = self.clock.time()
+		dt = now - self.last_update
+		if dt > 0:
+			auger, fan, igniter = self.GetOutputs()
+			self.model.Step(dt, auger, fan, igniter)
+		self.last_update = now
+
+	def ReadAllPorts(self):
+		self.Update()
+
+		# The model has a grill probe and two food probes, any additional probes read the ambient temperature
+		readings = list(self.model.ReadProbes())
+		readings += [self.model.ambient] * (len(self.profiles) - len(readings))
+		if self.units == 'F':
+			readings = [(temp * (9/5)) + 32 for temp in readings]
+
+		return self.ChannelData([round(temp, 1) for temp in readings[:len(self.profiles)]])
+
+	def update_units(self, units):
+		# The model runs in Celsius, so only the reported units change
+		if units == 'C':
+			self.units = 'C'
+		else:
+			self.units = 'F'
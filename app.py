@@ -13,7 +13,7 @@
 # *****************************************
 
 from flask import Flask, request, abort, render_template, make_response, send_file, jsonify, redirect
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_qrcode import QRcode
 from werkzeug.utils import secure_filename
 import threading
@@ -24,11 +24,15 @@ import os
 import json
 import datetime
 import math
+import redis
 from common import *  # Common Library for WebUI and Control Program
+from probe_table import SteinhartHart
+from temp_filter import FILTER_TYPES
 
 BACKUPPATH = './backups/'  # Path to backups of settings.json, pelletdb.json
 UPLOAD_FOLDER = BACKUPPATH  # Point uploads to the backup path
 ALLOWED_EXTENSIONS = {'json'}
+TIME_TO_EMPTY_MAX_AGE = 60  # Pellet prediction is ignored when it is older than this (s), i.e. the grill isn't feeding pellets
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
@@ -37,8 +41,32 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 thread = Thread()
 thread_lock = threading.Lock()
+grill_data_running = False  # emitGrillData background task is running
+
+# Last grill data sent to the 'grill_delta' room, and its sequence number (see request_grill_delta)
+delta_state = {'seq' : 0, 'data' : None}
+delta_sids = set()  # Sockets in the 'grill_delta' room
+delta_lock = threading.Lock()
+
+settings_version = None  # Version of the settings loaded in this process (see refresh_settings)
 
 clients = 0
+force_refresh = False
+sse_clients = 0  # Connections to the /stream Server-Sent Events endpoint
+
+# History data blobs by (num_items, reduce, datapoints, units, history version), see history_data
+HISTORY_CACHE_TTL = 3  # Cached history data is kept this long (s), one history sample period
+history_cache = {}
+history_inflight = {}  # Computations in progress, and the event set when each one finishes
+history_lock = threading.Lock()
+
+SSE_STREAM = 'control:events'  # Redis stream of the grill events sent on /stream
+SSE_BACKLOG = 1000  # Events kept in the stream for Last-Event-ID resume
+SSE_STATE = 'control:events:last'  # Data of the last event of each type added to the stream (see publish_sse_events)
+
+@app.before_request
+def before_request():
+	refresh_settings()
 
 @app.route('/')
 def index(action=None):
@@ -204,20 +232,29 @@ def dash(action=None):
 @app.route('/dashdata')
 def dashdata(action=None):
 
-	control = ReadControl()
-	global settings
-	probes_enabled = settings['probe_settings']['probes_enabled']
+	def build():
+		control = ReadControl()
+		global settings
+		probes_enabled = settings['probe_settings']['probes_enabled']
+
+		cur_probe_temps = []
+		cur_probe_temps = ReadCurrent()
+		probe_status = ReadProbeStatus()
 
-	cur_probe_temps = []
-	cur_probe_temps = ReadCurrent()
+		return jsonify({ 'cur_probe_temps' : cur_probe_temps, 'probes_enabled' : probes_enabled, 'current_mode' : control['mode'], 'set_points' : control['setpoints'], 'notify_req' : control['notify_req'], 'splus' : control['s_plus'], 'probe_status' : probe_status['status'] })
 
-	return jsonify({ 'cur_probe_temps' : cur_probe_temps, 'probes_enabled' : probes_enabled, 'current_mode' : control['mode'], 'set_points' : control['setpoints'], 'notify_req' : control['notify_req'], 'splus' : control['s_plus'] })
+	return versioned_response(['control', 'current', 'settings'], build)
 
 @app.route('/hopperlevel')
 def hopper_level(action=None):
-	pelletdb = ReadPelletDB()
-	cur_pellets_string = pelletdb['archive'][pelletdb['current']['pelletid']]['brand'] + ' ' + pelletdb['archive'][pelletdb['current']['pelletid']]['wood']
-	return jsonify({ 'hopper_level' : pelletdb['current']['hopper_level'], 'cur_pellets' : cur_pellets_string })
+
+	def build():
+		pelletdb = ReadPelletDB()
+		cur_pellets_string = pelletdb['archive'][pelletdb['current']['pelletid']]['brand'] + ' ' + pelletdb['archive'][pelletdb['current']['pelletid']]['wood']
+		hopper = ReadHopper()
+		return jsonify({ 'hopper_level' : pelletdb['current']['hopper_level'], 'hopper_time' : hopper['time'], 'time_to_empty' : time_to_empty(), 'cur_pellets' : cur_pellets_string })
+
+	return versioned_response(['pellets', 'hopper', 'pellet_model'], build, stale_after={'pellet_model' : TIME_TO_EMPTY_MAX_AGE})
 
 @app.route('/history/<action>', methods=['POST','GET'])
 @app.route('/history', methods=['POST','GET'])
@@ -306,8 +343,10 @@ def historypage(action=None):
 
 		if(list_length > 0):
 			# Build Time_List, Settemp_List, Probe_List, cur_probe_temps
-			writeline = 'Time,Grill Temp,Grill SetTemp,Probe 1 Temp,Probe 1 SetTemp,Probe 2 Temp, Probe 2 SetTemp\n'
-			csvfile.write(writeline)
+			writeline = 'Time,Grill Temp,Grill SetTemp,Probe 1 Temp,Probe 1 SetTemp,Probe 2 Temp, Probe 2 SetTemp'
+			for channel in range(3, (len(data_list[-1]) - 1) // 2):
+				writeline += ',Probe ' + str(channel) + ' Temp,Probe ' + str(channel) + ' SetTemp'
+			csvfile.write(writeline + '\n')
 			last = -1
 			for index in range(0, list_length):
 				if (int((index/list_length)*100) > last):
@@ -327,20 +366,23 @@ def historypage(action=None):
 	probes_enabled = settings['probe_settings']['probes_enabled']
 
 	data_blob = {}
-	data_blob = prepare_data(num_items, True, settings['history_page']['datapoints'])
+	data_blob = history_data(num_items, True, settings['history_page']['datapoints'])
 
-	return render_template('history.html', control=control, grill_temp_list=data_blob['grill_temp_list'], grill_settemp_list=data_blob['grill_settemp_list'], probe1_temp_list=data_blob['probe1_temp_list'], probe1_settemp_list=data_blob['probe1_settemp_list'], probe2_temp_list=data_blob['probe2_temp_list'], probe2_settemp_list=data_blob['probe2_settemp_list'], label_time_list=data_blob['label_time_list'], probes_enabled=probes_enabled, num_mins=settings['history_page']['minutes'], num_datapoints=settings['history_page']['datapoints'], autorefresh=settings['history_page']['autorefresh'], page_theme=settings['globals']['page_theme'], grill_name=settings['globals']['grill_name'])
+	return render_template('history.html', control=control, grill_temp_list=data_blob['grill_temp_list'], grill_settemp_list=data_blob['grill_settemp_list'], probe1_temp_list=data_blob['probe1_temp_list'], probe1_settemp_list=data_blob['probe1_settemp_list'], probe2_temp_list=data_blob['probe2_temp_list'], probe2_settemp_list=data_blob['probe2_settemp_list'], label_time_list=data_blob['label_time_list'], temp_lists=data_blob['temp_lists'], probes_enabled=probes_enabled, num_mins=settings['history_page']['minutes'], num_datapoints=settings['history_page']['datapoints'], autorefresh=settings['history_page']['autorefresh'], page_theme=settings['globals']['page_theme'], grill_name=settings['globals']['grill_name'])
     
 @app.route('/historyupdate')
 def historyupdate(action=None):
 
-	global settings
+	def build():
+		global settings
 
-	data_blob = {}
-	num_items = settings['history_page']['minutes'] * 20
-	data_blob = prepare_data(num_items, True, settings['history_page']['datapoints'])
+		data_blob = {}
+		num_items = settings['history_page']['minutes'] * 20
+		data_blob = history_data(num_items, True, settings['history_page']['datapoints'])
+
+		return jsonify({ 'grill_temp_list' : data_blob['grill_temp_list'], 'grill_settemp_list' : data_blob['grill_settemp_list'], 'probe1_temp_list' : data_blob['probe1_temp_list'], 'probe1_settemp_list' : data_blob['probe1_settemp_list'], 'probe2_temp_list' : data_blob['probe2_temp_list'], 'probe2_settemp_list' : data_blob['probe2_settemp_list'], 'label_time_list' : data_blob['label_time_list'], 'temp_lists' : data_blob['temp_lists'], 'settemp_lists' : data_blob['settemp_lists'] })
 
-	return jsonify({ 'grill_temp_list' : data_blob['grill_temp_list'], 'grill_settemp_list' : data_blob['grill_settemp_list'], 'probe1_temp_list' : data_blob['probe1_temp_list'], 'probe1_settemp_list' : data_blob['probe1_settemp_list'], 'probe2_temp_list' : data_blob['probe2_temp_list'], 'probe2_settemp_list' : data_blob['probe2_settemp_list'], 'label_time_list' : data_blob['label_time_list'] })
+	return versioned_response(['current', 'settings'], build)
 
 @app.route('/tuning/<action>', methods=['POST','GET'])
 @app.route('/tuning', methods=['POST','GET'])
@@ -705,6 +747,37 @@ def settingspage(action=None):
 		WriteSettings(settings)
 		WriteControl(control)
 
+	if (request.method == 'POST') and (action == 'probefilters'):
+		response = request.form
+
+		try:
+			for index in range(3):
+				probe_filter = settings['probe_settings']['probe_filters'][index]
+				if(f'filtertype_{index}' in response):
+					if(response[f'filtertype_{index}'] in FILTER_TYPES):
+						probe_filter['type'] = response[f'filtertype_{index}']
+				if(f'median_n_{index}' in response):
+					if(response[f'median_n_{index}'] != ''):
+						probe_filter['median_n'] = max(int(response[f'median_n_{index}']), 1)
+				if(f'alpha_{index}' in response):
+					if(response[f'alpha_{index}'] != ''):
+						probe_filter['alpha'] = min(max(float(response[f'alpha_{index}']), 0.01), 1.0)
+				if(f'process_noise_{index}' in response):
+					if(response[f'process_noise_{index}'] != ''):
+						probe_filter['process_noise'] = float(response[f'process_noise_{index}'])
+				if(f'measurement_noise_{index}' in response):
+					if(response[f'measurement_noise_{index}'] != ''):
+						probe_filter['measurement_noise'] = float(response[f'measurement_noise_{index}'])
+			event['type'] = 'updated'
+			event['text'] = 'Successfully updated probe filter settings.'
+		except:
+			event['type'] = 'error'
+			event['text'] = 'Something bad happened when trying to format your inputs.  Try again.'
+
+		WriteSettings(settings)
+		control['probe_profile_update'] = True
+		WriteControl(control)
+
 	if (request.method == 'POST') and (action == 'notify'):
 		response = request.form
 
@@ -768,8 +841,46 @@ def settingspage(action=None):
 			elif(response['pushbullet_publicurl'] != settings['pushbullet']['PublicURL']):
 				settings['pushbullet']['PublicURL'] = response['pushbullet_publicurl']
 
-		event['type'] = 'updated'
-		event['text'] = 'Successfully updated notification settings.'
+		if('mqtt_enabled' in response):
+			if(response['mqtt_enabled'] == 'on'):
+				settings['mqtt']['enabled'] = True
+		else:
+			settings['mqtt']['enabled'] = False
+
+		if('mqtt_commands_enabled' in response):
+			if(response['mqtt_commands_enabled'] == 'on'):
+				settings['mqtt']['commands_enabled'] = True
+		else:
+			settings['mqtt']['commands_enabled'] = False
+
+		if('mqtt_host' in response):
+			if(response['mqtt_host'] != ''):
+				settings['mqtt']['host'] = response['mqtt_host']
+
+		mqtt_port_error = False
+		if('mqtt_port' in response):
+			if(response['mqtt_port'] != ''):
+				if(response['mqtt_port'].strip().isdigit()) and (1 <= int(response['mqtt_port']) <= 65535):
+					settings['mqtt']['port'] = int(response['mqtt_port'])
+				else:
+					mqtt_port_error = True
+
+		if('mqtt_username' in response):
+			settings['mqtt']['username'] = response['mqtt_username']
+
+		if('mqtt_password' in response):
+			settings['mqtt']['password'] = response['mqtt_password']
+
+		if('mqtt_base_topic' in response):
+			if(response['mqtt_base_topic'] != ''):
+				settings['mqtt']['base_topic'] = response['mqtt_base_topic']
+
+		if(mqtt_port_error):
+			event['type'] = 'error'
+			event['text'] = 'The MQTT port must be a number from 1 to 65535, the other notification settings were updated.'
+		else:
+			event['type'] = 'updated'
+			event['text'] = 'Successfully updated notification settings.'
 
 		# Take all settings and write them
 		WriteSettings(settings)
@@ -894,6 +1005,65 @@ def settingspage(action=None):
 
 		WriteSettings(settings)
 
+	if (request.method == 'POST') and (action == 'autotune'):
+		response = request.form
+
+		if('startautotune' in response):
+			if(control['mode'] != 'Smoke') and (control['mode'] != 'Hold'):
+				event['type'] = 'error'
+				event['text'] = 'The grill must be lit and in Smoke or Hold mode to start autotune.'
+			elif('autotunetemp' not in response) or (response['autotunetemp'] == ''):
+				event['type'] = 'error'
+				event['text'] = 'A set point must be entered to start autotune.'
+			else:
+				try:
+					autotunetemp = int(float(response['autotunetemp']))
+					hysteresis = settings['autotune']['hysteresis']
+					cycles = settings['autotune']['cycles']
+					if('autotunehysteresis' in response) and (response['autotunehysteresis'] != ''):
+						hysteresis = float(response['autotunehysteresis'])
+					if('autotunecycles' in response) and (response['autotunecycles'] != ''):
+						cycles = int(response['autotunecycles'])
+				except ValueError:
+					autotunetemp = None
+				if(autotunetemp is None):
+					event['type'] = 'error'
+					event['text'] = 'The autotune set point, hysteresis and cycles must be numbers.'
+				elif(autotunetemp <= 0) or (autotunetemp > settings['safety']['maxtemp']):
+					event['type'] = 'error'
+					event['text'] = 'The autotune set point must be between 0 and the maximum grill temperature (' + str(settings['safety']['maxtemp']) + settings['globals']['units'] + ').'
+				elif(hysteresis <= 0) or (cycles < 1):
+					event['type'] = 'error'
+					event['text'] = 'The autotune hysteresis and cycles must be greater than 0.'
+				else:
+					settings['autotune']['hysteresis'] = hysteresis
+					settings['autotune']['cycles'] = cycles
+					WriteSettings(settings)
+					control['setpoints']['grill'] = autotunetemp
+					control['mode'] = 'Autotune'
+					control['s_plus'] = False
+					control['updated'] = True
+					WriteControl(control)
+					WriteLog('Autotune started at ' + str(autotunetemp) + settings['globals']['units'] + '.')
+					event['type'] = 'updated'
+					event['text'] = 'Autotune started.  The grill temperature will oscillate around the set point while the experiment runs.'
+
+		if('applyautotune' in response):
+			autotune = ReadAutotune()
+			if(autotune['status'] == 'complete'):
+				settings['cycle_data']['PB'] = autotune['PB']
+				settings['cycle_data']['Ti'] = autotune['Ti']
+				settings['cycle_data']['Td'] = autotune['Td']
+				if('center' in autotune) and ('applycenter' in response):
+					settings['cycle_data']['center'] = autotune['center']
+				WriteSettings(settings)
+				WriteLog('Applied autotune results to the cycle settings.')
+				event['type'] = 'updated'
+				event['text'] = 'Successfully applied the autotune results to the cycle settings.'
+			else:
+				event['type'] = 'error'
+				event['text'] = 'No completed autotune results to apply.'
+
 	if (request.method == 'POST') and (action == 'shutdown'):
 		response = request.form
 
@@ -1040,7 +1210,9 @@ def settingspage(action=None):
 				control['units_change'] = True 
 				WriteControl(control)
 
-	return render_template('settings.html', settings=settings, alert=event, page_theme=settings['globals']['page_theme'], grill_name=settings['globals']['grill_name'], pelletdb=pelletdb)
+	autotune = ReadAutotune()
+
+	return render_template('settings.html', settings=settings, alert=event, page_theme=settings['globals']['page_theme'], grill_name=settings['globals']['grill_name'], pelletdb=pelletdb, autotune=autotune)
 
 @app.route('/admin/<action>', methods=['POST','GET'])
 @app.route('/admin', methods=['POST','GET'])
@@ -1198,7 +1370,7 @@ def adminpage(action=None):
 
 	url = request.url_root
 
-	return render_template('admin.html', settings=settings, notify=notify, uptime=uptime, cpuinfo=cpuinfo, temp=temp, ifconfig=ifconfig, debug_mode=debug_mode, qr_content=url, page_theme=settings['globals']['page_theme'], grill_name=settings['globals']['grill_name'], files=files)
+	return render_template('admin.html', settings=settings, notify=notify, uptime=uptime, cpuinfo=cpuinfo, temp=temp, ifconfig=ifconfig, debug_mode=debug_mode, qr_content=url, page_theme=settings['globals']['page_theme'], grill_name=settings['globals']['grill_name'], files=files, relay_stats=ReadRelayStats())
 
 @app.route('/manual/<action>', methods=['POST','GET'])
 @app.route('/manual', methods=['POST','GET'])
@@ -1266,26 +1438,14 @@ def api_page(action=None):
 			control=ReadControl()
 			return jsonify({'control':control}), 201
 		elif(action == 'current'):
-			current=ReadCurrent()
-			#print(current)
-			current_temps = {
-				'grill_temp' : current[0],
-				'probe1_temp' : current[1],
-				'probe2_temp' : current[2]
-			}
-			control=ReadControl()
-			current_setpoints = control['setpoints']
-			pelletdb=ReadPelletDB()
-			status = {}
-			status['mode'] = control['mode']
-			status['status'] = control['status']
-			status['s_plus'] = control['s_plus']
-			status['units'] = settings['globals']['units']
-			status['name'] = settings['globals']['grill_name']
-			status['pelletlevel'] = pelletdb['current']['hopper_level']
-			pelletid = pelletdb['current']['pelletid']
-			status['pellets'] = f'{pelletdb["archive"][pelletid]["brand"]} {pelletdb["archive"][pelletid]["wood"]}'
-			return jsonify({'current':current_temps, 'setpoints':current_setpoints, 'status':status}), 201
+			return versioned_response(['current', 'control', 'pellets', 'settings', 'pellet_model'], api_current, stale_after={'pellet_model' : TIME_TO_EMPTY_MAX_AGE})
+		elif(action == 'autotune'):
+			autotune=ReadAutotune()
+			return jsonify({'autotune':autotune}), 201
+		elif(action == 'i2c'):
+			return jsonify({'i2c':ReadBusStats()}), 201
+		elif(action == 'relays'):
+			return jsonify({'relays':ReadRelayStats()}), 201
 		else:
 			return jsonify({'Error':'Recieved GET request, without valid action'}), 404
 	elif (request.method == 'POST'):
@@ -1344,12 +1504,9 @@ def prepare_data(num_items=10, reduce=True, datapoints=60):
 	data_blob = {}
 
 	data_blob['label_time_list'] = []
-	data_blob['grill_temp_list'] = []
-	data_blob['grill_settemp_list'] = []
-	data_blob['probe1_temp_list'] = []
-	data_blob['probe1_settemp_list'] = []
-	data_blob['probe2_temp_list'] = []
-	data_blob['probe2_settemp_list'] = []
+	# Channel indexed lists (grill, probe 1, probe 2, then any additional probes)
+	data_blob['temp_lists'] = []
+	data_blob['settemp_lists'] = []
 	
 	list_length = len(data_list) # Length of list
 
@@ -1361,39 +1518,152 @@ def prepare_data(num_items=10, reduce=True, datapoints=60):
 	else:
 		step = 1
 
+	if(units == 'F'):
+		convert = int
+	else:
+		convert = float
+
 	if(list_length > 0):
+		# Each history entry is the time, followed by the temperature and set point of each channel
+		channels = max(3, (len(data_list[-1]) - 1) // 2)
+		for channel in range(channels):
+			data_blob['temp_lists'].append([])
+			data_blob['settemp_lists'].append([])
 		# Build all lists from file data
 		for index in range(list_length - num_items, list_length, step):
-			if(units == 'F'):
-				data_blob['label_time_list'].append(data_list[index][0]) 
-				data_blob['grill_temp_list'].append(int(data_list[index][1]))
-				data_blob['grill_settemp_list'].append(int(data_list[index][2]))
-				data_blob['probe1_temp_list'].append(int(data_list[index][3]))
-				data_blob['probe1_settemp_list'].append(int(data_list[index][4]))
-				data_blob['probe2_temp_list'].append(int(data_list[index][5]))
-				data_blob['probe2_settemp_list'].append(int(data_list[index][6]))
-			else: 
-				data_blob['label_time_list'].append(data_list[index][0]) 
-				data_blob['grill_temp_list'].append(float(data_list[index][1]))
-				data_blob['grill_settemp_list'].append(float(data_list[index][2]))
-				data_blob['probe1_temp_list'].append(float(data_list[index][3]))
-				data_blob['probe1_settemp_list'].append(float(data_list[index][4]))
-				data_blob['probe2_temp_list'].append(float(data_list[index][5]))
-				data_blob['probe2_settemp_list'].append(float(data_list[index][6]))
+			entry = data_list[index]
+			data_blob['label_time_list'].append(entry[0]) 
+			for channel in range(channels):
+				if (channel * 2) + 2 < len(entry):
+					data_blob['temp_lists'][channel].append(convert(entry[(channel * 2) + 1]))
+					data_blob['settemp_lists'][channel].append(convert(entry[(channel * 2) + 2]))
+				else:
+					# Channel added after this entry was recorded
+					data_blob['temp_lists'][channel].append(0)
+					data_blob['settemp_lists'][channel].append(0)
 	else:
 		now = datetime.datetime.now()
 		timestr = now.strftime('%H:%M:%S')
-		for index in range(num_items):
-			data_blob['label_time_list'].append(str(timestr)) 
-			data_blob['grill_temp_list'].append(0)
-			data_blob['grill_settemp_list'].append(0)
-			data_blob['probe1_temp_list'].append(0)
-			data_blob['probe1_settemp_list'].append(0)
-			data_blob['probe2_temp_list'].append(0)
-			data_blob['probe2_settemp_list'].append(0)
+		data_blob['label_time_list'] = [str(timestr)] * num_items
+		for channel in range(3):
+			data_blob['temp_lists'].append([0] * num_items)
+			data_blob['settemp_lists'].append([0] * num_items)
 
+	# Grill, probe 1 and probe 2 lists by name
+	data_blob['grill_temp_list'], data_blob['grill_settemp_list'] = data_blob['temp_lists'][0], data_blob['settemp_lists'][0]
+	data_blob['probe1_temp_list'], data_blob['probe1_settemp_list'] = data_blob['temp_lists'][1], data_blob['settemp_lists'][1]
+	data_blob['probe2_temp_list'], data_blob['probe2_settemp_list'] = data_blob['temp_lists'][2], data_blob['settemp_lists'][2]
+
+	return(data_blob)
+
+def history_data(num_items=10, reduce=True, datapoints=60):
+	# prepare_data, shared by concurrent requests for the same history: the first request computes it while the
+	#  others wait for its result, and the result is reused until a new sample is written (the 'current' version
+	#  changes) or HISTORY_CACHE_TTL has passed.  The data blob must not be modified by the caller.
+	global settings
+	key = (num_items, reduce, datapoints, settings['globals']['units'], ReadVersions(['current'])[0][0])
+
+	while True:
+		with history_lock:
+			now = time.time()
+			cached = history_cache.get(key)
+			if (cached is not None) and (cached[0] > now):
+				return(cached[1])
+			done = history_inflight.get(key)
+			if done is None:
+				done = threading.Event()
+				history_inflight[key] = done
+				break
+		done.wait(timeout=10)  # Then use its result, or compute it here if it failed
+
+	try:
+		data_blob = prepare_data(num_items, reduce, datapoints)
+		with history_lock:
+			now = time.time()
+			for expired in [cached_key for cached_key, cached in history_cache.items() if cached[0] <= now]:
+				del history_cache[expired]
+			history_cache[key] = (now + HISTORY_CACHE_TTL, data_blob)
+	finally:
+		with history_lock:
+			del history_inflight[key]
+		done.set()
 	return(data_blob)
 
+def api_current():
+	# /api/current response
+	global settings
+	current=ReadCurrent()
+	#print(current)
+	current_temps = {
+		'grill_temp' : current[0],
+		'probe1_temp' : current[1],
+		'probe2_temp' : current[2]
+	}
+	control=ReadControl()
+	current_setpoints = control['setpoints']
+	pelletdb=ReadPelletDB()
+	status = {}
+	status['mode'] = control['mode']
+	status['status'] = control['status']
+	status['s_plus'] = control['s_plus']
+	status['units'] = settings['globals']['units']
+	status['name'] = settings['globals']['grill_name']
+	status['pelletlevel'] = pelletdb['current']['hopper_level']
+	pelletid = pelletdb['current']['pelletid']
+	status['pellets'] = f'{pelletdb["archive"][pelletid]["brand"]} {pelletdb["archive"][pelletid]["wood"]}'
+	status['time_to_empty'] = time_to_empty()
+	probe_status = ReadProbeStatus()
+	status['probe_status'] = probe_status['status']
+	status['probe_faults'] = probe_status['faults']
+	return jsonify({'current':current_temps, 'temps':current, 'setpoints':current_setpoints, 'status':status}), 201
+
+def refresh_settings():
+	# Reload the settings if they were written (by the control program, or another web worker / process) since this
+	#  process loaded them.  The version is read before the file, so a write in between only causes one more reload.
+	global settings
+	global settings_version
+	version = ReadVersions(['settings'])[0][0]
+	if version != settings_version:
+		settings_version = version
+		settings = ReadSettings()
+
+def versioned_response(names, build, stale_after={}):
+	# Conditional GET: the ETag / Last-Modified headers are made from the version counters of the data
+	#  the response is built from (see PublishUpdate / ReadVersions), so a client with the current
+	#  version gets a 304 without the response being built.  Only the ETag is used for the 304, as
+	#  Last-Modified has a resolution of one second and the data can change several times a second.
+	#  names: data names the response depends on, build: function returning the response
+	#  stale_after: {name : seconds}, the response also changes once the data is older than this
+	versions, modified = ReadVersions(names)
+	now = time.time()
+	etag = '-'.join([str(version) for version in versions]) + '.' + str(int(max(modified) * 1000))
+	last_modified = max(modified)
+	for name, max_age in stale_after.items():
+		time_modified = modified[names.index(name)]
+		if now - time_modified > max_age:
+			etag += '.' + name + '-stale'
+			last_modified = max(last_modified, time_modified + max_age)
+	# Rounded up, so it is never earlier than the change
+	last_modified = datetime.datetime.fromtimestamp(math.ceil(last_modified), tz=datetime.timezone.utc)
+
+	not_modified = bool(request.if_none_match) and request.if_none_match.contains_weak(etag)
+
+	if not_modified:
+		response = make_response('', 304)
+	else:
+		response = make_response(build())
+	response.set_etag(etag, weak=True)
+	response.last_modified = last_modified
+	response.headers['Cache-Control'] = 'no-cache'  # Revalidate on every request
+	return response
+
+def time_to_empty(max_age=TIME_TO_EMPTY_MAX_AGE):
+	# Predicted seconds until the hopper is empty, None if unknown or if the grill is not feeding pellets
+	prediction = ReadPelletModel()
+	if (prediction['time_to_empty'] == None) or (time.time() - prediction['time'] > max_age):
+		return(None)
+	return(prediction['time_to_empty'])
+
 def calc_shh_coefficients(T1, T2, T3, R1, R2, R3):
 	try: 
     	# Convert Temps from Farenheit to Kelvin
@@ -1454,13 +1724,8 @@ def temp_to_tr(tempF, A, B, C):
 
 def tr_to_temp(Tr, a, b, c):
     try:
-        #Steinhart Hart Equation
-        # 1/T = A + B(ln(R)) + C(ln(R))^3
-        # T = 1/(a + b[ln(ohm)] + c[ln(ohm)]^3)
-        lnohm = math.log(Tr) # ln(ohms)
-        t1 = (b*lnohm) # b[ln(ohm)]
-        t2 = c * math.pow(lnohm,3) # c[ln(ohm)]^3
-        tempK = 1/(a + t1 + t2) # calculate temperature in Kelvin
+        #Steinhart Hart Equation (shared with the probe lookup tables)
+        tempK = SteinhartHart(Tr, a, b, c) # calculate temperature in Kelvin
         tempC = tempK - 273.15 # Kelvin to Celsius
         tempF = tempC * (9/5) + 32 # Celsius to Farenheit
     except:
@@ -1485,12 +1750,16 @@ def connect():
 	global clients
 	clients += 1
 	print(clients, 'Client(s) connected')
+	# Every socket gets grill_control_data (as with the broadcast before the delta protocol), until it requests grill_delta_data
+	join_room('grill_full')
 
 @socketio.on("disconnect")
 def disconnect():
 	global thread
 	global clients
 	clients -= 1
+	with delta_lock:
+		delta_sids.discard(request.sid)
 		
 	if(clients == 0):
 		print('All clients disconnected')
@@ -1503,88 +1772,300 @@ def request_grill_data(force=False):
 	if(settings['modules']['grillplat'] == 'prototype'):
 		print('Client requesting grill data')
 
-	global thread
 	global force_refresh
 	force_refresh = force
 
+	# Full grill data on every change (grill_control_data)
+	leave_room('grill_delta')
+	join_room('grill_full')
+	with delta_lock:
+		delta_sids.discard(request.sid)
+	start_grill_data()
+
+@socketio.on('request_grill_delta')
+def request_grill_delta(last_seq=None):
+	# Delta protocol for grill data (grill_delta_data event), for socket clients such as the Android app
+	#  (the WebUI dash polls /dashdata).  The data has the same fields as grill_control_data.
+	#  {'seq' : n, 'full' : True, 'data' : {all fields}} is a full snapshot, which replaces the client's copy
+	#  {'seq' : n, 'full' : False, 'data' : {changed fields}} only has the fields that changed since seq n - 1:
+	#    - an object (i.e. set_points) only has its changed fields, and is merged into the client's object
+	#    - any other value (including lists, i.e. probe_temps) replaces the client's value
+	#    - null means the field was removed, and is deleted from the client's copy
+	#  The client sends request_grill_delta with the last seq it received (none on the first request) when
+	#  it connects or reconnects, or when a delta does not follow on from the last seq (n is not last + 1),
+	#  and gets a full snapshot if it is not up to date.  The client goes back to grill_control_data with
+	#  request_grill_data.
+	global force_refresh
+	leave_room('grill_full')
+	join_room('grill_delta')
+	with delta_lock:
+		delta_sids.add(request.sid)
+		if delta_state['data'] is None:
+			force_refresh = True  # The first delta client, send a snapshot now
+		elif last_seq != delta_state['seq']:
+			emit('grill_delta_data', {'seq' : delta_state['seq'], 'full' : True, 'data' : delta_state['data']})
+	start_grill_data()
+
+def start_grill_data():
+	global thread
+	global grill_data_running
+
 	with thread_lock:
-		if not thread.isAlive():
+		if not grill_data_running:
+			grill_data_running = True
 			thread = socketio.start_background_task(emitGrillData)
 
+def diff_data(old, new):
+	# Returns the fields of new that are different from old (nested dicts are compared field by field),
+	#  and None for the fields that were removed (see request_grill_delta)
+	delta = {}
+	for key in old:
+		if key not in new:
+			delta[key] = None
+	for key, value in new.items():
+		if key not in old:
+			delta[key] = value
+		elif isinstance(value, dict) and isinstance(old[key], dict):
+			nested_delta = diff_data(old[key], value)
+			if nested_delta:
+				delta[key] = nested_delta
+		elif value != old[key]:
+			delta[key] = value
+	return(delta)
+
+def emit_grill_delta(current_data):
+	with delta_lock:
+		if not delta_sids:
+			# No delta clients, the next one gets a full snapshot
+			delta_state['data'] = None
+			return
+		if delta_state['data'] is None:
+			message = {'seq' : delta_state['seq'] + 1, 'full' : True, 'data' : current_data}
+		else:
+			delta = diff_data(delta_state['data'], current_data)
+			if not delta:
+				return
+			message = {'seq' : delta_state['seq'] + 1, 'full' : False, 'data' : delta}
+		delta_state['seq'] = message['seq']
+		delta_state['data'] = current_data
+		socketio.emit('grill_delta_data', message, room='grill_delta')
+
 def emitGrillData():
 	global clients
 	global force_refresh
+	global settings
+	global grill_data_running
 	previous_data = ''
 
-	while (clients > 0):
-		control = ReadControl()
-		global settings
-		pelletdb = ReadPelletDB()
+	# Woken by the update channel (see PublishUpdate in common.py) instead of polling, and only re-reads the data that changed
+	pubsub = None
+	updated = {'control', 'current', 'pellets', 'settings'}
+	timer_end = 0
 
-		global forceupdate
-		
-		probes_enabled = settings['probe_settings']['probes_enabled']
-		
-		cur_probe_temps = []
-		cur_probe_temps = ReadCurrent()
-		
-		current_temps = {
-				'grill_temp' : cur_probe_temps[0],
-				'probe1_temp' : cur_probe_temps[1],
-				'probe2_temp' : cur_probe_temps[2]
-			}
-			
-		enabled_probes = {
-				'grill' : bool(probes_enabled[0]),
-				'probe1' : bool(probes_enabled[1]),
-				'probe2' : bool(probes_enabled[2])
-			}
+	while (clients > 0) or (sse_clients > 0):
+		if pubsub is None:
+			try:
+				pubsub = cmdsts.pubsub(ignore_subscribe_messages=True)
+				pubsub.subscribe(UPDATE_CHANNEL)
+			except:
+				pubsub = None
+				socketio.sleep(2)
+				continue
+			updated = {'control', 'current', 'pellets', 'settings'}  # Changes may have been missed while unsubscribed
+
+		try:
+			message = pubsub.get_message()
+			while message is not None:
+				if message['data'] in ['control', 'current', 'pellets', 'settings']:
+					updated.add(message['data'])
+				message = pubsub.get_message()
+		except:
+			# Lost the Redis connection, subscribe again
+			pubsub = None
+			socketio.sleep(2)
+			continue
 
 		now = time.time()
+		if (timer_end > 0) and (now >= timer_end):
+			updated.add('timer')  # Timer has run out
+			timer_end = 0
+
+		if (not updated) and (not force_refresh):
+			socketio.sleep(0.1)
+			continue
+
+		if 'settings' in updated:
+			refresh_settings()
+		if 'control' in updated:
+			control = ReadControl()
+		if 'pellets' in updated:
+			pelletdb = ReadPelletDB()
+		if 'current' in updated:
+			cur_probe_temps = ReadCurrent()
+			probe_status = ReadProbeStatus()['status']
+		updated = set()
+
+		current_data = grill_data(control, pelletdb, cur_probe_temps, probe_status, now)
+		if (control['timer']['end'] > now) and (not control['timer']['paused']):
+			timer_end = control['timer']['end']
 
-		if(control['timer']['end'] - now > 0 or bool(control['timer']['paused'])):
-			timer_info = {
-				'timer_paused' : bool(control['timer']['paused']),
-				'timer_start_time' : math.trunc(control['timer']['start']),
-				'timer_end_time' : math.trunc(control['timer']['end']),
-				'timer_paused_time' : math.trunc(control['timer']['paused']),
-				'timer_active' : 'true'
-			}
-		else:
-			timer_info = {
-				'timer_paused' : 'false',
-				'timer_start_time' : '0',
-				'timer_end_time' : '0',
-				'timer_paused_time' : '0',
-				'timer_active' : 'false'
-			}
-        
-		current_data = { 
-			'cur_probe_temps' : current_temps, 
-			'probes_enabled' : enabled_probes, 
-			'set_points' : control['setpoints'], 
-			'notify_req' : control['notify_req'],
-			'notify_data' : control['notify_data'],
-			'timer_info' : timer_info, 
-			'current_mode' : control['mode'], 
-			'smoke_plus' : control['s_plus'], 
-			'hopper_level' : pelletdb['current']['hopper_level']
-			}
-		
 		if(force_refresh):
 			if(settings['modules']['grillplat'] == 'prototype'):
 				print('Sending forced grill data')
-			socketio.emit('grill_control_data', current_data, broadcast=True)
+			socketio.emit('grill_control_data', current_data, room='grill_full')
 			force_refresh=False
-			socketio.sleep(2)
 		elif(previous_data != current_data):
 			if(settings['modules']['grillplat'] == 'prototype'):
 				print('Sending updated grill data')
-			socketio.emit('grill_control_data', current_data, broadcast=True)
-			previous_data = current_data
-			socketio.sleep(2)
-		else:
-			socketio.sleep(2)
+			socketio.emit('grill_control_data', current_data, room='grill_full')
+		emit_grill_delta(current_data)
+		if(previous_data != current_data):
+			publish_sse_events(current_data)
+		previous_data = current_data
+		socketio.sleep(0.1)
+
+	if pubsub is not None:
+		pubsub.close()
+	with thread_lock:
+		grill_data_running = False
+
+def grill_data(control, pelletdb, cur_probe_temps, probe_status, now):
+	global settings
+
+	probes_enabled = settings['probe_settings']['probes_enabled']
+
+	current_temps = {
+			'grill_temp' : cur_probe_temps[0],
+			'probe1_temp' : cur_probe_temps[1],
+			'probe2_temp' : cur_probe_temps[2]
+		}
+
+	enabled_probes = {
+			'grill' : bool(probes_enabled[0]),
+			'probe1' : bool(probes_enabled[1]),
+			'probe2' : bool(probes_enabled[2])
+		}
+
+	if(control['timer']['end'] - now > 0 or bool(control['timer']['paused'])):
+		timer_info = {
+			'timer_paused' : bool(control['timer']['paused']),
+			'timer_start_time' : math.trunc(control['timer']['start']),
+			'timer_end_time' : math.trunc(control['timer']['end']),
+			'timer_paused_time' : math.trunc(control['timer']['paused']),
+			'timer_active' : 'true'
+		}
+	else:
+		timer_info = {
+			'timer_paused' : 'false',
+			'timer_start_time' : '0',
+			'timer_end_time' : '0',
+			'timer_paused_time' : '0',
+			'timer_active' : 'false'
+		}
+
+	current_data = { 
+		'cur_probe_temps' : current_temps, 
+		'probe_temps' : cur_probe_temps, 
+		'probes_enabled' : enabled_probes, 
+		'set_points' : control['setpoints'], 
+		'notify_req' : control['notify_req'],
+		'notify_data' : control['notify_data'],
+		'timer_info' : timer_info, 
+		'current_mode' : control['mode'], 
+		'smoke_plus' : control['s_plus'], 
+		'hopper_level' : pelletdb['current']['hopper_level'],
+		'probe_status' : probe_status
+		}
+	return(current_data)
+
+def sse_events(old, new):
+	# Returns the (event, data) Server-Sent Events for the changes between two grill_data() structures (old is '' for all events)
+	events = []
+	if (not old) or (old['probe_temps'] != new['probe_temps']) or (old['probe_status'] != new['probe_status']):
+		events.append(('temps', {'temps' : new['probe_temps'], 'probe_status' : new['probe_status']}))
+	if (not old) or (old['set_points'] != new['set_points']):
+		events.append(('setpoints', new['set_points']))
+	if (not old) or (old['current_mode'] != new['current_mode']) or (old['smoke_plus'] != new['smoke_plus']):
+		events.append(('mode', {'mode' : new['current_mode'], 'smoke_plus' : new['smoke_plus']}))
+	if (not old) or (old['hopper_level'] != new['hopper_level']):
+		events.append(('hopper', {'hopper_level' : new['hopper_level']}))
+	return(events)
+
+def publish_sse_events(current_data):
+	# Add the grill events which changed to the Redis stream read by the /stream connections.  The changes are
+	#  found against the last events in the stream (SSE_STATE), not what this worker sent before, so each change
+	#  is added once whichever worker sees it first, and changes made while no one was connected are added later.
+	events = [(event, json.dumps(data)) for event, data in sse_events('', current_data)]
+	with cmdsts.pipeline() as pipe:
+		while True:
+			try:
+				pipe.watch(SSE_STATE)
+				last = pipe.hgetall(SSE_STATE)
+				changed = [(event, data) for event, data in events if last.get(event) != data]
+				if not changed:
+					pipe.unwatch()
+					return
+				pipe.multi()
+				for event, data in changed:
+					pipe.xadd(SSE_STREAM, {'event' : event, 'data' : data}, maxlen=SSE_BACKLOG, approximate=True)
+				pipe.hset(SSE_STATE, mapping=dict(changed))
+				pipe.execute()
+				return
+			except redis.WatchError:
+				continue  # Another worker added events at the same time, compare again
+
+def stream_id(event_id):
+	# Redis stream id as a comparable tuple
+	try:
+		milliseconds, sequence = event_id.split('-')
+		return((int(milliseconds), int(sequence)))
+	except:
+		return(None)
+
+@app.route('/stream')
+def stream():
+	# Server-Sent Events: temps, setpoints, mode and hopper events as they change.  A reconnecting client
+	#  sends Last-Event-ID, and gets the events it missed (or a new snapshot if they are no longer in the backlog).
+	#  The stream is brought up to date first, as events are only added while the web server has clients.
+	last_event_id = request.headers.get('Last-Event-ID', '')
+
+	def generate():
+		global sse_clients
+		sse_clients += 1
+		start_grill_data()
+		try:
+			yield 'retry: 3000\n\n'
+
+			current_data = grill_data(ReadControl(), ReadPelletDB(), ReadCurrent(), ReadProbeStatus()['status'], time.time())
+			publish_sse_events(current_data)  # Add any changes made while no one was connected
+
+			first = cmdsts.xrange(SSE_STREAM, count=1)
+			latest = cmdsts.xrevrange(SSE_STREAM, count=1)
+			last_id = latest[0][0] if latest else '0-0'
+			resume_id = stream_id(last_event_id)
+			if (resume_id is not None) and first and (resume_id >= stream_id(first[0][0])):
+				# Replay the events after Last-Event-ID
+				last_id = last_event_id
+			else:
+				# New client, or the missed events are no longer in the backlog: send the current state
+				for event, data in sse_events('', current_data):
+					yield 'id: ' + last_id + '\nevent: ' + event + '\ndata: ' + json.dumps(data) + '\n\n'
+
+			while True:
+				response = cmdsts.xread({SSE_STREAM : last_id}, count=100, block=15000)
+				if not response:
+					yield ': keepalive\n\n'
+					continue
+				for event_id, fields in response[0][1]:
+					last_id = event_id
+					yield 'id: ' + event_id + '\nevent: ' + fields['event'] + '\ndata: ' + fields['data'] + '\n\n'
+		finally:
+			sse_clients -= 1
+
+	response = app.response_class(generate(), mimetype='text/event-stream')
+	response.headers['Cache-Control'] = 'no-cache'
+	response.headers['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+	return response
 
 @socketio.on('request_pellet_data')
 def request_pellet_data():
@@ -1599,15 +2080,16 @@ def request_pellet_data():
 @socketio.on('request_history_data')
 def request_history_data():
 	global settings
+	refresh_settings()
 
 	if(settings['modules']['grillplat'] == 'prototype'):
 		print('Client requesting history data')
 
 	data_blob = {}
 	num_items = settings['history_page']['minutes'] * 20
-	data_blob = prepare_data(num_items, True, settings['history_page']['datapoints'])
+	data_blob = history_data(num_items, True, settings['history_page']['datapoints'])
 
-	return ({ 'grill_temp_list' : data_blob['grill_temp_list'], 'grill_settemp_list' : data_blob['grill_settemp_list'], 'probe1_temp_list' : data_blob['probe1_temp_list'], 'probe1_settemp_list' : data_blob['probe1_settemp_list'], 'probe2_temp_list' : data_blob['probe2_temp_list'], 'probe2_settemp_list' : data_blob['probe2_settemp_list'], 'label_time_list' : data_blob['label_time_list'] })
+	return ({ 'grill_temp_list' : data_blob['grill_temp_list'], 'grill_settemp_list' : data_blob['grill_settemp_list'], 'probe1_temp_list' : data_blob['probe1_temp_list'], 'probe1_settemp_list' : data_blob['probe1_settemp_list'], 'probe2_temp_list' : data_blob['probe2_temp_list'], 'probe2_settemp_list' : data_blob['probe2_settemp_list'], 'label_time_list' : data_blob['label_time_list'], 'temp_lists' : data_blob['temp_lists'], 'settemp_lists' : data_blob['settemp_lists'] })
 
 @socketio.on('request_event_data')
 def request_event_data():
@@ -1627,6 +2109,7 @@ def request_event_data():
 @socketio.on('request_settings_data')
 def request_settings_data():
 	global settings
+	refresh_settings()
 
 	if(settings['modules']['grillplat'] == 'prototype'):
 		print('Client requesting settings data')
@@ -2399,7 +2882,7 @@ def update_manual_data(json_data):
 
 		WriteControl(control)
 
-settings = ReadSettings()
+refresh_settings()
 
 if __name__ == '__main__':
 	if(settings['modules']['grillplat'] == 'prototype'):
@@ -73,13 +73,13 @@ echo "**                                                                     **"
 echo "*************************************************************************"
 $SUDO apt install python3-dev python3-pip python3-rpi.gpio python3-pil libfreetype6-dev libjpeg-dev build-essential libopenjp2-7 libtiff5 nginx git gunicorn3 supervisor ttf-mscorefonts-installer redis-server -y
 $SUDO pip3 install flask
-$SUDO pip3 install pushbullet.py
 $SUDO pip3 install flask_qrcode
 $SUDO pip3 install flask-socketio
 $SUDO pip3 install eventlet==0.30.2
 $SUDO pip3 install gpiozero
 $SUDO pip3 install redis
 $SUDO pip3 install uuid
+$SUDO pip3 install paho-mqtt
 
 # Grab project files
 clear
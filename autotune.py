@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire PID Autotune
+# *****************************************
+#
+# Description: This object runs a relay feedback experiment (Astrom-Hagglund)
+#  on the grill to estimate the PID parameters used in Hold mode.
+#
+#  Instead of the PID output, the auger duty cycle (CycleRatio) is switched
+#  between u_max and u_min whenever the grill temperature crosses the set
+#  point (with a small hysteresis band to reject probe noise).  This causes
+#  the grill temperature to oscillate around the set point.  Once a few
+#  steady oscillations have been recorded, the ultimate gain and period are
+#  calculated from the relay amplitude (d), the oscillation amplitude (a) and
+#  the oscillation period (Tu):
+#
+#   Ku = 4d / (pi * sqrt(a^2 - hysteresis^2))
+#
+#  and the Ziegler-Nichols PID rules are applied to get the parameters in the
+#  proportional band form used by pid.py:
+#
+#   Kp = 0.6 Ku,  PB = 1 / Kp,  Ti = Tu / 2,  Td = Tu / 8
+#
+#  The average duty cycle during the experiment is also proposed as the new
+#  center value, since it is the duty cycle needed to hold the set point.
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import math
+
+# *****************************************
+# Class Definition
+# *****************************************
+class RelayAutotune:
+	def __init__(self, setPoint, u_min, u_max, hysteresis=2.0, cycles=4, timeout=7200):
+		# setPoint: Grill temperature to oscillate around
+		# u_min / u_max: Relay output levels (auger duty cycle)
+		# hysteresis: Temperature band around the set point before the relay switches
+		# cycles: Number of oscillation periods to measure (an extra first period is discarded)
+		# timeout: Maximum duration of the experiment in seconds
+		self.setPoint = setPoint
+		self.u_min = u_min
+		self.u_max = u_max
+		self.hysteresis = hysteresis
+		self.cycles = cycles
+		self.timeout = timeout
+
+		self.status = 'running'  # running, complete, failed
+		self.message = ''
+		self.output = u_max  # Start by heating up towards the set point
+		self.starttime = None
+
+		self.switchtimes = []  # Times when the relay switched from u_max to u_min (upward crossings)
+		self.peaks = []  # Maximum temperature of each period
+		self.troughs = []  # Minimum temperature of each period
+		self.peak = None
+		self.trough = None
+		self.lastsample = None
+		self.dutyintegral = 0.0
+		self.dutytime = 0.0
+
+	def sample(self, Current, now):
+		# Record a grill temperature sample, and switch the relay when the hysteresis band is crossed
+		if self.status != 'running':
+			return self.status
+
+		if self.starttime is None:
+			self.starttime = now
+		elif now - self.starttime > self.timeout:
+			self.status = 'failed'
+			self.message = 'Timed out before ' + str(self.cycles) + ' steady oscillations were measured.'
+			return self.status
+
+		# Integrate the relay output over the measured periods for the center estimate
+		if (self.lastsample is not None) and (len(self.switchtimes) > 1):
+			self.dutyintegral += self.output * (now - self.lastsample)
+			self.dutytime += now - self.lastsample
+		self.lastsample = now
+
+		# Track the extremes of the current half period
+		if self.output == self.u_min:
+			self.peak = Current if self.peak is None else max(self.peak, Current)
+		else:
+			self.trough = Current if self.trough is None else min(self.trough, Current)
+
+		if (self.output == self.u_max) and (Current > self.setPoint + self.hysteresis):
+			self.output = self.u_min
+			self.switchtimes.append(now)
+			if (self.peak is not None) and (self.trough is not None):
+				self.peaks.append(self.peak)
+				self.troughs.append(self.trough)
+			self.peak = None
+			self.trough = None
+		elif (self.output == self.u_min) and (Current < self.setPoint - self.hysteresis):
+			self.output = self.u_max
+
+		# The first switch ends the warm up, so one extra period is required
+		if len(self.switchtimes) > self.cycles + 1:
+			self.status = 'complete'
+
+		return self.status
+
+	def getOutput(self):
+		return self.output
+
+	def getResults(self):
+		# Returns the measured oscillation and the proposed PID parameters
+		results = {
+			'status' : self.status,
+			'message' : self.message,
+			'setpoint' : self.setPoint,
+			'cycles' : max(len(self.switchtimes) - 2, 0),
+			'target_cycles' : self.cycles
+		}
+
+		if self.status != 'complete':
+			return results
+
+		# Discard the first period, which starts from the warm up
+		periods = [self.switchtimes[i + 1] - self.switchtimes[i] for i in range(1, len(self.switchtimes) - 1)]
+		peaks = self.peaks[1:]
+		troughs = self.troughs[1:]
+		if (len(periods) == 0) or (len(peaks) == 0) or (len(troughs) == 0):
+			results['status'] = 'failed'
+			results['message'] = 'Not enough oscillation data was recorded.'
+			return results
+
+		Tu = sum(periods) / len(periods)
+		a = (sum(peaks) / len(peaks) - sum(troughs) / len(troughs)) / 2
+		d = (self.u_max - self.u_min) / 2
+
+		if a <= self.hysteresis:
+			results['status'] = 'failed'
+			results['message'] = 'The oscillation amplitude was too small to measure.'
+			return results
+
+		Ku = (4 * d) / (math.pi * math.sqrt(a ** 2 - self.hysteresis ** 2))
+		Kp = 0.6 * Ku
+
+		results['Tu'] = round(Tu, 1)
+		results['amplitude'] = round(a, 2)
+		results['Ku'] = round(Ku, 5)
+		results['PB'] = round(1 / Kp, 1)
+		results['Ti'] = round(Tu / 2, 1)
+		results['Td'] = round(Tu / 8, 1)
+		if self.dutytime > 0:
+			results['center'] = round(self.dutyintegral / self.dutytime, 2)
+
+		return results
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Control Benchmark
+# *****************************************
+#
+# Description: This script runs the control program work cycles (Startup,
+#  Smoke, Hold, etc.) against the simulated grill (adc_simulator) on a
+#  simulated clock, through a set of standard cook scenarios, and reports
+#  control quality metrics for each scenario:
+#
+#   * overshoot - Maximum temperature above the set point
+#   * settling - Time until the temperature stays within the settling band
+#   * rms_error - RMS error between the chamber temperature and set point
+#   * max_deviation - Maximum absolute error from the set point
+#   * pellets - Pellets burned over the whole run (grams)
+#   * auger_duty - Auger on-time ratio over the measurement window
+#
+#  Results can be stored as a baseline, and later runs are compared against
+#  the baseline so that changes in controller behavior show up as numbers.
+#
+#  The benchmark runs in a scratch directory (for settings.json and
+#  pelletdb.json) and on a separate Redis database, so it does not disturb
+#  a running PiFire instance.
+#
+# Usage:
+#
+#  $ python3 benchmark.py                   # Run all scenarios and compare to the baseline
+#  $ python3 benchmark.py -s lid_open       # Run a single scenario
+#  $ python3 benchmark.py --save            # Run and store the results as the new baseline
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import os
+import sys
+import json
+import math
+import shutil
+import argparse
+import tempfile
+import contextlib
+import redis
+import common
+from common import DefaultSettings, WriteSettings, ReadControl, WriteControl, ReadHistory
+from clock import SimulatedClock
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+START_TIME = 1600000000.0  # Fixed epoch start time for repeatable runs
+
+SETTLING_BAND = 10  # Settling band around the set point (F)
+
+# Scenario events are (time in seconds, action, value)
+#  'startup' - Start the grill (Startup mode, followed by Smoke mode)
+#  'hold' - Hold mode at the set point (F)
+#  'autotune' - Autotune mode at the set point (F)
+#  'lid' - Open (True) or close (False) the lid
+#  'ambient' - Change the ambient temperature (C)
+#  'hopper' - Set the pellets remaining in the hopper (g)
+SCENARIOS = {
+	'cold_start_225' : {
+		'description' : 'Cold start, then Hold at 225F',
+		'duration' : 7200,
+		'metrics_start' : 300,
+		'setpoint' : 225,
+		'events' : [(0, 'startup', None), (300, 'hold', 225)]
+	},
+	'setpoint_step_350' : {
+		'description' : 'Hold at 225F, then a set point step to 350F',
+		'duration' : 8100,
+		'metrics_start' : 3600,
+		'setpoint' : 350,
+		'events' : [(0, 'startup', None), (300, 'hold', 225), (3600, 'hold', 350)]
+	},
+	'lid_open' : {
+		'description' : 'Hold at 225F, lid opened for two minutes',
+		'duration' : 7200,
+		'metrics_start' : 3600,
+		'setpoint' : 225,
+		'events' : [(0, 'startup', None), (300, 'hold', 225), (3600, 'lid', True), (3720, 'lid', False)]
+	},
+	'low_pellets' : {
+		'description' : 'Hold at 225F while the hopper runs empty',
+		'duration' : 7200,
+		'metrics_start' : 300,
+		'setpoint' : 225,
+		'events' : [(0, 'startup', None), (0, 'hopper', 1000), (300, 'hold', 225)]
+	},
+	'ambient_drop' : {
+		'description' : 'Hold at 225F, ambient temperature drops from 20C to -5C',
+		'duration' : 7200,
+		'metrics_start' : 3600,
+		'setpoint' : 225,
+		'events' : [(0, 'startup', None), (300, 'hold', 225), (3600, 'ambient', -5.0)]
+	}
+}
+
+# Metrics compared against the baseline (lower is better for all of them)
+METRICS = ['overshoot', 'settling', 'rms_error', 'max_deviation', 'pellets', 'auger_duty']
+
+control = None  # The control module, imported once the environment has been setup
+
+# *****************************************
+# Function Definitions
+# *****************************************
+
+def SetupEnvironment(workdir, redis_db=15):
+	# *****************************************
+	# Move to a scratch directory, point the common library at a separate
+	# Redis database and import the control program functions.
+	# *****************************************
+	global control
+
+	os.chdir(workdir)
+
+	common.cmdsts = redis.StrictRedis('localhost', 6379, db=redis_db, charset="utf-8", decode_responses=True)
+	common.cmdsts.flushdb()
+
+	WriteSettings(BenchmarkSettings())
+
+	if control is None:
+		import control as control_module
+		control = control_module
+
+def BenchmarkSettings(cycle_data=None):
+	settings = DefaultSettings()
+	settings['modules'] = {
+		'grillplat' : 'prototype',
+		'adc' : 'simulator',
+		'display' : 'prototype',
+		'dist' : 'prototype'
+	}
+	settings['globals']['units'] = 'F'
+	settings['globals']['debug_mode'] = False
+	settings['history_page']['clearhistoryonstart'] = False
+	settings['pelletlevel']['warning_enabled'] = False
+	if cycle_data is not None:
+		settings['cycle_data'].update(cycle_data)
+	return settings
+
+def SetMode(mode, setpoint=None):
+	control_data = ReadControl()
+	control_data['updated'] = True
+	control_data['mode'] = mode
+	if setpoint is not None:
+		control_data['setpoints']['grill'] = setpoint
+	WriteControl(control_data)
+
+def RunScenario(name, cycle_data=None, seed=0):
+	# *****************************************
+	# Run a single scenario and return the metrics.
+	#  cycle_data: Optional overrides for settings['cycle_data']
+	# *****************************************
+	from grillplat_prototype import GrillPlatform
+	from adc_simulator import ReadADC
+	from display_prototype import Display
+	from distance_prototype import HopperLevel
+	from hopper_sampler import HopperSampler
+
+	scenario = SCENARIOS[name]
+
+	settings = BenchmarkSettings(cycle_data)
+	WriteSettings(settings)
+
+	clock = SimulatedClock(start=START_TIME)
+	control.clock = clock
+
+	probe_profiles = settings['probe_settings']['probe_profiles']
+	grill_platform = GrillPlatform(dict(settings['outpins']), dict(settings['inpins']), settings['globals']['triggerlevel'], clock=clock)
+	adc_device = ReadADC(probe_profiles[settings['probe_types']['grill0type']], probe_profiles[settings['probe_types']['probe1type']], probe_profiles[settings['probe_types']['probe2type']], units='F', grill_platform=grill_platform, clock=clock, seed=seed)
+	model = adc_device.model
+	dist_device = HopperSampler(HopperLevel(settings['pelletlevel']['empty'], settings['pelletlevel']['full']), clock=clock)
+
+	ReadControl(flush=True)
+	ReadHistory(0, flushhistory=True)
+
+	end_time = START_TIME + scenario['duration']
+	metrics_start = START_TIME + scenario['metrics_start']
+
+	# Scripted scenario events
+	def ScheduleEvent(event_time, action, value):
+		def Event():
+			if action == 'startup':
+				SetMode('Startup')
+			elif action == 'hold':
+				SetMode('Hold', setpoint=value)
+			elif action == 'autotune':
+				SetMode('Autotune', setpoint=value)
+			elif action == 'lid':
+				adc_device.Update()
+				model.lid_open = value
+			elif action == 'ambient':
+				adc_device.Update()
+				model.ambient = value
+			elif action == 'hopper':
+				model.hopper_mass = value
+		clock.CallAt(event_time, Event)
+
+	for event_time, action, value in scenario['events']:
+		ScheduleEvent(START_TIME + event_time, action, value)
+
+	clock.CallAt(end_time, lambda: SetMode('Stop'))
+
+	# Sample the chamber temperature every 5 seconds of the measurement window
+	samples = []
+	window = {}
+	def Sample():
+		adc_device.Update()
+		if 'auger_on_time' not in window:
+			window['auger_on_time'] = model.auger_on_time
+		samples.append((clock.time() - metrics_start, (model.chamber_temp * (9/5)) + 32))
+		if clock.time() + 5 <= end_time:
+			clock.CallLater(5, Sample)
+	clock.CallAt(metrics_start, Sample)
+
+	# Mode dispatch (a subset of the control program main loop)
+	with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+		display_device = Display(units='F')
+		while clock.time() < end_time:
+			control_data = ReadControl()
+			if control_data['updated'] == True:
+				control_data['updated'] = False
+				control_data['status'] = 'active'
+				WriteControl(control_data)
+				mode = control_data['mode']
+				if mode == 'Startup':
+					control.WorkCycle('Startup', grill_platform, adc_device, display_device, dist_device)
+					control_data = ReadControl()
+					if control_data['mode'] == 'Startup':
+						control_data['mode'] = 'Smoke'
+						WriteControl(control_data)
+						control.WorkCycle('Smoke', grill_platform, adc_device, display_device, dist_device)
+				elif mode == 'Reignite':
+					control.WorkCycle('Reignite', grill_platform, adc_device, display_device, dist_device)
+					control_data = ReadControl()
+					if control_data['safety']['reignitelaststate'] in ['Hold', 'Autotune']:
+						control_data['mode'] = 'Hold'
+					else:
+						control_data['mode'] = 'Smoke'
+					WriteControl(control_data)
+					control.WorkCycle(control_data['mode'], grill_platform, adc_device, display_device, dist_device)
+				elif mode in ['Smoke', 'Hold', 'Autotune', 'Shutdown']:
+					control.WorkCycle(mode, grill_platform, adc_device, display_device, dist_device)
+				else:
+					grill_platform.AugerOff()
+					grill_platform.IgniterOff()
+					grill_platform.FanOff()
+			clock.sleep(0.1)
+
+	dist_device.Stop()
+
+	results = ComputeMetrics(samples, scenario['setpoint'], scenario['duration'] - scenario['metrics_start'])
+	results['pellets'] = round(model.pellets_burned, 1)
+	if 'auger_on_time' in window:
+		results['auger_duty'] = round((model.auger_on_time - window['auger_on_time']) / (scenario['duration'] - scenario['metrics_start']), 3)
+	results['final_mode'] = ReadControl()['mode']
+	return results
+
+def ComputeMetrics(samples, setpoint, window_length):
+	results = {}
+	if len(samples) == 0:
+		return results
+
+	errors = [temp - setpoint for (elapsed, temp) in samples]
+
+	results['overshoot'] = round(max(max(errors), 0), 1)
+	results['max_deviation'] = round(max([abs(error) for error in errors]), 1)
+	results['rms_error'] = round(math.sqrt(sum([error * error for error in errors]) / len(errors)), 2)
+
+	# Settling time is the time after which the temperature stays within the band
+	settling = 0
+	for elapsed, temp in samples:
+		if abs(temp - setpoint) > SETTLING_BAND:
+			settling = elapsed
+	if settling >= samples[-1][0]:
+		settling = window_length  # Never settled
+	results['settling'] = round(settling)
+
+	return results
+
+def ReadBaseline():
+	try:
+		with open(BASELINE_FILE, 'r') as baseline_file:
+			baseline = json.loads(baseline_file.read())
+	except(IOError, OSError, ValueError):
+		baseline = {}
+	return baseline
+
+def WriteBaseline(baseline):
+	with open(BASELINE_FILE, 'w') as baseline_file:
+		baseline_file.write(json.dumps(baseline, indent=2, sort_keys=True))
+
+def CompareResults(results, baseline, tolerance=0.05):
+	# *****************************************
+	# Print a table of results vs. the baseline.  Returns the list of
+	# (scenario, metric) that got worse by more than the tolerance.
+	# *****************************************
+	regressions = []
+	print(f"\n{'Scenario':<20}{'Metric':<16}{'Result':>12}{'Baseline':>12}{'Change':>10}")
+	print('-' * 70)
+	for name in results:
+		for metric in METRICS + ['final_mode']:
+			value = results[name].get(metric)
+			base = baseline.get(name, {}).get(metric)
+			change = ''
+			if isinstance(value, (int, float)) and isinstance(base, (int, float)):
+				delta = value - base
+				change = f'{delta:+.2f}'
+				if delta > max(abs(base) * tolerance, 0.5 if metric != 'auger_duty' else 0.01):
+					regressions.append((name, metric))
+					change += ' *'
+			elif (base is not None) and (value != base):
+				regressions.append((name, metric))
+				change = '*'
+			print(f"{name:<20}{metric:<16}{str(value):>12}{str(base):>12}{change:>10}")
+	return regressions
+
+#==============================================================================
+#                                   Main Program
+#==============================================================================
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Run control quality benchmarks against the simulated grill.')
+	parser.add_argument('-s','--scenario',type=str, action='append', help='Scenario to run (may be repeated).  Default is all scenarios: ' + ', '.join(SCENARIOS.keys()),required=False)
+	parser.add_argument('-S','--save', action='store_true', help='Store the results as the new baseline.',required=False)
+	parser.add_argument('-d','--redisdb',type=int, default=15, help='Redis database number to use for the benchmark (default 15).',required=False)
+	parser.add_argument('-r','--seed',type=int, default=0, help='Random seed for the simulated probe noise.',required=False)
+	args = parser.parse_args()
+
+	scenarios = args.scenario if args.scenario else list(SCENARIOS.keys())
+	for name in scenarios:
+		if name not in SCENARIOS:
+			print(f'Unknown scenario: {name}')
+			sys.exit(2)
+
+	workdir = tempfile.mkdtemp(prefix='pifire_benchmark_')
+	SetupEnvironment(workdir, redis_db=args.redisdb)
+
+	results = {}
+	try:
+		for name in scenarios:
+			print(f'Running {name}: {SCENARIOS[name]["description"]}')
+			results[name] = RunScenario(name, seed=args.seed)
+	finally:
+		common.cmdsts.flushdb()
+		shutil.rmtree(workdir, ignore_errors=True)
+
+	baseline = ReadBaseline()
+	regressions = CompareResults(results, baseline)
+
+	if args.save:
+		baseline.update(results)
+		WriteBaseline(baseline)
+		print('\nBaseline saved to ' + BASELINE_FILE)
+	elif len(regressions) > 0:
+		print(f'\n{len(regressions)} metric(s) regressed vs. the baseline (marked with *).')
+		sys.exit(1)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Clock Library
+# *****************************************
+#
+# Description: This library provides the time source used by the control
+#  program.  SystemClock is a thin wrapper around the time module, and is
+#  used in normal operation.  SimulatedClock keeps its own virtual time which
+#  only advances when sleep() is called, so that a prototype / simulated cook
+#  can be run many times faster than real time.
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import time
+import heapq
+
+class SystemClock:
+
+	def time(self):
+		return time.time()
+
+	def sleep(self, seconds):
+		time.sleep(seconds)
+
+class SimulatedClock:
+
+	def __init__(self, start=None, speed=0):
+		# start: Virtual start time in epoch seconds (defaults to now, so that timer values from the WebUI still make sense)
+		# speed: Simulation speed multiplier (i.e. 100 = 100x real time).  0 runs as fast as possible.
+		if start is None:
+			start = time.time()
+		self.now = start
+		self.speed = speed
+		self.events = []  # Heap of (time, sequence, callback) for scheduled events
+		self.sequence = 0
+
+	def time(self):
+		return self.now
+
+	def sleep(self, seconds):
+		target = self.now + max(seconds, 0)
+
+		# Run any scheduled events that fall within this sleep period, in order
+		while (len(self.events) > 0) and (self.events[0][0] <= target):
+			event_time, sequence, callback = heapq.heappop(self.events)
+			self.now = max(self.now, event_time)
+			callback()
+
+		self.now = target
+
+		if self.speed > 0:
+			time.sleep(seconds / self.speed)
+
+	def CallAt(self, event_time, callback):
+		# Schedule callback() to be run when virtual time reaches event_time
+		heapq.heappush(self.events, (event_time, self.sequence, callback))
+		self.sequence += 1
+
+	def CallLater(self, delay, callback):
+		self.CallAt(self.now + delay, callback)
@@ -21,6 +21,7 @@ import redis
 import uuid
 import random
 from uuid import getnode
+from temp_filter import DefaultFilterSettings
 
 # *****************************************
 # Functions
@@ -28,6 +29,10 @@ from uuid import getnode
 
 cmdsts = redis.StrictRedis('localhost', 6379, charset="utf-8", decode_responses=True)  # Setup Command / Status database connection
 
+UPDATE_CHANNEL = 'control:updates'  # Redis pub/sub channel, announces which data changed (see PublishUpdate)
+VERSIONS_KEY = 'control:versions'  # Version counter of each data name, incremented on every write
+MODIFIED_KEY = 'control:modified'  # Time of the last write of each data name
+
 def DefaultSettings():
 	settings = {}
 
@@ -44,7 +49,8 @@ def DefaultSettings():
 
 	settings['probe_settings'] = {
 		'probe_profiles' :  DefaultProbeProfiles(),
-		'probes_enabled' : [1,1,1]
+		'probes_enabled' : [1,1,1],
+		'probe_filters' : [DefaultFilterSettings() for index in range(3)] # Filter for the grill probe, probe 1 and probe 2 (see temp_filter.py)
 	}
 
 	settings['globals'] = {
@@ -82,10 +88,23 @@ def DefaultSettings():
 		'ServerUrl' : ''
 	}
 
+	settings['mqtt'] = {
+		'enabled': False,
+		'host' : 'localhost',
+		'port' : 1883,
+		'username' : '',
+		'password' : '',
+		'base_topic' : 'pifire',
+		'temp_deadband' : 1.0,  # Minimum temperature change to publish
+		'hopper_deadband' : 2,  # Minimum hopper level change (%) to publish
+		'commands_enabled' : False  # Accept mode / set point commands on <base_topic>/command/...
+	}
+
 	settings['probe_types'] = {
 		'grill0type' : 'PT-1000-OEM',
 		'probe1type' : 'TWPS00',
-		'probe2type' : 'TWPS00'
+		'probe2type' : 'TWPS00',
+		'aux_types' : [] # Profiles of any additional probe channels (Probe 3, Probe 4, ...)
 	}
 
 	settings['outpins'] = {
@@ -115,6 +134,13 @@ def DefaultSettings():
 		'center' : 0.5
 	}
 
+	# Relay feedback autotune experiment (see autotune.py)
+	settings['autotune'] = {
+		'hysteresis' : 2.0, # Temperature band around the setpoint before the relay switches
+		'cycles' : 4, # Number of oscillation periods to measure
+		'timeout' : 7200 # Maximum duration of the experiment in seconds
+	}
+
 	settings['smoke_plus'] = {
 		'enabled' : False, # Sets default Enable/Disable (True = Enabled, False = Disabled)
 		'min_temp' : 160, # Minimum temperature to cycle fan on/off
@@ -135,7 +161,11 @@ def DefaultSettings():
 		'warning_enabled' : True,
 		'warning_level' : 25,
 		'empty' : 22, # Number of centimeters from the sensor that indicates empty
-		'full' : 4  # Number of centimeters from the sensor that indicates full
+		'full' : 4,  # Number of centimeters from the sensor that indicates full
+		'sample_interval' : 60, # Seconds between hopper level readings (see hopper_sampler.py)
+		'median_n' : 5, # Number of readings for the median filter
+		'alpha' : 0.3, # Smoothing factor for the exponential filter (0-1, higher follows faster)
+		'warning_time' : 60 # Minutes before the hopper is predicted to run empty to send the pellet warning
 	}
 
 	if isRaspberryPi():
@@ -153,6 +183,17 @@ def DefaultSettings():
 			'dist' : 'prototype'
 		}
 
+	# ADS1115 continuous acquisition (see adc_ads1115.py)
+	settings['ads1115'] = {
+		'sps' : 250, # Data rate in samples per second (8, 16, 32, 64, 128, 250, 475, 860)
+		'pga' : 6144, # Full scale range in mV (6144, 4096, 2048, 1024, 512, 256)
+		'rdy_pin' : 0, # GPIO (BCM) connected to the ALERT/RDY pin (0 = not connected)
+		'oversample' : 4, # Conversions per channel on each round robin pass
+		'buffer_size' : 16, # Samples per channel averaged for each reading
+		'fault_hold' : 30, # Seconds to report the last good temperature of a faulted probe
+		'addresses' : [72] # I2C addresses of the ADS1115 devices (0x48 - 0x4B), probe channels are numbered across the devices in order, four per device
+	}
+
 	settings['lastupdated'] = {
 		'time' : math.trunc(time.time())
 	}
@@ -293,6 +334,8 @@ def DefaultPellets():
 		now : ID
 	}
 
+	pelletdb['feed_rates'] = {}  # Learned feed rate of each pellet profile (see pellet_model.py)
+
 	pelletdb['lastupdated'] = {
 		'time' : math.trunc(time.time())
 	}
@@ -358,6 +401,17 @@ def DefaultProbeProfiles():
 	}
 	return probe_profiles
 
+def GetProbeProfiles(settings):
+	# Returns the probe profile of each probe channel (grill, probe 1, probe 2, then any additional probes)
+	probe_types = [settings['probe_types']['grill0type'], settings['probe_types']['probe1type'], settings['probe_types']['probe2type']]
+	probe_types += settings['probe_types']['aux_types']
+	if(settings['globals']['four_probes']) and (len(probe_types) < 4):
+		# Fourth probe channel, using the probe 2 profile unless an additional profile is set
+		probe_types.append(settings['probe_types']['probe2type'])
+
+	probe_profiles = settings['probe_settings']['probe_profiles']
+	return [probe_profiles[probe_type] for probe_type in probe_types]
+
 def generateUUID():
 	node = uuid.getnode()
 	rand_int = random.randint(100, 200)
@@ -395,6 +449,45 @@ def WriteControl(control):
 	global cmdsts
 
 	cmdsts.set('control:general', json.dumps(control))
+	PublishUpdate('control')
+
+def PublishUpdate(name):
+	# *****************************************
+	# Function: PublishUpdate
+	# Input: str name
+	# Description: Announce on the update channel that
+	#  data has changed, so the web app can push it to
+	#  the clients without polling.  Also increments the
+	#  version counter of the data (see ReadVersions).
+	#  name: 'control', 'current', 'pellets', 'settings',
+	#  'hopper' or 'pellet_model'
+	# *****************************************
+	global cmdsts
+
+	pipe = cmdsts.pipeline(transaction=False)
+	pipe.hincrby(VERSIONS_KEY, name, 1)
+	pipe.hset(MODIFIED_KEY, name, time.time())
+	pipe.publish(UPDATE_CHANNEL, name)
+	pipe.execute()
+
+def ReadVersions(names):
+	# *****************************************
+	# Function: ReadVersions
+	# Input: names []
+	# Output: versions [], modified []
+	# Description: Read the version counter and last
+	#  modified time of each data name (0 if it has
+	#  not been written yet)
+	# *****************************************
+	global cmdsts
+
+	pipe = cmdsts.pipeline(transaction=False)
+	pipe.hmget(VERSIONS_KEY, names)
+	pipe.hmget(MODIFIED_KEY, names)
+	versions, modified = pipe.execute()
+	versions = [int(version) if version != None else 0 for version in versions]
+	modified = [float(time_modified) if time_modified != None else 0 for time_modified in modified]
+	return(versions, modified)
 
 
 def ReadSettings(filename='settings.json'):
@@ -452,8 +545,11 @@ def WriteSettings(settings):
 	settings['lastupdated']['time'] = math.trunc(time.time())
 
 	json_data_string = json.dumps(settings, indent=2, sort_keys=True)
-	with open("settings.json", 'w') as settings_file:
+	# Replace the file in one step, so the other processes reloading the settings never read a partial file
+	with open("settings.json.tmp", 'w') as settings_file:
 		settings_file.write(json_data_string)
+	os.replace("settings.json.tmp", "settings.json")
+	PublishUpdate('settings')
 
 def ReadRecipes():
 	# *****************************************
@@ -525,6 +621,7 @@ def WritePelletDB(pelletdb):
 	json_data_string = json.dumps(pelletdb, indent=2, sort_keys=True)
 	with open("pelletdb.json", 'w') as json_file:
 		json_file.write(json_data_string)
+	PublishUpdate('pellets')
 
 def ReadLog():
 	# *****************************************
@@ -597,6 +694,8 @@ def ReadHistory(num_items=0, flushhistory=False):
 			cmdsts.hset('control:current', 'GrillTemp', 0)
 			cmdsts.hset('control:current', 'Probe1Temp', 0)
 			cmdsts.hset('control:current', 'Probe2Temp', 0)
+			cmdsts.hdel('control:current', 'Temps')
+			PublishUpdate('current')
 			event = 'WARNING: History data flushed.'
 			WriteLog(event)
 	else:
@@ -608,7 +707,7 @@ def ReadHistory(num_items=0, flushhistory=False):
 				liststart = 0
 			data = cmdsts.lrange('control:history', liststart, -1)
 			for index in range(len(data)):
-				data_list.append(data[index].split(' ', 6))  # Splits out each of the values into seperate list items 
+				data_list.append(data[index].split(' '))  # Splits out the time, then the temperature and set point of each channel
 		else:
 			event = 'WARNING: History data is not present in database. Creating Data Structure.'
 			WriteLog(event)
@@ -629,6 +728,22 @@ def ReadHistory(num_items=0, flushhistory=False):
 
 	return(data_list)
 
+def LegacyProbeData(in_data):
+	# *****************************************
+	# Function: LegacyProbeData
+	# Input: in_data (channel indexed Temps, SetPoints, Trs)
+	# Output: in_data with the GrillTemp, Probe1Temp, ...
+	#  keys of channels 0-2
+	# Description: For the display modules, which
+	#  only show the grill, probe 1 and probe 2
+	# *****************************************
+	legacy = dict(in_data)
+	for channel, name in enumerate(['Grill', 'Probe1', 'Probe2']):
+		legacy[name + 'Temp'] = in_data['Temps'][channel]
+		legacy[name + 'SetPoint'] = in_data['SetPoints'][channel]
+		legacy[name + 'Tr'] = in_data['Trs'][channel]
+	return(legacy)
+
 def WriteHistory(TempStruct, maxsizelines=28800, tuning_mode=False):
 	# *****************************************
 	# Function: WriteHistory
@@ -640,7 +755,16 @@ def WriteHistory(TempStruct, maxsizelines=28800, tuning_mode=False):
 
 	timenow = datetime.datetime.now()
 	timestr = timenow.strftime('%H:%M:%S') # Truncate the microseconds
-	datastring = timestr + ' ' + str(TempStruct['GrillTemp']) + ' ' + str(TempStruct['GrillSetPoint']) + ' ' + str(TempStruct['Probe1Temp']) + ' ' + str(TempStruct['Probe1SetPoint']) + ' ' + str(TempStruct['Probe2Temp']) + ' ' + str(TempStruct['Probe2SetPoint'])
+	if 'Temps' in TempStruct:
+		temps = TempStruct['Temps']
+		setpoints = TempStruct['SetPoints']
+	else:
+		temps = [TempStruct['GrillTemp'], TempStruct['Probe1Temp'], TempStruct['Probe2Temp']]
+		setpoints = [TempStruct['GrillSetPoint'], TempStruct['Probe1SetPoint'], TempStruct['Probe2SetPoint']]
+	# Time followed by the temperature and set point of each channel (grill, probe 1, probe 2, ...)
+	datastring = timestr
+	for channel in range(len(temps)):
+		datastring += ' ' + str(temps[channel]) + ' ' + str(setpoints[channel])
 	# Push data string to the list in the last position
 	cmdsts.rpush('control:history', datastring)
 
@@ -649,13 +773,25 @@ def WriteHistory(TempStruct, maxsizelines=28800, tuning_mode=False):
 		cmdsts.lpop('control:history')
 
 	# Set current values in the control:current hash
-	cmdsts.hset('control:current', 'GrillTemp', TempStruct['GrillTemp'])
-	cmdsts.hset('control:current', 'Probe1Temp', TempStruct['Probe1Temp'])
-	cmdsts.hset('control:current', 'Probe2Temp', TempStruct['Probe2Temp'])
+	current = {
+		'GrillTemp' : temps[0],
+		'Probe1Temp' : temps[1],
+		'Probe2Temp' : temps[2],
+		'Temps' : json.dumps(temps)
+	}
+	if 'ProbeStatus' in TempStruct:
+		current['ProbeStatus'] = json.dumps(TempStruct['ProbeStatus'])
+		current['ProbeFaults'] = json.dumps(TempStruct['ProbeFaults'])
+	cmdsts.hmset('control:current', current)
+	PublishUpdate('current')
 
 	# If in tuning mode, populate the Tr data in the database 
 	if(tuning_mode):
-		tr_values = str(int(TempStruct['GrillTr'])) + ' ' + str(int(TempStruct['Probe1Tr'])) + ' ' + str(int(TempStruct['Probe2Tr']))
+		if 'Trs' in TempStruct:
+			trs = TempStruct['Trs'][:3]
+		else:
+			trs = [TempStruct['GrillTr'], TempStruct['Probe1Tr'], TempStruct['Probe2Tr']]
+		tr_values = ' '.join([str(int(tr)) for tr in trs])
 		cmdsts.set('control:tuning', tr_values)
 
 def ReadCurrent(zero_out=False):
@@ -664,7 +800,7 @@ def ReadCurrent(zero_out=False):
 	# Input: none
 	# Output: cur_probe_temps []
 	# Description: Read current.log and populate
-	#  a list of data
+	#  a list of data (one temperature per channel)
 	# *****************************************
 	global cmdsts
 	
@@ -674,6 +810,11 @@ def ReadCurrent(zero_out=False):
 		cmdsts.hset('control:current', 'GrillTemp', 0)
 		cmdsts.hset('control:current', 'Probe1Temp', 0)
 		cmdsts.hset('control:current', 'Probe2Temp', 0)
+		cmdsts.hset('control:current', 'ProbeStatus', json.dumps(['ok', 'ok', 'ok']))
+		cmdsts.hdel('control:current', 'Temps')
+		PublishUpdate('current')
+	elif cmdsts.hexists('control:current', 'Temps'):
+		cur_probe_temps = json.loads(cmdsts.hget('control:current', 'Temps'))
 	else:
 		cur_probe_temps[0] = cmdsts.hget('control:current', 'GrillTemp')
 		cur_probe_temps[1] = cmdsts.hget('control:current', 'Probe1Temp')
@@ -681,6 +822,27 @@ def ReadCurrent(zero_out=False):
 	
 	return(cur_probe_temps)
 
+def ReadProbeStatus():
+	# *****************************************
+	# Function: ReadProbeStatus
+	# Input: none
+	# Output: probe_status {}
+	# Description: Read the probe fault states and
+	#  fault counters from the current hash
+	# *****************************************
+	global cmdsts
+
+	probe_status = {'status' : ['ok', 'ok', 'ok'], 'faults' : [0, 0, 0]}
+
+	status = cmdsts.hget('control:current', 'ProbeStatus')
+	if status != None:
+		probe_status['status'] = json.loads(status)
+	faults = cmdsts.hget('control:current', 'ProbeFaults')
+	if faults != None:
+		probe_status['faults'] = json.loads(faults)
+
+	return(probe_status)
+
 def ReadTr():
 	# *****************************************
 	# Function: ReadTr
@@ -704,6 +866,133 @@ def ReadTr():
 
 	return(cur_probe_tr)
 
+def ReadAutotune():
+	# *****************************************
+	# Function: ReadAutotune
+	# Input: none
+	# Output: autotune {}
+	# Description: Read the status / results of the
+	#  last autotune experiment from the database
+	# *****************************************
+	global cmdsts
+	autotune_data = cmdsts.get('control:autotune')
+
+	if autotune_data != None:
+		autotune = json.loads(autotune_data)
+	else:
+		autotune = {'status' : 'none'}
+
+	return(autotune)
+
+def WriteAutotune(autotune):
+	global cmdsts
+
+	cmdsts.set('control:autotune', json.dumps(autotune))
+
+def ReadHopper():
+	# *****************************************
+	# Function: ReadHopper
+	# Input: none
+	# Output: hopper {}
+	# Description: Read the latest smoothed hopper
+	#  level, median level, raw reading and time of
+	#  the reading
+	# *****************************************
+	global cmdsts
+	hopper = cmdsts.get('control:hopper')
+
+	if hopper != None:
+		return(json.loads(hopper))
+	return({'level' : None, 'median' : None, 'raw' : None, 'time' : 0})
+
+def WriteHopper(hopper):
+	global cmdsts
+
+	cmdsts.set('control:hopper', json.dumps(hopper))
+	PublishUpdate('hopper')
+
+def ReadPelletModel():
+	# *****************************************
+	# Function: ReadPelletModel
+	# Input: none
+	# Output: prediction {}
+	# Description: Read the pellet consumption model
+	#  prediction (see pellet_model.py)
+	# *****************************************
+	global cmdsts
+	prediction = cmdsts.get('control:pellet_model')
+
+	if prediction != None:
+		return(json.loads(prediction))
+	return({'level' : None, 'feed_rate' : None, 'time_to_empty' : None, 'time' : 0})
+
+def WritePelletModel(prediction):
+	global cmdsts
+
+	cmdsts.set('control:pellet_model', json.dumps(prediction))
+	PublishUpdate('pellet_model')
+
+def ReadRelayStats():
+	# *****************************************
+	# Function: ReadRelayStats
+	# Input: none
+	# Output: relay_stats {}
+	# Description: Read the on time and switch counts
+	#  of the grill platform outputs (see relay_stats.py)
+	# *****************************************
+	global cmdsts
+	relay_stats = cmdsts.get('control:relay_stats')
+
+	if relay_stats != None:
+		return(json.loads(relay_stats))
+	return({'outputs' : {}})
+
+def WriteRelayStats(relay_stats):
+	global cmdsts
+
+	cmdsts.set('control:relay_stats', json.dumps(relay_stats))
+
+def ReadNotifyPolicy():
+	# *****************************************
+	# Function: ReadNotifyPolicy
+	# Input: none
+	# Output: state {}
+	# Description: Read the notification policy state
+	#  (time each event was last sent and threshold
+	#  events waiting to re-arm, see notify_policy.py)
+	# *****************************************
+	global cmdsts
+	state = cmdsts.get('control:notify_policy')
+
+	if state != None:
+		return(json.loads(state))
+	return({'last_sent' : {}, 'disarmed' : []})
+
+def WriteNotifyPolicy(state):
+	global cmdsts
+
+	cmdsts.set('control:notify_policy', json.dumps(state))
+
+def ReadBusStats():
+	# *****************************************
+	# Function: ReadBusStats
+	# Input: none
+	# Output: bus_stats {}
+	# Description: Read the I2C transaction statistics
+	#  of each device (see i2c_arbiter.py)
+	# *****************************************
+	global cmdsts
+	bus_stats = cmdsts.get('control:i2c')
+
+	if bus_stats != None:
+		return(json.loads(bus_stats))
+	return({})
+
+def WriteBusStats(bus_stats):
+	global cmdsts
+
+	cmdsts.set('control:i2c', json.dumps(bus_stats))
+
 def convert_temp(units, temp):
 	if units == 'F':
 		temp_out = int(temp * (9/5) + 32) # Celsius to Fahrenheit
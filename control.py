@@ -24,10 +24,20 @@ import os
 import json
 import datetime
 from common import *  # Common Library for WebUI and Control Program
-from pushbullet import Pushbullet # Pushbullet Import
 import pid as PID # Library for calculating PID setpoints
-import requests
+from autotune import RelayAutotune # Library for the PID autotune relay experiment
 from temp_queue import TempQueue
+from temp_filter import CreateProbeFilters, FilterADCData
+from clock import SystemClock, SimulatedClock # Time source for the control loops
+from i2c_arbiter import GetBusStats # I2C transaction statistics of the ADC, distance sensor and display
+from hopper_sampler import HopperSampler # Background hopper level readings
+from pellet_model import PelletModel # Pellet consumption model / time to empty prediction
+from notify_queue import NotifyQueue # Background notification delivery with retries
+from notify_policy import NotifyPolicy, PELLET_LEVEL_HYSTERESIS, PREDICTED_EMPTY_HYSTERESIS # Notification cooldowns, hysteresis and coalescing
+from mqtt_publisher import MqttPublisher # MQTT status publishing and commands
+import argparse
+import signal
+import sys
 
 # Read Settings to Get Modules Configuration 
 settings = ReadSettings()
@@ -39,6 +49,8 @@ else:
 
 if(settings['modules']['adc'] == 'ads1115'):
 	from adc_ads1115 import ReadADC # Library for reading the ADC device
+elif(settings['modules']['adc'] == 'simulator'):
+	from adc_simulator import ReadADC # Simulated grill model driven by the grill platform outputs
 else: 
 	from adc_prototype import ReadADC # Simulated Library for reading the ADC device
 	
@@ -76,6 +88,32 @@ else:
 # Function Definitions
 # *****************************************
 
+def ReadProbes(adc_device, ProbeFilters, AvgTemps, control, now):
+	# Read, filter and average all probe channels (one TempQueue in AvgTemps per channel: grill, probe 1, probe 2, ...)
+	#  Returns the channel indexed data for the control loop, and the filtered ADC data
+	adc_data = FilterADCData(ProbeFilters, adc_device.ReadAllPorts(), now)
+	channels = len(AvgTemps)
+	# A channel the ADC module doesn't report (i.e. more probe profiles than inputs) reads 0 with an 'error' status
+	missing = max(channels - len(adc_data['Temps']), 0)
+
+	for queue, temp in zip(AvgTemps, adc_data['Temps']):
+		queue.enqueue(temp)
+
+	in_data = {}
+	in_data['Temps'] = [queue.average() for queue in AvgTemps]
+	in_data['SetPoints'] = [control['setpoints'].get(ChannelName(channel), 0) for channel in range(channels)]
+	in_data['Trs'] = (list(adc_data['Trs']) + [0] * missing)[:channels]  # For Temp Resistance Tuning
+	# Probe fault states (ADC modules without fault detection are always 'ok')
+	in_data['ProbeStatus'] = (list(adc_data.get('ProbeStatus', ['ok'] * len(adc_data['Temps']))) + ['error'] * missing)[:channels]
+	in_data['ProbeFaults'] = (list(adc_data.get('ProbeFaults', [0] * len(adc_data['Temps']))) + [0] * missing)[:channels]
+	return(in_data, adc_data)
+
+def ChannelName(channel):
+	# Set point name of a probe channel (grill, probe1, probe2, probe3, ...)
+	if channel == 0:
+		return('grill')
+	return('probe' + str(channel))
+
 def GetStatus(grill_platform, control, settings, pelletdb):
 	# *****************************************
 	# Get Status Details for Display Function
@@ -122,6 +160,7 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 	grill_platform.IgniterOff()
 	grill_platform.AugerOff()
 	grill_platform.PowerOn()
+	pellet_model.Stop()
 	
 	if(settings['globals']['debug_mode'] == True):
 		event = '* Fan ON, Igniter OFF, Auger OFF'
@@ -133,7 +172,7 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 			event = '* Igniter ON'
 			print(event)
 			WriteLog(event)
-	if ((mode == 'Smoke') or (mode == 'Hold') or (mode == 'Startup') or (mode == 'Reignite')):
+	if ((mode == 'Smoke') or (mode == 'Hold') or (mode == 'Autotune') or (mode == 'Startup') or (mode == 'Reignite')):
 		grill_platform.AugerOn()
 		if(settings['globals']['debug_mode'] == True):
 			event = '* Auger ON'
@@ -157,35 +196,37 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 		OffTime = settings['cycle_data']['HoldCycleTime'] * (1 - settings['cycle_data']['u_min'])	#  Auger Off Time
 		CycleTime = settings['cycle_data']['HoldCycleTime'] #  Total Cycle Time
 		CycleRatio = settings['cycle_data']['u_min'] 	#  Ratio of OnTime to CycleTime
-		PIDControl = PID.PID(settings['cycle_data']['PB'],settings['cycle_data']['Ti'],settings['cycle_data']['Td'])
+		PIDControl = PID.PID(settings['cycle_data']['PB'],settings['cycle_data']['Ti'],settings['cycle_data']['Td'],clock=clock)
 		PIDControl.setTarget(control['setpoints']['grill'])	# Initialize with setpoint for grill
 		if(settings['globals']['debug_mode'] == True):
 			event = '* On Time = ' + str(OnTime) + ', OffTime = ' + str(OffTime) + ', CycleTime = ' + str(CycleTime) + ', CycleRatio = ' + str(CycleRatio)
 			print(event)
 			WriteLog(event)
 
-	# Initialize all temperature variables
-	AvgGT = TempQueue(units=settings['globals']['units'])
-	AvgP1 = TempQueue(units=settings['globals']['units'])
-	AvgP2 = TempQueue(units=settings['globals']['units'])
+	if (mode == 'Autotune'):
+		# Relay feedback experiment, the auger duty cycle is switched between u_max and u_min around the setpoint
+		Autotuner = RelayAutotune(control['setpoints']['grill'], settings['cycle_data']['u_min'], settings['cycle_data']['u_max'], hysteresis=settings['autotune']['hysteresis'], cycles=settings['autotune']['cycles'], timeout=settings['autotune']['timeout'])
+		CycleRatio = Autotuner.getOutput()
+		OnTime = settings['cycle_data']['HoldCycleTime'] * CycleRatio		#  Auger On Time
+		OffTime = settings['cycle_data']['HoldCycleTime'] * (1 - CycleRatio)	#  Auger Off Time
+		CycleTime = settings['cycle_data']['HoldCycleTime'] #  Total Cycle Time
+		WriteAutotune(Autotuner.getResults())
+
+	# Initialize all temperature variables (one average per probe channel, the grill, probe 1 and probe 2 are always present)
+	AvgTemps = [TempQueue(units=settings['globals']['units']) for probe_profile in GetProbeProfiles(settings)]
+	AvgGT = AvgTemps[0]  # Grill probe, used by the control logic
 
 	# Check pellets level notification upon starting cycle
 	CheckNotifyPellets(control, settings, pelletdb)
 
 	# Collect Initial Temperature Information
-	# Get Probe Types From Settings
-	grill0type = settings['probe_types']['grill0type']
-	probe1type = settings['probe_types']['probe1type']
-	probe2type = settings['probe_types']['probe2type']
-
-	adc_device.SetProfiles(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type])
+	# Get Probe Profiles From Settings
+	adc_device.SetProfiles(*GetProbeProfiles(settings))
 	
-	adc_data = {}
-	adc_data = adc_device.ReadAllPorts()
+	# Per probe filters applied before averaging
+	ProbeFilters = CreateProbeFilters(settings)
 
-	AvgGT.enqueue(adc_data['GrillTemp'])
-	AvgP1.enqueue(adc_data['Probe1Temp'])
-	AvgP2.enqueue(adc_data['Probe2Temp'])
+	ReadProbes(adc_device, ProbeFilters, AvgTemps, control, clock.time())
 
 	status = 'Active'
 
@@ -197,7 +238,7 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 		control['safety']['afterstarttemp'] = AvgGT.average()
 		WriteControl(control)
 	# Check if the temperature of the grill dropped below the startuptemperature 
-	elif ((mode == 'Hold') or (mode == 'Smoke')):
+	elif ((mode == 'Hold') or (mode == 'Smoke') or (mode == 'Autotune')):
 		if (control['safety']['afterstarttemp'] < control['safety']['startuptemp']):
 			if(control['safety']['reigniteretries'] == 0):
 				status = 'Inactive'
@@ -222,7 +263,7 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 				WriteControl(control)
 
 	# Set the start time
-	starttime = time.time()
+	starttime = clock.time()
 
 	# Set time since toggle for temperature
 	temptoggletime = starttime
@@ -236,9 +277,6 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 	# Initializing Start Time for Smoke Plus Mode
 	sp_cycletoggletime = starttime 
 
-	# Set time since toggle for hopper check
-	hoppertoggletime = starttime 
-
 	# Set time since last control check
 	controlchecktime = starttime
 
@@ -251,9 +289,12 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 	# Set Hold Mode Target Temp Boolean
 	target_temp_achieved = False
 
+	# Relay switch times already written to the database in Autotune Mode
+	last_switchtimes = []
+
 	# ============ Main Work Cycle ============
 	while(status == 'Active'):
-		now = time.time()
+		now = clock.time()
 
 		# Check for button input event
 		display_device.EventDetect()
@@ -273,21 +314,15 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 			status = 'Inactive'
 			break
 
-		# Check hopper level when requested or every 300 seconds 
-		if (control['hopper_check'] == True) or (now - hoppertoggletime > 300):
-			pelletdb = ReadPelletDB()
-			# Get current hopper level and save it to the current pellet information
-			pelletdb['current']['hopper_level'] = dist_device.GetLevel()
-			WritePelletDB(pelletdb)
-			hoppertoggletime = now
-			if(control['hopper_check'] == True):
-				#control = ReadControl()  # Read Modify Write
-				control['hopper_check'] = False
-				WriteControl(control)
-			if(settings['globals']['debug_mode'] == True):
-				event = "* Hopper Level Checked @ " + str(pelletdb['current']['hopper_level']) + "%"
-				print(event)
-				WriteLog(event)
+		# Hopper level check requested, the reading is taken by the hopper sampler thread
+		if (control['hopper_check'] == True):
+			dist_device.Trigger()
+			#control = ReadControl()  # Read Modify Write
+			control['hopper_check'] = False
+			WriteControl(control)
+
+		# Save new hopper level readings to the current pellet information
+		pelletdb = UpdateHopperLevel(dist_device, pelletdb, settings)
 
 		# Check for update in ON/OFF Switch
 		if (last != grill_platform.GetInputStatus()):
@@ -306,6 +341,9 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 		# Change Auger State based on Cycle Time
 		current_output_status = grill_platform.GetOutputStatus()
 
+		# Integrate the auger on time for the pellet consumption model
+		pellet_model.Update(current_output_status['auger'] == AUGERON, now)
+
 		# If Auger is OFF and time since toggle is greater than Off Time
 		if (current_output_status['auger'] == AUGEROFF) and (now - augertoggletime > CycleTime * (1-CycleRatio)):
 			grill_platform.AugerOn()
@@ -322,6 +360,12 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 					event = '* On Time = ' + str(OnTime) + ', OffTime = ' + str(OffTime) + ', CycleTime = ' + str(CycleTime) + ', CycleRatio = ' + str(CycleRatio)
 					print(event)
 					WriteLog(event)
+			# Apply the current relay output for AUTOTUNE Mode
+			elif (mode == 'Autotune'):
+				CycleRatio = Autotuner.getOutput()
+				OnTime = settings['cycle_data']['HoldCycleTime'] * CycleRatio
+				OffTime = settings['cycle_data']['HoldCycleTime'] * (1 - CycleRatio)
+				CycleTime = OnTime + OffTime
 			if(settings['globals']['debug_mode'] == True):
 				event = '* Cycle Event: Auger On'
 				print(event)
@@ -342,32 +386,14 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 			#control = ReadControl()  # Read Modify Write
 			control['probe_profile_update'] = False
 			WriteControl(control)
-			# Get new probe profiles
-			grill0type = settings['probe_types']['grill0type']
-			probe1type = settings['probe_types']['probe1type']
-			probe2type = settings['probe_types']['probe2type']
 			# Add new probe profiles to ADC Object
-			adc_device.SetProfiles(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type])
+			adc_device.SetProfiles(*GetProbeProfiles(settings))
+			# Get new probe filters
+			ProbeFilters = CreateProbeFilters(settings)
 
 		# Get temperatures from all probes
-		adc_data = {}
-		adc_data = adc_device.ReadAllPorts()
-
-		# Test temperature data returned for errors (+/- 20% Temp Variance), and average the data since last reading
-		AvgGT.enqueue(adc_data['GrillTemp'])
-		AvgP1.enqueue(adc_data['Probe1Temp'])
-		AvgP2.enqueue(adc_data['Probe2Temp'])
-
-		in_data = {}
-		in_data['GrillTemp'] = AvgGT.average()
-		in_data['GrillSetPoint'] = control['setpoints']['grill']
-		in_data['Probe1Temp'] = AvgP1.average()
-		in_data['Probe1SetPoint'] = control['setpoints']['probe1']
-		in_data['Probe2Temp'] = AvgP2.average()
-		in_data['Probe2SetPoint'] = control['setpoints']['probe2']
-		in_data['GrillTr'] = adc_data['GrillTr']  # For Temp Resistance Tuning
-		in_data['Probe1Tr'] = adc_data['Probe1Tr']  # For Temp Resistance Tuning
-		in_data['Probe2Tr'] = adc_data['Probe2Tr']  # For Temp Resistance Tuning
+		# Read, filter and average all probe channels
+		in_data, adc_data = ReadProbes(adc_device, ProbeFilters, AvgTemps, control, now)
 
 		# Check to see if there are any pending notifications (i.e. Timer / Temperature Settings)
 		control = CheckNotify(in_data, control, settings, pelletdb)
@@ -378,13 +404,23 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 		# Send Current Status / Temperature Data to Display Device every 0.5 second (Display Refresh)
 		if(now - displaytoggletime > 0.5):
 			status_data = GetStatus(grill_platform, control, settings, pelletdb)
-			display_device.DisplayStatus(in_data, status_data)
-			displaytoggletime = time.time() # Reset the displaytoggletime to current time
+			display_device.DisplayStatus(LegacyProbeData(in_data), status_data)
+			displaytoggletime = clock.time() # Reset the displaytoggletime to current time
 
 		# Safety Controls
-		if ((mode == 'Startup') or (mode == 'Reignite')):
+		# A faulted grill probe (past the last good value hold time) stops the grill, rather than being treated as a flameout
+		if (mode != 'Shutdown') and (in_data['ProbeStatus'][0] != 'ok') and (not adc_data.get('ProbeHeld', [False])[0]):
+			status = 'Inactive'
+			event = 'ERROR: Grill probe fault (' + in_data['ProbeStatus'][0] + ')! Shutting down.'
+			WriteLog(event)
+			display_device.DisplayText('ERROR')
+			control['mode'] = 'Error'
+			control['updated'] = True
+			WriteControl(control)
+			SendNotifications("Grill_Error_00", control, settings, pelletdb)
+		elif ((mode == 'Startup') or (mode == 'Reignite')):
 			control['safety']['afterstarttemp'] = AvgGT.average()
-		elif ((mode == 'Hold') or (mode == 'Smoke')):
+		elif ((mode == 'Hold') or (mode == 'Smoke') or (mode == 'Autotune')):
 			if (AvgGT.average() < control['safety']['startuptemp']):
 				if(control['safety']['reigniteretries'] == 0):
 					status = 'Inactive'
@@ -419,6 +455,25 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 				WriteControl(control)
 				SendNotifications("Grill_Error_01", control, settings, pelletdb)
 
+		# Record the grill temperature for the autotune experiment, and switch to Hold mode when it is done
+		if ((mode == 'Autotune') and (status == 'Active')):
+			last_status = Autotuner.status
+			Autotuner.sample(AvgGT.average(), now)
+			if (Autotuner.switchtimes != last_switchtimes) or (Autotuner.status != last_status):
+				last_switchtimes = list(Autotuner.switchtimes)
+				WriteAutotune(Autotuner.getResults())
+			if (Autotuner.status != 'running'):
+				results = Autotuner.getResults()
+				if (results['status'] == 'complete'):
+					event = 'Autotune complete. Proposed PB = ' + str(results['PB']) + ', Ti = ' + str(results['Ti']) + ', Td = ' + str(results['Td']) + ' (Ku = ' + str(results['Ku']) + ', Tu = ' + str(results['Tu']) + 's)'
+				else:
+					event = 'Autotune failed. ' + results['message']
+				WriteLog(event)
+				status = 'Inactive'
+				control['mode'] = 'Hold'
+				control['updated'] = True
+				WriteControl(control)
+
 		# Check if target temperature has been achieved before utilizing Smoke Plus Mode
 		if((mode == 'Hold') and (AvgGT.average() >= control['setpoints']['grill']) and (target_temp_achieved==False)):
 			target_temp_achieved = True
@@ -445,8 +500,12 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 
 		# Write History after 3 seconds has passed
 		if (now - temptoggletime > 3):
-			temptoggletime = time.time()
+			temptoggletime = clock.time()
 			WriteHistory(in_data, tuning_mode=control['tuning_mode'])
+			WriteBusStats(GetBusStats())
+			WriteRelayStats(grill_platform.GetRelayStats())
+			UpdateMqtt(control, pelletdb, in_data)
+			WritePelletModel(pellet_model.GetPrediction(now))
 
 		# Check if 240s have elapsed since startup/reignite mode started
 		if ((mode == 'Startup') or (mode == 'Reignite')):
@@ -457,7 +516,7 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 		if ((mode == 'Shutdown') and ((now - starttime) > settings['globals']['shutdown_timer'])):
 			status = 'Inactive'
 
-		time.sleep(0.05)
+		clock.sleep(0.05)
 		# *********
 		# END Mode Loop
 		# *********
@@ -465,6 +524,7 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 	# Clean-up and Exit
 	grill_platform.AugerOff()
 	grill_platform.IgniterOff()
+	pellet_model.Stop()
 	
 	if(settings['globals']['debug_mode'] == True):
 		event = '* Auger OFF, Igniter OFF'
@@ -481,6 +541,13 @@ def WorkCycle(mode, grill_platform, adc_device, display_device, dist_device):
 		#control = ReadControl()  # Read Modify Write
 		control['safety']['afterstarttemp'] = AvgGT.average()
 		WriteControl(control)
+	if ((mode == 'Autotune') and (Autotuner.status == 'running')):
+		# Experiment interrupted by a mode change, switch or error
+		results = Autotuner.getResults()
+		results['status'] = 'failed'
+		results['message'] = 'Autotune was interrupted before it completed.'
+		WriteAutotune(results)
+		WriteLog('Autotune interrupted.')
 	event = mode + ' mode ended.'
 	WriteLog(event)
 
@@ -508,30 +575,23 @@ def Monitor(grill_platform, adc_device, display_device, dist_device):
 	control = ReadControl()
 	pelletdb = ReadPelletDB()
 
-	# Initialize all temperature objects
-	AvgGT = TempQueue(units=settings['globals']['units'])
-	AvgP1 = TempQueue(units=settings['globals']['units'])
-	AvgP2 = TempQueue(units=settings['globals']['units'])
+	# Initialize all temperature objects (one average per probe channel, the grill, probe 1 and probe 2 are always present)
+	AvgTemps = [TempQueue(units=settings['globals']['units']) for probe_profile in GetProbeProfiles(settings)]
+	AvgGT = AvgTemps[0]  # Grill probe, used by the control logic
 
 	# Check pellets level notification upon starting cycle
 	CheckNotifyPellets(control, settings, pelletdb)
 
 	# Collect Initial Temperature Information
-	# Get Probe Types From Settings
-	grill0type = settings['probe_types']['grill0type']
-	probe1type = settings['probe_types']['probe1type']
-	probe2type = settings['probe_types']['probe2type']
+	# Get Probe Profiles From Settings
+	adc_device.SetProfiles(*GetProbeProfiles(settings))
 
-	adc_device.SetProfiles(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type])
+	# Per probe filters applied before averaging
+	ProbeFilters = CreateProbeFilters(settings)
 
-	adc_data = {}
-	adc_data = adc_device.ReadAllPorts()
+	ReadProbes(adc_device, ProbeFilters, AvgTemps, control, clock.time())
 
-	AvgGT.enqueue(adc_data['GrillTemp'])
-	AvgP1.enqueue(adc_data['Probe1Temp'])
-	AvgP2.enqueue(adc_data['Probe2Temp'])
-
-	now = time.time()
+	now = clock.time()
 
 	# Set time since toggle for temperature
 	temptoggletime = now
@@ -539,9 +599,6 @@ def Monitor(grill_platform, adc_device, display_device, dist_device):
 	# Set time since toggle for display
 	displaytoggletime = now 
 
-	# Set time since toggle for hopper check
-	hoppertoggletime = now 
-
 	# Set time since last control check
 	controlchecktime = now
 
@@ -551,7 +608,7 @@ def Monitor(grill_platform, adc_device, display_device, dist_device):
 	status = 'Active'
 
 	while(status == 'Active'):
-		now = time.time()
+		now = clock.time()
 
 		# Check for update in control status every 0.5 seconds 
 		if (now - controlchecktime > 0.5):
@@ -582,21 +639,15 @@ def Monitor(grill_platform, adc_device, display_device, dist_device):
 				WriteControl(control)
 				break
 
-		# Check hopper level when requested or every 300 seconds 
-		if (control['hopper_check'] == True) or (now - hoppertoggletime > 300):
-			pelletdb = ReadPelletDB()
-			# Get current hopper level and save it to the current pellet information
-			pelletdb['current']['hopper_level'] = dist_device.GetLevel()
-			WritePelletDB(pelletdb)
-			hoppertoggletime = now
-			if(control['hopper_check'] == True):
-				#control = ReadControl()  # Read Modify Write
-				control['hopper_check'] = False
-				WriteControl(control)
-			if(settings['globals']['debug_mode'] == True):
-				event = "* Hopper Level Checked @ " + str(pelletdb['current']['hopper_level']) + "%"
-				print(event)
-				WriteLog(event)
+		# Hopper level check requested, the reading is taken by the hopper sampler thread
+		if (control['hopper_check'] == True):
+			dist_device.Trigger()
+			#control = ReadControl()  # Read Modify Write
+			control['hopper_check'] = False
+			WriteControl(control)
+
+		# Save new hopper level readings to the current pellet information
+		pelletdb = UpdateHopperLevel(dist_device, pelletdb, settings)
 
 		# Grab current probe profiles if they have changed since the last loop. 
 		if (control['probe_profile_update'] == True):
@@ -604,31 +655,13 @@ def Monitor(grill_platform, adc_device, display_device, dist_device):
 			#control = ReadControl()  # Read Modify Write
 			control['probe_profile_update'] = False
 			WriteControl(control)
-			# Get new probe profiles
-			grill0type = settings['probe_types']['grill0type']
-			probe1type = settings['probe_types']['probe1type']
-			probe2type = settings['probe_types']['probe2type']
 			# Add new probe profiles to ADC Object
-			adc_device.SetProfiles(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type])
-
-		adc_data = {}
-		adc_data = adc_device.ReadAllPorts()
-
-		# Test temperature data returned for errors (+/- 20% Temp Variance), and average the data since last reading
-		AvgGT.enqueue(adc_data['GrillTemp'])
-		AvgP1.enqueue(adc_data['Probe1Temp'])
-		AvgP2.enqueue(adc_data['Probe2Temp'])
-
-		in_data = {}
-		in_data['GrillTemp'] = AvgGT.average()
-		in_data['GrillSetPoint'] = control['setpoints']['grill']
-		in_data['Probe1Temp'] = AvgP1.average()
-		in_data['Probe1SetPoint'] = control['setpoints']['probe1']
-		in_data['Probe2Temp'] = AvgP2.average()
-		in_data['Probe2SetPoint'] = control['setpoints']['probe2']
-		in_data['GrillTr'] = adc_data['GrillTr']  # For Temp Resistance Tuning
-		in_data['Probe1Tr'] = adc_data['Probe1Tr']  # For Temp Resistance Tuning
-		in_data['Probe2Tr'] = adc_data['Probe2Tr']  # For Temp Resistance Tuning
+			adc_device.SetProfiles(*GetProbeProfiles(settings))
+			# Get new probe filters
+			ProbeFilters = CreateProbeFilters(settings)
+
+		# Read, filter and average all probe channels
+		in_data, adc_data = ReadProbes(adc_device, ProbeFilters, AvgTemps, control, clock.time())
 
 		# Check to see if there are any pending notifications (i.e. Timer / Temperature Settings)
 		control = CheckNotify(in_data, control, settings, pelletdb)
@@ -639,13 +672,16 @@ def Monitor(grill_platform, adc_device, display_device, dist_device):
 		# Update Display Device after 1 second has passed 
 		if(now - displaytoggletime > 1):
 			status_data = GetStatus(grill_platform, control, settings, pelletdb)
-			display_device.DisplayStatus(in_data, status_data)
+			display_device.DisplayStatus(LegacyProbeData(in_data), status_data)
 			displaytoggletime = now 
 
 		# Write History after 3 seconds has passed
 		if (now - temptoggletime > 3):
 			temptoggletime = now 
 			WriteHistory(in_data, tuning_mode=control['tuning_mode'])
+			WriteBusStats(GetBusStats())
+			WriteRelayStats(grill_platform.GetRelayStats())
+			UpdateMqtt(control, pelletdb, in_data)
 
 		# Safety Control Section
 		if (AvgGT.average() > settings['safety']['maxtemp']):
@@ -660,7 +696,7 @@ def Monitor(grill_platform, adc_device, display_device, dist_device):
 			WriteControl(control)
 			SendNotifications("Grill_Error_01", control, settings, pelletdb)
 
-		time.sleep(0.05)
+		clock.sleep(0.05)
 
 	event = 'Monitor mode ended.'
 	WriteLog(event)
@@ -687,28 +723,22 @@ def Manual_Mode(grill_platform, adc_device, display_device, dist_device):
 	grill_platform.IgniterOff()
 	grill_platform.FanOff()
 	grill_platform.PowerOff()
+	pellet_model.Stop()
 
-	# Initialize all temperature variables
-	AvgGT = TempQueue(units=settings['globals']['units'])
-	AvgP1 = TempQueue(units=settings['globals']['units'])
-	AvgP2 = TempQueue(units=settings['globals']['units'])
+	# Initialize all temperature variables (one average per probe channel, the grill, probe 1 and probe 2 are always present)
+	AvgTemps = [TempQueue(units=settings['globals']['units']) for probe_profile in GetProbeProfiles(settings)]
+	AvgGT = AvgTemps[0]  # Grill probe, used by the control logic
 
 	# Collect Initial Temperature Information
-	# Get Probe Types From Settings
-	grill0type = settings['probe_types']['grill0type']
-	probe1type = settings['probe_types']['probe1type']
-	probe2type = settings['probe_types']['probe2type']
-
-	adc_device.SetProfiles(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type])
+	# Get Probe Profiles From Settings
+	adc_device.SetProfiles(*GetProbeProfiles(settings))
 
-	adc_data = {}
-	adc_data = adc_device.ReadAllPorts()
+	# Per probe filters applied before averaging
+	ProbeFilters = CreateProbeFilters(settings)
 
-	AvgGT.enqueue(adc_data['GrillTemp'])
-	AvgP1.enqueue(adc_data['Probe1Temp'])
-	AvgP2.enqueue(adc_data['Probe2Temp'])
+	ReadProbes(adc_device, ProbeFilters, AvgTemps, control, clock.time())
 
-	now = time.time()
+	now = clock.time()
 
 	# Set time since toggle for temperature
 	temptoggletime = now
@@ -722,7 +752,7 @@ def Manual_Mode(grill_platform, adc_device, display_device, dist_device):
 	status = 'Active'
 
 	while(status == 'Active'):
-		now = time.time()
+		now = clock.time()
 		# Check for update in control status every 0.5 seconds 
 		if (now - controlchecktime > 0.5):
 			control = ReadControl()
@@ -750,6 +780,9 @@ def Manual_Mode(grill_platform, adc_device, display_device, dist_device):
 		# Get current grill output status
 		current_output_status = grill_platform.GetOutputStatus()
 
+		# Integrate the auger on time for the pellet consumption model
+		pellet_model.Update(current_output_status['auger'] == AUGERON, now)
+
 		if(control['manual']['change'] == True):
 			if(control['manual']['fan'] == True) and (current_output_status['fan'] == FANOFF):
 				grill_platform.FanOn()
@@ -780,52 +813,39 @@ def Manual_Mode(grill_platform, adc_device, display_device, dist_device):
 			settings = ReadSettings()
 			control['probe_profile_update'] = False
 			WriteControl(control)
-			# Get new probe profiles
-			grill0type = settings['probe_types']['grill0type']
-			probe1type = settings['probe_types']['probe1type']
-			probe2type = settings['probe_types']['probe2type']
 			# Add new probe profiles to ADC Object
-			adc_device.SetProfiles(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type])
-
-		adc_data = {}
-		adc_data = adc_device.ReadAllPorts()
-
-		# Test temperature data returned for errors (+/- 20% Temp Variance), and average the data since last reading
-		AvgGT.enqueue(adc_data['GrillTemp'])
-		AvgP1.enqueue(adc_data['Probe1Temp'])
-		AvgP2.enqueue(adc_data['Probe2Temp'])
-
-		in_data = {}
-		in_data['GrillTemp'] = AvgGT.average()
-		in_data['GrillSetPoint'] = control['setpoints']['grill']
-		in_data['Probe1Temp'] = AvgP1.average()
-		in_data['Probe1SetPoint'] = control['setpoints']['probe1']
-		in_data['Probe2Temp'] = AvgP2.average()
-		in_data['Probe2SetPoint'] = control['setpoints']['probe2']
-		in_data['GrillTr'] = adc_data['GrillTr']  # For Temp Resistance Tuning
-		in_data['Probe1Tr'] = adc_data['Probe1Tr']  # For Temp Resistance Tuning
-		in_data['Probe2Tr'] = adc_data['Probe2Tr']  # For Temp Resistance Tuning
+			adc_device.SetProfiles(*GetProbeProfiles(settings))
+			# Get new probe filters
+			ProbeFilters = CreateProbeFilters(settings)
+
+		# Read, filter and average all probe channels
+		in_data, adc_data = ReadProbes(adc_device, ProbeFilters, AvgTemps, control, clock.time())
 
 		# Update Display Device after 1 second has passed 
 		if(now - displaytoggletime > 1):
 			status_data = GetStatus(grill_platform, control, settings, pelletdb)
-			display_device.DisplayStatus(in_data, status_data)
+			display_device.DisplayStatus(LegacyProbeData(in_data), status_data)
 			displaytoggletime = now 
 
 		control = CheckNotify(in_data, control, settings, pelletdb)
 
 		# Write History after 3 seconds has passed
 		if (now - temptoggletime > 3):
-			temptoggletime = time.time()
+			temptoggletime = clock.time()
 			WriteHistory(in_data, tuning_mode=control['tuning_mode'])
+			WriteBusStats(GetBusStats())
+			WriteRelayStats(grill_platform.GetRelayStats())
+			UpdateMqtt(control, pelletdb, in_data)
+			WritePelletModel(pellet_model.GetPrediction(now))
 
-		time.sleep(0.2)
+		clock.sleep(0.2)
 
 	# Clean-up and Exit
 	grill_platform.AugerOff()
 	grill_platform.IgniterOff()
 	grill_platform.FanOff()
 	grill_platform.PowerOff()
+	pellet_model.Stop()
 
 	event = 'Manual mode ended.'
 	WriteLog(event)
@@ -876,257 +896,287 @@ def Recipe_Mode(grill_platform, adc_device, display_device, dist_device):
 	return()
 
 # ******************************
-# Send Pushover Notifications
+# Notification Message Templates
 # ******************************
 
-def SendPushoverNotification(notifyevent, control, settings, pelletdb):
-	now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
-
-	unit = settings['globals']['units']
-
-	if "Grill_Temp_Achieved" in notifyevent:
-		notifymessage = "The Grill setpoint of " + str(control['setpoints']['grill']) + unit + " was achieved at " + str(now)
-		subjectmessage = "Grill at " + str(control['setpoints']['grill']) + unit + " at " + str(now)
-	elif "Probe1_Temp_Achieved" in notifyevent:
-		notifymessage = "The Probe 1 setpoint of " + str(control['setpoints']['probe1']) + unit + " was achieved at " + str(now)
-		subjectmessage = "Probe 1 at " + str(control['setpoints']['probe1']) + unit + " at " + str(now)
-	elif "Probe2_Temp_Achieved" in notifyevent:
-		notifymessage = "The Probe 2 setpoint of " + str(control['setpoints']['probe2']) + unit + " was achieved at " + str(now)
-		subjectmessage = "Probe 2 at " + str(control['setpoints']['probe2']) + unit + " at " + str(now)
-	elif "Timer_Expired" in notifyevent:
-		notifymessage = "Your grill timer has expired, time to check your cook!"
-		subjectmessage = "Grill Timer Complete: " + str(now)
-	elif "Pellet_Level_Low" in notifyevent:
-		notifymessage = "Your pellet level is currently at " + str(pelletdb['current']['hopper_level']) + "%"
-		subjectmessage = "Low Pellet Level"
-	elif "Grill_Error_00" in notifyevent:
-		notifymessage = "Your grill has experienced an error and will shutdown now. " + str(now)
-		subjectmessage = "Grill Error!"
-	elif "Grill_Error_01" in notifyevent:
-		notifymessage = "Grill exceed maximum temperature limit of " + str(settings['safety']['maxtemp']) + unit + "! Shutting down." + str(now)
-		subjectmessage = "Grill Error!"
-	elif "Grill_Error_02" in notifyevent:
-		notifymessage = "Grill temperature dropped below minimum startup temperature of " + str(control['safety']['startuptemp']) + unit + "! Shutting down to prevent firepot overload." + str(now)
-		subjectmessage = "Grill Error!"
-	elif "Grill_Warning" in notifyevent:
-		notifymessage = "Your grill has experienced a warning condition.  Please check the logs."  + str(now)
-		subjectmessage = "Grill Warning!"
-	else:
-		notifymessage = "Whoops! PiFire had the following unhandled notify event: " + notifyevent + " at " + now
-		subjectmessage = "PiFire: Unknown Notification at " + str(now)
-
-	url = 'https://api.pushover.net/1/messages.json'
-	for user in settings['pushover']['UserKeys'].split(','):
-		try:
-			r = requests.post(url, data={
-				"token": settings['pushover']['APIKey'],
-				"user": user.strip(),
-				"message": notifymessage,
-				"title": subjectmessage,
-				"url": settings['pushover']['PublicURL']
-			})
-			if(settings['globals']['debug_mode'] == True):
-				event = '* Pushover Response: ' + r.text
-				print(event)
-				WriteLog(event)
-			WriteLog(subjectmessage + ". Pushover notification sent to: " + user.strip())
+# Message text for each notify event, rendered once per event (see RenderNotification) and shared by all providers
+#  subject / message: Pushover and Pushbullet
+#  title / body / sound / channel: Firebase
+#  ifttt: IFTTT value1 (None if the event isn't sent to IFTTT)
+NOTIFY_TEMPLATES = {
+	'Grill_Temp_Achieved' : {
+		'subject' : 'Grill at {grill}{unit} at {now}',
+		'message' : 'The Grill setpoint of {grill}{unit} was achieved at {now}',
+		'title' : 'Grill Setpoint Achieved',
+		'body' : 'Grill setpoint of {grill}{unit} achieved at {time} on {day}',
+		'sound' : 'temp_achieved',
+		'channel' : 'pifire_temp_alerts',
+		'ifttt' : '{grill}'
+	},
+	'Probe1_Temp_Achieved' : {
+		'subject' : 'Probe 1 at {probe1}{unit} at {now}',
+		'message' : 'The Probe 1 setpoint of {probe1}{unit} was achieved at {now}',
+		'title' : 'Probe 1 Setpoint Achieved',
+		'body' : 'Probe 1 setpoint of {probe1}{unit} achieved at {time} on {day}',
+		'sound' : 'temp_achieved',
+		'channel' : 'pifire_temp_alerts',
+		'ifttt' : '{probe1}'
+	},
+	'Probe2_Temp_Achieved' : {
+		'subject' : 'Probe 2 at {probe2}{unit} at {now}',
+		'message' : 'The Probe 2 setpoint of {probe2}{unit} was achieved at {now}',
+		'title' : 'Probe 2 Setpoint Achieved',
+		'body' : 'Probe 2 setpoint of {probe2}{unit} achieved at {time} on {day}',
+		'sound' : 'temp_achieved',
+		'channel' : 'pifire_temp_alerts',
+		'ifttt' : '{probe2}'
+	},
+	'Timer_Expired' : {
+		'subject' : 'Grill Timer Complete: {now}',
+		'message' : 'Your grill timer has expired, time to check your cook!',
+		'title' : 'Grill Timer Complete',
+		'body' : 'Your grill timer has expired, time to check your cook!',
+		'sound' : 'timer_alarm',
+		'channel' : 'pifire_timer_alerts',
+		'ifttt' : 'Your grill timer has expired.'
+	},
+	'Pellet_Empty_Predicted' : {
+		'subject' : 'Low Pellet Level',
+		'message' : 'Your pellets are predicted to run out in {time_to_empty} (currently at {hopper_level}%)',
+		'title' : 'Low Pellet Level',
+		'body' : 'Your pellets are predicted to run out in {time_to_empty} (currently at {hopper_level}%)',
+		'sound' : 'pellet_alarm',
+		'channel' : 'pifire_pellet_alerts',
+		'ifttt' : 'Pellets predicted to run out in {time_to_empty}'
+	},
+	'Pellet_Level_Low' : {
+		'subject' : 'Low Pellet Level',
+		'message' : 'Your pellet level is currently at {hopper_level}%',
+		'title' : 'Low Pellet Level',
+		'body' : 'Your pellet level is currently at {hopper_level}%',
+		'sound' : 'pellet_alarm',
+		'channel' : 'pifire_pellet_alerts',
+		'ifttt' : 'Pellet level currently at {hopper_level}%'
+	},
+	'Grill_Error_00' : {
+		'subject' : 'Grill Error!',
+		'message' : 'Your grill has experienced an error and will shutdown now. {now}',
+		'title' : 'Grill Error!',
+		'body' : 'Your grill has experienced an error and will shutdown now. {short_now}',
+		'sound' : 'grill_error',
+		'channel' : 'pifire_error_alerts',
+		'ifttt' : 'Your grill has experienced an error and will shutdown now. '
+	},
+	'Grill_Error_01' : {
+		'subject' : 'Grill Error!',
+		'message' : 'Grill exceed maximum temperature limit of {maxtemp}{unit}! Shutting down.{now}',
+		'title' : 'Grill Error!',
+		'body' : 'Grill exceded maximum temperature limit of {maxtemp}{unit}! Shutting down.{short_now}',
+		'sound' : 'grill_error',
+		'channel' : 'pifire_error_alerts',
+		'ifttt' : '{maxtemp}'
+	},
+	'Grill_Error_02' : {
+		'subject' : 'Grill Error!',
+		'message' : 'Grill temperature dropped below minimum startup temperature of {startuptemp}{unit}! Shutting down to prevent firepot overload.{now}',
+		'title' : 'Grill Error!',
+		'body' : 'Grill temperature dropped below minimum startup temperature of {startuptemp}{unit}! Shutting down to prevent firepot overload.{short_now}',
+		'sound' : 'grill_error',
+		'channel' : 'pifire_error_alerts',
+		'ifttt' : '{startuptemp}'
+	},
+	'Grill_Warning' : {
+		'subject' : 'Grill Warning!',
+		'message' : 'Your grill has experienced a warning condition.  Please check the logs.{now}',
+		'title' : 'Grill Warning!',
+		'body' : 'Your grill has experienced a warning condition. Please check the logs.{short_now}',
+		'sound' : 'grill_error',
+		'channel' : 'pifire_error_alerts',
+		'ifttt' : 'General Warning.'
+	}
+}
+
+NOTIFY_UNKNOWN = {
+	'subject' : 'PiFire: Unknown Notification at {now}',
+	'message' : 'Whoops! PiFire had the following unhandled notify event: {event} at {now}',
+	'title' : 'PiFire: Unknown Notification issue',
+	'body' : 'Whoops! PiFire had the following unhandled notify event: {event} at {short_now}',
+	'sound' : 'default',
+	'channel' : 'default',
+	'ifttt' : None
+}
+
+def RenderNotification(notifyevent, control, settings, pelletdb):
+	# Returns the message text of the notify event for all providers
+	date = datetime.datetime.now()
+	fields = {
+		'event' : notifyevent,
+		'now' : date.strftime('%Y-%m-%d %H:%M'),
+		'short_now' : date.strftime('%m-%d %H:%M'),
+		'time' : date.strftime('%H:%M'),
+		'day' : date.strftime('%m/%d'),
+		'unit' : settings['globals']['units'],
+		'grill' : control['setpoints']['grill'],
+		'probe1' : control['setpoints']['probe1'],
+		'probe2' : control['setpoints']['probe2'],
+		'maxtemp' : settings['safety']['maxtemp'],
+		'startuptemp' : control['safety']['startuptemp'],
+		'hopper_level' : pelletdb['current']['hopper_level']
+	}
+	templates = NOTIFY_UNKNOWN
+	for event, event_templates in NOTIFY_TEMPLATES.items():
+		if event in notifyevent:
+			templates = event_templates
+			break
+	if '{time_to_empty}' in templates['message']:
+		fields['time_to_empty'] = PredictedEmptyMessage()
 
-		except Exception as e:
-			WriteLog("WARNING: Pushover Notification to %s failed: %s" % (user, e))
-		except:
-			WriteLog("WARNING: Pushover Notification to %s failed for unknown reason." % (user))
+	rendered = {}
+	for key, template in templates.items():
+		if template is None:
+			rendered[key] = None
+		else:
+			rendered[key] = template.format(**fields)
+	return(rendered)
 
 # ******************************
-# Send Pushbullet Notifications
+# Notification Queue and Policy
 # ******************************
 
-def SendPushBulletNotification(notifyevent, control, settings, pelletdb):
-	now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
-
-	unit = settings['globals']['units']
-	if "Grill_Temp_Achieved" in notifyevent:
-		notifymessage = "The Grill setpoint of " + str(control['setpoints']['grill']) + unit + " was achieved at " + str(now)
-		subjectmessage = "Grill at " + str(control['setpoints']['grill']) + unit + " at " + str(now)
-	elif "Probe1_Temp_Achieved" in notifyevent:
-		notifymessage = "The Probe 1 setpoint of " + str(control['setpoints']['probe1']) + unit + " was achieved at " + str(now)
-		subjectmessage = "Probe 1 at " + str(control['setpoints']['probe1']) + unit + " at " + str(now)
-	elif "Probe2_Temp_Achieved" in notifyevent:
-		notifymessage = "The Probe 2 setpoint of " + str(control['setpoints']['probe2']) + unit + " was achieved at " + str(now)
-		subjectmessage = "Probe 2 at " + str(control['setpoints']['probe2']) + unit + " at " + str(now)
-	elif "Timer_Expired" in notifyevent:
-		notifymessage = "Your grill timer has expired, time to check your cook!"
-		subjectmessage = "Grill Timer Complete: " + str(now)
-	elif "Pellet_Level_Low" in notifyevent:
-		notifymessage = "Your pellet level is currently at " + str(pelletdb['current']['hopper_level']) + "%"
-		subjectmessage = "Low Pellet Level"
-	elif "Grill_Error_00" in notifyevent:
-		notifymessage = "Your grill has experienced an error and will shutdown now. " + str(now)
-		subjectmessage = "Grill Error!"
-	elif "Grill_Error_01" in notifyevent:
-		notifymessage = "Grill exceed maximum temperature limit of " + str(settings['safety']['maxtemp']) + unit + "! Shutting down." + str(now)
-		subjectmessage = "Grill Error!"
-	elif "Grill_Error_02" in notifyevent:
-		notifymessage = "Grill temperature dropped below minimum startup temperature of " + str(control['safety']['startuptemp']) + unit + "! Shutting down to prevent firepot overload." + str(now)
-		subjectmessage = "Grill Error!"
-	elif "Grill_Warning" in notifyevent:
-		notifymessage = "Your grill has experienced a warning condition.  Please check the logs."  + str(now)
-		subjectmessage = "Grill Warning!"
-	else:
-		notifymessage = "Whoops! PiFire had the following unhandled notify event: " + notifyevent + " at " + now
-		subjectmessage = "PiFire: Unknown Notification at " + str(now)
-
-	api_key = settings['pushbullet']['APIKey']
-	pushbullet_link = settings['pushbullet']['PublicURL']
+def GetNotifyQueue():
+	# Created on first use, so importing control.py (i.e. benchmark.py) doesn't start the delivery threads or resend the spool
+	global notify_queue
+	if notify_queue is None:
+		notify_queue = NotifyQueue()
+	return(notify_queue)
 
-	try:
-		pb = Pushbullet(api_key)
-		pb.push_link(subjectmessage, pushbullet_link, notifymessage)
-		WriteLog("Pushbullet Notification Success: " + subjectmessage)
-	except:
-		WriteLog("Pushbullet Notification Failed: " + subjectmessage)
+def GetNotifyPolicy():
+	# Created on first use with the control clock, and again if the clock is replaced (i.e. by benchmark.py for each simulation)
+	global notify_policy
+	if (notify_policy is None) or (notify_policy.clock is not clock):
+		notify_policy = NotifyPolicy(DeliverNotifications, clock=clock)
+	return(notify_policy)
 
 # ******************************
-# Send Firebase Notifications
+# Send Pushover Notifications
 # ******************************
 
-def SendFirebaseNotification(notifyevent, control, settings, pelletdb):
-	date = datetime.datetime.now()
-	now = date.strftime('%m-%d %H:%M')
-	time = date.strftime('%H:%M')
-	day = date.strftime('%m/%d')
-
-	unit = settings['globals']['units']
-
-	if "Grill_Temp_Achieved" in notifyevent:
-		titlemessage = "Grill Setpoint Achieved"
-		bodymessage = "Grill setpoint of " + str(control['setpoints']['grill']) + unit + " achieved at " + str(time) + " on " + str(day)
-		sound = 'temp_achieved'
-		channel = 'pifire_temp_alerts'
-	elif "Probe1_Temp_Achieved" in notifyevent:
-		titlemessage = "Probe 1 Setpoint Achieved"
-		bodymessage = "Probe 1 setpoint of " + str(control['setpoints']['probe1']) + unit + " achieved at " + str(time) + " on " + str(day)
-		sound = 'temp_achieved'
-		channel = 'pifire_temp_alerts'
-	elif "Probe2_Temp_Achieved" in notifyevent:
-		titlemessage = "Probe 2 Setpoint Achieved"
-		bodymessage = "Probe 2 setpoint of " + str(control['setpoints']['probe2']) + unit + " achieved at " + str(time) + " on " + str(day)
-		sound = 'temp_achieved'
-		channel = 'pifire_temp_alerts'
-	elif "Timer_Expired" in notifyevent:
-		titlemessage = "Grill Timer Complete"
-		bodymessage = "Your grill timer has expired, time to check your cook!"
-		sound = 'timer_alarm'
-		channel = 'pifire_timer_alerts'
-	elif "Pellet_Level_Low" in notifyevent:
-		titlemessage = "Low Pellet Level"
-		bodymessage = "Your pellet level is currently at " + str(pelletdb['current']['hopper_level']) + "%"
-		sound = 'pellet_alarm'
-		channel = 'pifire_pellet_alerts'
-	elif "Grill_Error_00" in notifyevent:
-		titlemessage = "Grill Error!"
-		bodymessage = "Your grill has experienced an error and will shutdown now. " + str(now)
-		sound = 'grill_error'
-		channel = 'pifire_error_alerts'
-	elif "Grill_Error_01" in notifyevent:
-		titlemessage = "Grill Error!"
-		bodymessage = "Grill exceded maximum temperature limit of " + str(settings['safety']['maxtemp']) + "F! Shutting down." + str(now)
-		sound = 'grill_error'
-		channel = 'pifire_error_alerts'
-	elif "Grill_Error_02" in notifyevent:
-		titlemessage = "Grill Error!"
-		bodymessage = "Grill temperature dropped below minimum startup temperature of " + str(control['safety']['startuptemp']) + unit + "! Shutting down to prevent firepot overload." + str(now)
-		sound = 'grill_error'
-		channel = 'pifire_error_alerts'
-	elif "Grill_Warning" in notifyevent:
-		titlemessage = "Grill Warning!"
-		bodymessage = "Your grill has experienced a warning condition. Please check the logs."  + str(now)
-		sound = 'grill_error'
-		channel = 'pifire_error_alerts'
-	else:
-		titlemessage = "PiFire: Unknown Notification issue"
-		bodymessage = "Whoops! PiFire had the following unhandled notify event: " + notifyevent + " at " + str(now)
-		sound = 'default'
-		channel = 'default'
+def SendPushoverNotification(notifyevent, rendered, settings):
+	url = 'https://api.pushover.net/1/messages.json'
+	for user in settings['pushover']['UserKeys'].split(','):
+		GetNotifyQueue().Enqueue('pushover', rendered['subject'] + " (" + user.strip() + ")", url, data={
+			"token": settings['pushover']['APIKey'],
+			"user": user.strip(),
+			"message": rendered['message'],
+			"title": rendered['subject'],
+			"url": settings['pushover']['PublicURL']
+		})
+
+# ******************************
+# Send Pushbullet Notifications
+# ******************************
 
-	server_url = settings['firebase']['ServerUrl']
-	device_uuid = settings['firebase']['uuid']
+def SendPushBulletNotification(notifyevent, rendered, settings):
+	# Same request as push_link() of the pushbullet.py module, sent from the notification queue
+	url = 'https://api.pushbullet.com/v2/pushes'
+	GetNotifyQueue().Enqueue('pushbullet', rendered['subject'], url, json_data={
+		"type": "link",
+		"title": rendered['subject'],
+		"url": settings['pushbullet']['PublicURL'],
+		"body": rendered['message']
+	}, auth=(settings['pushbullet']['APIKey'], ''))
 
-	headers = {
-        'Content-Type': 'application/json'
-      }
+# ******************************
+# Send Firebase Notifications
+# ******************************
 
+def SendFirebaseNotification(notifyevent, rendered, settings):
 	body = {
-		'uuid': device_uuid,
-		'title': titlemessage,
-		'message': bodymessage,
-		'sound': sound,
-		'channel': channel,
+		'uuid': settings['firebase']['uuid'],
+		'title': rendered['title'],
+		'message': rendered['body'],
+		'sound': rendered['sound'],
+		'channel': rendered['channel'],
 		'priority': 'high',
 		'ttl': 3600
 	}
-
-	response = requests.post(server_url, headers=headers, data=json.dumps(body))
-
-	if(response.status_code == 200):
-		WriteLog("Firebase Notification Success: " + titlemessage)
-	else:
-		WriteLog("FirebaseNotification Failed: " + titlemessage)
-
-	if(settings['modules']['grillplat'] == 'prototype'):
-		print(response.status_code)
-		print(response.json())
+	GetNotifyQueue().Enqueue('firebase', rendered['title'], settings['firebase']['ServerUrl'], json_data=body)
 
 # ******************************
 # Send IFTTT Notifications
 # ******************************
 
-def SendIFTTTNotification(notifyevent, control, settings, pelletdb):
-
-	if "Grill_Temp_Achieved" in notifyevent:
-		query_args = { "value1" : str(control['setpoints']['grill']) }
-	elif "Probe1_Temp_Achieved" in notifyevent:
-		query_args = { "value1" : str(control['setpoints']['probe1']) }
-	elif "Probe2_Temp_Achieved" in notifyevent:
-		query_args = { "value1" : str(control['setpoints']['probe2']) }
-	elif "Timer_Expired" in notifyevent:
-		query_args = { "value1" : 'Your grill timer has expired.' }
-	elif "Pellet_Level_Low" in notifyevent:
-		query_args = { "value1" : 'Pellet level currently at ' + str(pelletdb['current']['hopper_level']) + '%' }
-	elif "Grill_Error_00" in notifyevent:
-		query_args = { "value1" : 'Your grill has experienced an error and will shutdown now. ' }
-	elif "Grill_Error_01" in notifyevent:
-		query_args = { "value1" : str(settings['safety']['maxtemp']) }
-	elif "Grill_Error_02" in notifyevent:
-		query_args = { "value1" : str(control['safety']['startuptemp']) }
-	elif "Grill_Warning" in notifyevent:
-		query_args = { "value1" : 'General Warning.' }
-	else:
+def SendIFTTTNotification(notifyevent, rendered, settings):
+	if rendered['ifttt'] is None:
 		WriteLog("IFTTT Notification Failed: Unhandled notify event.")
 		return()
 
-	key = settings['ifttt']['APIKey']
-	url = 'https://maker.ifttt.com/trigger/' + notifyevent + '/with/key/' + key
-
-	try:
-		r = requests.post(url, data=query_args)
-		WriteLog("IFTTT Notification Success: " + r.text)
-	except:
-		WriteLog("IFTTT Notification Failed: " + r.text)
+	url = 'https://maker.ifttt.com/trigger/' + notifyevent + '/with/key/' + settings['ifttt']['APIKey']
+	GetNotifyQueue().Enqueue('ifttt', notifyevent, url, data={ "value1" : rendered['ifttt'] })
 
 # ******************************
 # Send Notifications
 # ******************************
 
 def SendNotifications(notifyevent, control, settings, pelletdb):
+	ifttt_enabled = (settings['ifttt']['APIKey'] != '' and settings['ifttt']['enabled'] == True)
+	pushbullet_enabled = (settings['pushbullet']['APIKey'] != '' and settings['pushbullet']['enabled'] == True)
+	pushover_enabled = (settings['pushover']['APIKey'] != '' and settings['pushover']['UserKeys'] != '' and settings['pushover']['enabled'] == True)
+	firebase_enabled = (settings['firebase']['ServerUrl'] != '' and settings['firebase']['enabled'] == True)
+	if not (ifttt_enabled or pushbullet_enabled or pushover_enabled or firebase_enabled):
+		return()
+
+	# Cooldown / hysteresis (see notify_policy.py)
+	if not GetNotifyPolicy().Allow(notifyevent):
+		return()
+
+	rendered = RenderNotification(notifyevent, control, settings, pelletdb)
+	# Held for the coalescing window, then sent with DeliverNotifications()
+	GetNotifyPolicy().Submit(notifyevent, {'rendered' : rendered, 'settings' : settings})
+
+def DeliverNotifications(batch):
+	# Send the notifications held in the coalescing window, batch is a list of (notifyevent, message)
+	settings = batch[-1][1]['settings']
+	events = [notifyevent for notifyevent, message in batch]
+	rendered = MergeNotifications([message['rendered'] for notifyevent, message in batch])
 
 	if(settings['ifttt']['APIKey'] != '' and settings['ifttt']['enabled'] == True):
-		SendIFTTTNotification(notifyevent, control, settings, pelletdb)
+		# IFTTT applets are triggered per event, so these aren't merged
+		for notifyevent, message in batch:
+			SendIFTTTNotification(notifyevent, message['rendered'], settings)
 	if(settings['pushbullet']['APIKey'] != '' and settings['pushbullet']['enabled'] == True):
-		SendPushBulletNotification(notifyevent, control, settings, pelletdb)
+		SendPushBulletNotification(','.join(events), rendered, settings)
 	if(settings['pushover']['APIKey'] != '' and settings['pushover']['UserKeys'] != '' and settings['pushover']['enabled'] == True):
-		SendPushoverNotification(notifyevent, control, settings, pelletdb)
+		SendPushoverNotification(','.join(events), rendered, settings)
 	if(settings['firebase']['ServerUrl'] != '' and settings['firebase']['enabled'] == True):
-		SendFirebaseNotification(notifyevent, control, settings, pelletdb)
+		SendFirebaseNotification(','.join(events), rendered, settings)
+
+def MergeNotifications(rendered_list):
+	# Merge several rendered notifications into one message
+	if len(rendered_list) == 1:
+		return(rendered_list[0])
+
+	def Unique(values):
+		unique = []
+		for value in values:
+			if value not in unique:
+				unique.append(value)
+		return(unique)
+
+	# Use the sound / channel of the most important notification
+	channel_order = ['pifire_error_alerts', 'pifire_pellet_alerts', 'pifire_timer_alerts', 'pifire_temp_alerts', 'default']
+	first = min(rendered_list, key=lambda rendered: channel_order.index(rendered['channel']) if rendered['channel'] in channel_order else len(channel_order))
+
+	merged = {
+		'subject' : ' / '.join(Unique([rendered['subject'] for rendered in rendered_list])),
+		'message' : '\n'.join([rendered['message'] for rendered in rendered_list]),
+		'title' : ' / '.join(Unique([rendered['title'] for rendered in rendered_list])),
+		'body' : '\n'.join([rendered['body'] for rendered in rendered_list]),
+		'sound' : first['sound'],
+		'channel' : first['channel'],
+		'ifttt' : None
+	}
+	return(merged)
 
 # ******************************
 # Check for any pending notifications
@@ -1135,7 +1185,7 @@ def SendNotifications(notifyevent, control, settings, pelletdb):
 def CheckNotify(in_data, control, settings, pelletdb):
 
 	if (control['notify_req']['grill'] == True):
-		if (in_data['GrillTemp'] >= control['setpoints']['grill']):
+		if (in_data['Temps'][0] >= control['setpoints']['grill']):
 			#control = ReadControl()  # Read Modify Write
 			control['notify_req']['grill'] = False
 			WriteControl(control)
@@ -1144,11 +1194,11 @@ def CheckNotify(in_data, control, settings, pelletdb):
 			WriteLog(notify_event)
 
 	if (control['notify_req']['probe1']):
-		if (in_data['Probe1Temp'] >= control['setpoints']['probe1']):
+		if (in_data['Temps'][1] >= control['setpoints']['probe1']):
 			SendNotifications("Probe1_Temp_Achieved", control, settings, pelletdb)
 			#control = ReadControl()  # Read Modify Write
 			control['notify_req']['probe1'] = False
-			if(control['notify_data']['p1_shutdown'] == True)and((control['mode'] == 'Smoke')or(control['mode'] == 'Hold')or(control['mode'] == 'Startup')or(control['mode'] == 'Reignite')):
+			if(control['notify_data']['p1_shutdown'] == True)and((control['mode'] == 'Smoke')or(control['mode'] == 'Hold')or(control['mode'] == 'Autotune')or(control['mode'] == 'Startup')or(control['mode'] == 'Reignite')):
 				control['mode'] = 'Shutdown'
 				control['updated'] = True
 				control['notify_data']['p1_shutdown'] = False
@@ -1157,11 +1207,11 @@ def CheckNotify(in_data, control, settings, pelletdb):
 			WriteLog(notify_event)
 
 	if (control['notify_req']['probe2']):
-		if (in_data['Probe2Temp'] >= control['setpoints']['probe2']):
+		if (in_data['Temps'][2] >= control['setpoints']['probe2']):
 			SendNotifications("Probe2_Temp_Achieved", control, settings, pelletdb)
 			#control = ReadControl()  # Read Modify Write
 			control['notify_req']['probe2'] = False
-			if(control['notify_data']['p2_shutdown'] == True)and((control['mode'] == 'Smoke')or(control['mode'] == 'Hold')or(control['mode'] == 'Startup')or(control['mode'] == 'Reignite')):
+			if(control['notify_data']['p2_shutdown'] == True)and((control['mode'] == 'Smoke')or(control['mode'] == 'Hold')or(control['mode'] == 'Autotune')or(control['mode'] == 'Startup')or(control['mode'] == 'Reignite')):
 				control['mode'] = 'Shutdown'
 				control['updated'] = True
 				control['notify_data']['p2_shutdown'] = False
@@ -1170,10 +1220,10 @@ def CheckNotify(in_data, control, settings, pelletdb):
 			WriteLog(notify_event)
 
 	if (control['notify_req']['timer']):
-		if (time.time() >= control['timer']['end']):
+		if (clock.time() >= control['timer']['end']):
 			SendNotifications("Timer_Expired", control, settings, pelletdb)
 			#control = ReadControl()  # Read Modify Write
-			if(control['notify_data']['timer_shutdown'] == True)and((control['mode'] == 'Smoke')or(control['mode'] == 'Hold')or(control['mode'] == 'Startup')or(control['mode'] == 'Reignite')):
+			if(control['notify_data']['timer_shutdown'] == True)and((control['mode'] == 'Smoke')or(control['mode'] == 'Hold')or(control['mode'] == 'Autotune')or(control['mode'] == 'Startup')or(control['mode'] == 'Reignite')):
 				control['mode'] = 'Shutdown'
 				control['updated'] = True
 			control['notify_req']['timer'] = False
@@ -1192,9 +1242,78 @@ def CheckNotify(in_data, control, settings, pelletdb):
 def CheckNotifyPellets(control, settings, pelletdb):
 
 	if (settings['pelletlevel']['warning_enabled'] == True):
-		if (pelletdb['current']['hopper_level'] <= settings['pelletlevel']['warning_level']):
+		time_to_empty = None
+		if pellet_model.IsActive(clock.time()):
+			time_to_empty = pellet_model.TimeToEmpty()
+
+		# Each warning is sent once, and re-armed when the hopper is refilled (see notify_policy.py)
+		warning_level = settings['pelletlevel']['warning_level']
+		level_low = GetNotifyPolicy().CheckThreshold("Pellet_Level_Low", pelletdb['current']['hopper_level'], warning_level, warning_level + PELLET_LEVEL_HYSTERESIS)
+
+		if (time_to_empty != None):
+			# Once the feed rate of these pellets is known, warn on the predicted time until the hopper is empty
+			warning_time = settings['pelletlevel']['warning_time'] * 60
+			if GetNotifyPolicy().CheckThreshold("Pellet_Empty_Predicted", time_to_empty, warning_time, warning_time * PREDICTED_EMPTY_HYSTERESIS):
+				SendNotifications("Pellet_Empty_Predicted", control, settings, pelletdb)
+		elif level_low:
 			SendNotifications("Pellet_Level_Low", control, settings, pelletdb)
 
+def PredictedEmptyMessage():
+	# Returns the predicted time until the hopper is empty as text
+	time_to_empty = pellet_model.TimeToEmpty()
+	if time_to_empty == None:
+		return('Unknown')
+	return(str(int(time_to_empty // 3600)) + 'h ' + str(int((time_to_empty % 3600) // 60)) + 'm')
+
+# ******************************
+# Save new hopper level readings
+# ******************************
+
+def UpdateHopperLevel(dist_device, pelletdb, settings):
+	# Returns the pellet database, with the latest hopper level from the hopper sampler (if there is a new reading)
+	level = dist_device.GetNew()
+	if level is None:
+		return(pelletdb)
+
+	pelletdb = ReadPelletDB()
+	update_db = False
+	if (pelletdb['current']['hopper_level'] != level):
+		pelletdb['current']['hopper_level'] = level
+		update_db = True
+
+	# Learn the feed rate of the current pellets from the drop in level vs. auger on time, using the median
+	#  level (the smoothed level lags behind after a refill or mode change, which would bias the rate low)
+	pelletid = pelletdb['current']['pelletid']
+	pellet_model.SetPellets(pelletid, pelletdb['feed_rates'])
+	if pellet_model.Reading(dist_device.GetMedian()):
+		pelletdb['feed_rates'][pelletid] = pellet_model.GetFeedRate()
+		update_db = True
+
+	if (update_db):
+		WritePelletDB(pelletdb)
+	if(settings['globals']['debug_mode'] == True):
+		event = "* Hopper Level Checked @ " + str(level) + "%"
+		print(event)
+		WriteLog(event)
+	return(pelletdb)
+
+# ******************************
+# Publish the grill status to MQTT
+# ******************************
+
+def UpdateMqtt(control, pelletdb, in_data=None):
+	# Applies any settings changed on the settings page since the last update (i.e. a new broker), then publishes the changes
+	global mqtt_settings_version
+	if mqtt_publisher is None:
+		return()
+
+	settings_version = ReadVersions(['settings'])[0][0]
+	if settings_version != mqtt_settings_version:
+		mqtt_settings_version = settings_version
+		mqtt_publisher.Configure(ReadSettings())
+
+	mqtt_publisher.Update(control, pelletdb, in_data)
+
 # *****************************************
 # Main Program Start / Init
 # *****************************************
@@ -1203,11 +1322,14 @@ def CheckNotifyPellets(control, settings, pelletdb):
 
 settings = ReadSettings()
 
-outpins = settings['outpins']
-inpins = settings['inpins']
+# Pellet consumption model, shared by the control modes
+pellet_model = PelletModel()
+notify_queue = None  # Notifications are delivered in the background (see GetNotifyQueue)
+notify_policy = None  # Notification cooldowns, hysteresis and coalescing (see GetNotifyPolicy)
+mqtt_publisher = None  # Publishes the grill status to MQTT (if enabled), started by the control program
+mqtt_settings_version = None  # Version of the settings last applied to the MQTT publisher
+
 triggerlevel = settings['globals']['triggerlevel']
-buttonslevel = settings['globals']['buttonslevel']
-units = settings['globals']['units']
 
 if triggerlevel == 'LOW':
 	AUGERON = 0
@@ -1228,211 +1350,259 @@ else:
 	POWERON = 1
 	POWEROFF = 0
 
-# Initialize Grill Platform Object
-grill_platform = GrillPlatform(outpins, inpins, triggerlevel)
+# Time source for all control loops (replaced with a SimulatedClock when running a simulation)
+clock = SystemClock()
 
-# If powering on, check the on/off switch and set grill power appropriately.
-last = grill_platform.GetInputStatus()
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='PiFire control program.')
+	parser.add_argument('-s','--simspeed',type=float, help='Run the control loops on a simulated clock at this multiple of real time (prototype grill platform only, 0 = as fast as possible).',required=False)
+	args = parser.parse_args()
 
-if(last == 0):
-	grill_platform.PowerOn()
-else:
-	grill_platform.PowerOff()
+	if(args.simspeed is not None):
+		if(settings['modules']['grillplat'] == 'prototype'):
+			clock = SimulatedClock(speed=args.simspeed)
+			event = 'Simulation Mode: Running control loops at ' + str(args.simspeed) + 'x real time.'
+			print(event)
+			WriteLog(event)
+		else:
+			print('Simulation speed is only supported with the prototype grill platform.  Ignoring.')
 
-# Start display device object and display splash
-if(str(settings['modules']['display']).endswith('b')):	
-	display_device = Display(buttonslevel=buttonslevel, units=units)
-else:
-	display_device = Display(units=units)
+	outpins = settings['outpins']
+	inpins = settings['inpins']
+	buttonslevel = settings['globals']['buttonslevel']
+	units = settings['globals']['units']
 
-grill0type = settings['probe_types']['grill0type']
-probe1type = settings['probe_types']['probe1type']
-probe2type = settings['probe_types']['probe2type']
+	# Initialize Grill Platform Object
+	grill_platform = GrillPlatform(outpins, inpins, triggerlevel, clock=clock)
 
-# Start ADC object and set profiles
-adc_device = ReadADC(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type], units=settings['globals']['units'])
+	# If powering on, check the on/off switch and set grill power appropriately.
+	last = grill_platform.GetInputStatus()
 
-pelletdb = ReadPelletDB()
+	if(last == 0):
+		grill_platform.PowerOn()
+	else:
+		grill_platform.PowerOff()
 
-# Start Distance Sensor Object for Hopper
-if(settings['modules']['grillplat'] == 'prototype') and (settings['modules']['dist'] == 'prototype'):
-	# If in prototype mode, enable test reading (i.e. random values from proto distance sensor)
-	dist_device = HopperLevel(settings['pelletlevel']['empty'], settings['pelletlevel']['full'], test=True)
-else:
-	dist_device = HopperLevel(settings['pelletlevel']['empty'], settings['pelletlevel']['full'])
-
-# Get current hopper level and save it to the current pellet information
-pelletdb['current']['hopper_level'] = dist_device.GetLevel()
-WritePelletDB(pelletdb)
-if(settings['globals']['debug_mode'] == True):
-	event = "* Hopper Level Checked @ " + str(pelletdb['current']['hopper_level']) + "%"
-	print(event)
-	WriteLog(event)
+	# Start display device object and display splash
+	if(str(settings['modules']['display']).endswith('b')):	
+		display_device = Display(buttonslevel=buttonslevel, units=units)
+	else:
+		display_device = Display(units=units)
 
-#  Flush Redis DB and create JSON structure
-control = ReadControl(flush=True)
-#  Delete Redis DB for history / current
-ReadHistory(0, flushhistory=True)
-event = 'Flushing Redis DB and creating new control structure'
-WriteLog(event)
+	grill0type = settings['probe_types']['grill0type']
+	probe1type = settings['probe_types']['probe1type']
+	probe2type = settings['probe_types']['probe2type']
 
-#  Create /logs/event.log file
-event = 'Control Script Starting Up.'
-WriteLog(event)
+	# Start ADC object and set profiles
+	if(settings['modules']['adc'] == 'simulator'):
+		# The simulator is driven by the grill platform outputs and runs on the control clock
+		adc_device = ReadADC(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type], units=settings['globals']['units'], grill_platform=grill_platform, clock=clock)
+	elif(settings['modules']['adc'] == 'ads1115'):
+		# Continuous conversion in a background thread per device, at the configured data rate and gain
+		adc_device = ReadADC(*GetProbeProfiles(settings), units=settings['globals']['units'], sps=settings['ads1115']['sps'], pga=settings['ads1115']['pga'], rdy_pin=settings['ads1115']['rdy_pin'], oversample=settings['ads1115']['oversample'], buffer_size=settings['ads1115']['buffer_size'], fault_hold=settings['ads1115']['fault_hold'], addresses=settings['ads1115']['addresses'])
+	else:
+		adc_device = ReadADC(settings['probe_settings']['probe_profiles'][grill0type], settings['probe_settings']['probe_profiles'][probe1type], settings['probe_settings']['probe_profiles'][probe2type], units=settings['globals']['units'])
 
+	pelletdb = ReadPelletDB()
 
-# *****************************************
-# Main Program Loop
-# *****************************************
+	# Start Distance Sensor Object for Hopper
+	if(settings['modules']['grillplat'] == 'prototype') and (settings['modules']['dist'] == 'prototype'):
+		# If in prototype mode, enable test reading (i.e. random values from proto distance sensor)
+		dist_device = HopperLevel(settings['pelletlevel']['empty'], settings['pelletlevel']['full'], test=True)
+	else:
+		dist_device = HopperLevel(settings['pelletlevel']['empty'], settings['pelletlevel']['full'])
 
-while True:
+	# Read the hopper level in the background, so the control loops never wait on the distance sensor
+	dist_device = HopperSampler(dist_device, sample_interval=settings['pelletlevel']['sample_interval'], median_n=settings['pelletlevel']['median_n'], alpha=settings['pelletlevel']['alpha'], clock=clock)
 
-	# Check the On/Off switch for changes
-	if (last != grill_platform.GetInputStatus()):
-		last = grill_platform.GetInputStatus()
-		if(last == 1):
-			event = 'Switch set to off, going to stop mode.'
-			WriteLog(event)
-			#control = ReadControl()  # Read Modify Write
-			control['updated'] = True # Change mode
-			control['mode'] == 'Stop'
-			WriteControl(control)
+	# Get current hopper level and save it to the current pellet information
+	dist_device.WaitFirst()
+	pelletdb = UpdateHopperLevel(dist_device, pelletdb, settings)
 
-	display_device.EventDetect()
+	#  Flush Redis DB and create JSON structure
+	control = ReadControl(flush=True)
+	WriteRelayStats(grill_platform.GetRelayStats())
+	#  Delete Redis DB for history / current
+	ReadHistory(0, flushhistory=True)
+	event = 'Flushing Redis DB and creating new control structure'
+	WriteLog(event)
 
-	# 1. Check control.json for commands
-	control = ReadControl()
+	#  Create /logs/event.log file
+	event = 'Control Script Starting Up.'
+	WriteLog(event)
 
-	if (control['hopper_check'] == True):
-		pelletdb = ReadPelletDB()
-		# Get current hopper level and save it to the current pellet information
-		pelletdb['current']['hopper_level'] = dist_device.GetLevel()
-		WritePelletDB(pelletdb)
-		if(settings['globals']['debug_mode'] == True):
-			event = "* Hopper Level Checked @ " + str(pelletdb['current']['hopper_level']) + "%"
-			print(event)
-			WriteLog(event)
-		#control = ReadControl()  # Read Modify Write
-		control['hopper_check'] = False
-		WriteControl(control)
+	# Start the notification queue, which resends any notifications left undelivered at the last exit
+	GetNotifyQueue()
 
-	if (control['updated'] == True):
-		if(settings['globals']['debug_mode'] == True):
-			event = "* Updated Flag Captured."
-			print(event)
-			WriteLog(event)
-		# Clear control flag
-		control['updated'] = False # Reset Control Updated to False to acknowledge
-		WriteControl(control) # Commit change in 'updated' status to the file 
+	# Connect to the MQTT broker (if enabled)
+	mqtt_publisher = MqttPublisher(settings)
 
-		if(control['units_change']):
-			if(settings['globals']['debug_mode'] == True):
-				event = "Changing Base Units."
-				print(event)
-				WriteLog(event)
-			settings = ReadSettings()
-			# Update ADC object and set profiles
-			adc_device.update_units(settings['globals']['units'])
-			control['mode'] = 'Stop'  # Stop any activity
-			control['units_change'] = False 
-			ReadHistory(0, flushhistory=True)  # Clear history data 
-
-		# Check if there was an Error flagged in Monitor Mode - If no, then change status to active
-		if(control['status'] != 'monitor') and (control['mode'] != 'Error'):
-			control['status'] = 'active' # Set status to active
-			WriteControl(control)
 
-		if (control['mode'] == 'Stop') or (control['mode'] == 'Error'):
-			grill_platform.AugerOff()
-			grill_platform.IgniterOff()
-			grill_platform.FanOff()
-			if(control['status'] == 'monitor') and (control['mode'] == 'Error'):
-				grill_platform.PowerOn()
-			else:
-				grill_platform.PowerOff()
-			if(control['mode'] == 'Stop'):
-				display_device.ClearDisplay() # When in error mode, leave the display showing ERROR
-				control['status'] = 'inactive'
-				event = "Stop Mode Started."
-				# Reset Control to Defaults
-				control = ReadControl(flush=True)
-				control['updated'] = False
-				control['tuning_mode'] = False  # Turn off Tuning Mode on Stop just in case it is on
-				WriteControl(control)
-			else:
-				event = "ERROR: An error has occured, Stop Mode enabled."
-				# Reset Control to Defaults but preserve 'Error' mode condition
-				control = DefaultControl()
-				control['mode'] = 'Error'
-				control['status'] = 'inactive'
-				control['tuning_mode'] = False  # Turn off Tuning Mode on Stop just in case it is on
-				control['updated'] = False
-				WriteControl(control)
+	# *****************************************
+	# Main Program Loop
+	# *****************************************
 
-			ReadCurrent(zero_out=True)  # Zero out the current values
+	# Supervisor stops the control program with SIGTERM, exit through the clean-up below
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-			WriteLog(event)
+	try:
+		while True:
 
-		#	Startup (startup sequence)
-		elif (control['mode'] == 'Startup'):
-			if(grill_platform.GetInputStatus() == 1):
-				event = "Warning: PiFire is set to OFF. This doesn't prevent startup, but this means the switch won't behave as normal."
-				WriteLog(event)
-			settings = ReadSettings()
-			if(settings['history_page']['clearhistoryonstart'] == True):
-				if(settings['globals']['debug_mode'] == True):
-					event = '* Clearing History and Current Log on Startup Mode.'
-					print(event)
+			# Check the On/Off switch for changes
+			if (last != grill_platform.GetInputStatus()):
+				last = grill_platform.GetInputStatus()
+				if(last == 1):
+					event = 'Switch set to off, going to stop mode.'
 					WriteLog(event)
-				ReadHistory(0, flushhistory=True)  # Clear all history 
-			WorkCycle('Startup', grill_platform, adc_device, display_device, dist_device)
-			control = ReadControl()
-			# If mode is Startup, then assume you can transition into smoke mode
-			if(control['mode'] == 'Startup'):
-				control['mode'] = 'Smoke' # Set status to active
-				WriteControl(control)
-				WorkCycle('Smoke', grill_platform, adc_device, display_device, dist_device)
-		#	Smoke (smoke cycle)
-		elif (control['mode'] == 'Smoke'):
-			WorkCycle('Smoke', grill_platform, adc_device, display_device, dist_device)
-		#	Hold (hold at setpoint)
-		elif (control['mode'] == 'Hold'):
-			WorkCycle('Hold', grill_platform, adc_device, display_device, dist_device)
-		#	Shutdown (shutdown sequence)
-		elif (control['mode'] == 'Shutdown'):
-			WorkCycle('Shutdown', grill_platform, adc_device, display_device, dist_device)
+					#control = ReadControl()  # Read Modify Write
+					control['updated'] = True # Change mode
+					control['mode'] == 'Stop'
+					WriteControl(control)
+
+			display_device.EventDetect()
+
+			# 1. Check control.json for commands
 			control = ReadControl()
-			if(control['mode'] == 'Shutdown'):
-				control['mode'] = 'Stop' # Set mode to Stop
-				control['updated'] = True
+
+			if (control['hopper_check'] == True):
+				dist_device.Trigger()
+				#control = ReadControl()  # Read Modify Write
+				control['hopper_check'] = False
 				WriteControl(control)
-		#	e. Monitor (monitor the OEM controller)
-		elif (control['mode'] == 'Monitor'):
-			control['status'] = 'monitor' # Set status to monitor
-			WriteControl(control)
-			Monitor(grill_platform, adc_device, display_device, dist_device)
-		elif (control['mode'] == 'Manual'):
-			Manual_Mode(grill_platform, adc_device, display_device, dist_device)
-		elif (control['mode'] == 'Recipe'):
-			Recipe_Mode(grill_platform, adc_device, display_device, dist_device)
-		#	Reignite (reignite sequence)
-		elif (control['mode'] == 'Reignite'):
-			if(grill_platform.GetInputStatus() == 1):
-				event = "Warning: PiFire is set to OFF. This doesn't prevent reignite, but this means the switch won't behave as normal."
-				WriteLog(event)
-			WorkCycle('Reignite', grill_platform, adc_device, display_device, dist_device)
-			control = ReadControl()
-			lastmode = control['safety']['reignitelaststate']
-			if(lastmode == 'Hold'):
-				control['mode'] = 'Hold' # Set status to active
-			else:
-				control['mode'] = 'Smoke' # Set status to active
-			WriteControl(control)
-			WorkCycle(control['mode'], grill_platform, adc_device, display_device, dist_device)
 
-	time.sleep(0.1)
-	# ===================
-	# End of Main Loop
-	# ===================
+			pelletdb = UpdateHopperLevel(dist_device, pelletdb, settings)
+			UpdateMqtt(control, pelletdb)
+
+			if (control['updated'] == True):
+				if(settings['globals']['debug_mode'] == True):
+					event = "* Updated Flag Captured."
+					print(event)
+					WriteLog(event)
+				# Clear control flag
+				control['updated'] = False # Reset Control Updated to False to acknowledge
+				WriteControl(control) # Commit change in 'updated' status to the file 
+				grill_platform.FlushRelayStats()  # The previous mode has ended
+				WriteRelayStats(grill_platform.GetRelayStats())
+
+				if(control['units_change']):
+					if(settings['globals']['debug_mode'] == True):
+						event = "Changing Base Units."
+						print(event)
+						WriteLog(event)
+					settings = ReadSettings()
+					# Update ADC object and set profiles
+					adc_device.update_units(settings['globals']['units'])
+					control['mode'] = 'Stop'  # Stop any activity
+					control['units_change'] = False 
+					ReadHistory(0, flushhistory=True)  # Clear history data 
+
+				# Check if there was an Error flagged in Monitor Mode - If no, then change status to active
+				if(control['status'] != 'monitor') and (control['mode'] != 'Error'):
+					control['status'] = 'active' # Set status to active
+					WriteControl(control)
+
+				if (control['mode'] == 'Stop') or (control['mode'] == 'Error'):
+					grill_platform.AugerOff()
+					grill_platform.IgniterOff()
+					grill_platform.FanOff()
+					if(control['status'] == 'monitor') and (control['mode'] == 'Error'):
+						grill_platform.PowerOn()
+					else:
+						grill_platform.PowerOff()
+					if(control['mode'] == 'Stop'):
+						display_device.ClearDisplay() # When in error mode, leave the display showing ERROR
+						control['status'] = 'inactive'
+						event = "Stop Mode Started."
+						# Reset Control to Defaults
+						control = ReadControl(flush=True)
+						control['updated'] = False
+						control['tuning_mode'] = False  # Turn off Tuning Mode on Stop just in case it is on
+						WriteControl(control)
+					else:
+						event = "ERROR: An error has occured, Stop Mode enabled."
+						# Reset Control to Defaults but preserve 'Error' mode condition
+						control = DefaultControl()
+						control['mode'] = 'Error'
+						control['status'] = 'inactive'
+						control['tuning_mode'] = False  # Turn off Tuning Mode on Stop just in case it is on
+						control['updated'] = False
+						WriteControl(control)
+
+					ReadCurrent(zero_out=True)  # Zero out the current values
+
+					WriteLog(event)
 
-exit()
+				#	Startup (startup sequence)
+				elif (control['mode'] == 'Startup'):
+					if(grill_platform.GetInputStatus() == 1):
+						event = "Warning: PiFire is set to OFF. This doesn't prevent startup, but this means the switch won't behave as normal."
+						WriteLog(event)
+					settings = ReadSettings()
+					if(settings['history_page']['clearhistoryonstart'] == True):
+						if(settings['globals']['debug_mode'] == True):
+							event = '* Clearing History and Current Log on Startup Mode.'
+							print(event)
+							WriteLog(event)
+						ReadHistory(0, flushhistory=True)  # Clear all history 
+					WorkCycle('Startup', grill_platform, adc_device, display_device, dist_device)
+					control = ReadControl()
+					# If mode is Startup, then assume you can transition into smoke mode
+					if(control['mode'] == 'Startup'):
+						control['mode'] = 'Smoke' # Set status to active
+						WriteControl(control)
+						WorkCycle('Smoke', grill_platform, adc_device, display_device, dist_device)
+				#	Smoke (smoke cycle)
+				elif (control['mode'] == 'Smoke'):
+					WorkCycle('Smoke', grill_platform, adc_device, display_device, dist_device)
+				#	Hold (hold at setpoint)
+				elif (control['mode'] == 'Hold'):
+					WorkCycle('Hold', grill_platform, adc_device, display_device, dist_device)
+				#	Autotune (relay feedback experiment to estimate the PID parameters)
+				elif (control['mode'] == 'Autotune'):
+					WorkCycle('Autotune', grill_platform, adc_device, display_device, dist_device)
+				#	Shutdown (shutdown sequence)
+				elif (control['mode'] == 'Shutdown'):
+					WorkCycle('Shutdown', grill_platform, adc_device, display_device, dist_device)
+					control = ReadControl()
+					if(control['mode'] == 'Shutdown'):
+						control['mode'] = 'Stop' # Set mode to Stop
+						control['updated'] = True
+						WriteControl(control)
+				#	e. Monitor (monitor the OEM controller)
+				elif (control['mode'] == 'Monitor'):
+					control['status'] = 'monitor' # Set status to monitor
+					WriteControl(control)
+					Monitor(grill_platform, adc_device, display_device, dist_device)
+				elif (control['mode'] == 'Manual'):
+					Manual_Mode(grill_platform, adc_device, display_device, dist_device)
+				elif (control['mode'] == 'Recipe'):
+					Recipe_Mode(grill_platform, adc_device, display_device, dist_device)
+				#	Reignite (reignite sequence)
+				elif (control['mode'] == 'Reignite'):
+					if(grill_platform.GetInputStatus() == 1):
+						event = "Warning: PiFire is set to OFF. This doesn't prevent reignite, but this means the switch won't behave as normal."
+						WriteLog(event)
+					WorkCycle('Reignite', grill_platform, adc_device, display_device, dist_device)
+					control = ReadControl()
+					lastmode = control['safety']['reignitelaststate']
+					if(lastmode == 'Hold') or (lastmode == 'Autotune'):
+						control['mode'] = 'Hold' # Set status to active
+					else:
+						control['mode'] = 'Smoke' # Set status to active
+					WriteControl(control)
+					WorkCycle(control['mode'], grill_platform, adc_device, display_device, dist_device)
+
+			clock.sleep(0.1)
+			# ===================
+			# End of Main Loop
+			# ===================
+	finally:
+		# Save the relay statistics which haven't been flushed yet
+		grill_platform.FlushRelayStats()
+		# Save the notifications which haven't been delivered yet
+		if notify_queue is not None:
+			notify_queue.Stop()
+		# Set MQTT availability offline
+		mqtt_publisher.Stop()
+
+	exit()
@@ -17,11 +17,14 @@ from luma.oled.device import ssd1306
 from PIL import Image, ImageDraw, ImageFont
 import datetime
 import time
+from i2c_arbiter import ArbitratedBus, PRIORITY_DISPLAY
 
 class Display:
 
 	def __init__(self, units='F'):
 		self.serial = i2c(port=1, address=0x3C)
+		# Share the I2C bus with the ADC and distance sensor (each block transfer is one arbitrated transaction)
+		self.serial._bus = ArbitratedBus(self.serial._bus, 'ssd1306', PRIORITY_DISPLAY)
 		self.device = ssd1306(self.serial)
 		# Set Display Width and Height.  Modify for your needs.   
 		self.WIDTH = 128
@@ -17,6 +17,7 @@ from luma.oled.device import ssd1306
 from PIL import Image, ImageDraw, ImageFont
 import datetime
 import time
+from i2c_arbiter import ArbitratedBus, PRIORITY_DISPLAY
 from RPi import GPIO
 from common import ReadControl, WriteControl  # Common Library for WebUI and Control Program
 
@@ -24,6 +25,8 @@ class Display:
 
 	def __init__(self, buttonslevel='HIGH', units='F'):
 		self.serial = i2c(port=1, address=0x3C)
+		# Share the I2C bus with the ADC and distance sensor (each block transfer is one arbitrated transaction)
+		self.serial._bus = ArbitratedBus(self.serial._bus, 'ssd1306', PRIORITY_DISPLAY)
 		self.device = ssd1306(self.serial)
 		self.menuactive = False
 		self.menutime = 0
@@ -20,6 +20,7 @@
 import VL53L0X
 import time 
 from common import WriteLog, ReadSettings
+from i2c_arbiter import ArbitratedBus, PRIORITY_DISTANCE
 
 class HopperLevel:
 
@@ -38,6 +39,8 @@ class HopperLevel:
 	def __startsensor(self):
 		# Create a VL53L0X object as tof (time-of-flight)
 		self.tof = VL53L0X.VL53L0X(i2c_bus=1,i2c_address=0x29)
+		# Share the I2C bus with the ADC and display (the sensor library calls back into this bus for each register access)
+		self.tof._i2c = ArbitratedBus(self.tof._i2c, 'vl53l0x', PRIORITY_DISTANCE)
 		# Open Sensor
 		self.tof.open()
 		# Start ranging
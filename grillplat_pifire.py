@@ -16,10 +16,11 @@
 # *****************************************
 
 import RPi.GPIO as GPIO
+from relay_stats import RelayStats
 
 class GrillPlatform:
 
-	def __init__(self, outpins, inpins, triggerlevel='LOW'):
+	def __init__(self, outpins, inpins, triggerlevel='LOW', clock=None):
 		self.outpins = outpins # { 'power' : 4, 'auger' : 14, 'fan' : 15, 'igniter' : 18 }
 		self.inpins = inpins # { 'selector' : 17 }
 		if triggerlevel == 'LOW': 
@@ -46,35 +47,49 @@ class GrillPlatform:
 			GPIO.setup(self.outpins['fan'], GPIO.OUT, initial=self.RELAY_OFF)
 			GPIO.setup(self.outpins['auger'], GPIO.OUT, initial=self.RELAY_OFF)
 
+		# Output on time / switch counters (flushed to disk periodically)
+		self.relay_stats = RelayStats(['power', 'auger', 'fan', 'igniter'], clock=clock)
+		self.relay_stats.Switch('power', GPIO.input(self.outpins['power']) == self.RELAY_ON)
+
 	def AugerOn(self):
 		GPIO.output(self.outpins['auger'], self.RELAY_ON)
+		self.relay_stats.Switch('auger', True)
 
 	def AugerOff(self):
 		GPIO.output(self.outpins['auger'], self.RELAY_OFF)
+		self.relay_stats.Switch('auger', False)
 
 	def FanOn(self):
 		GPIO.output(self.outpins['fan'], self.RELAY_ON)
+		self.relay_stats.Switch('fan', True)
 
 	def FanOff(self):
 		GPIO.output(self.outpins['fan'], self.RELAY_OFF)
+		self.relay_stats.Switch('fan', False)
 
 	def FanToggle(self):
 		if(GPIO.input(self.outpins['fan']) == self.RELAY_ON):
 			GPIO.output(self.outpins['fan'], self.RELAY_OFF)
+			self.relay_stats.Switch('fan', False)
 		else:
 			GPIO.output(self.outpins['fan'], self.RELAY_ON)
+			self.relay_stats.Switch('fan', True)
 
 	def IgniterOn(self):
 		GPIO.output(self.outpins['igniter'], self.RELAY_ON)
+		self.relay_stats.Switch('igniter', True)
 
 	def IgniterOff(self):
 		GPIO.output(self.outpins['igniter'], self.RELAY_OFF)
+		self.relay_stats.Switch('igniter', False)
 
 	def PowerOn(self):
 		GPIO.output(self.outpins['power'], self.RELAY_ON)
+		self.relay_stats.Switch('power', True)
 
 	def PowerOff(self):
 		GPIO.output(self.outpins['power'], self.RELAY_OFF)
+		self.relay_stats.Switch('power', False)
 
 	def GetInputStatus(self):
 		return (GPIO.input(self.inpins['selector']))
@@ -84,3 +99,9 @@ class GrillPlatform:
 		for item in self.outpins:
 			self.current[item] = GPIO.input(self.outpins[item])
 		return self.current
+
+	def GetRelayStats(self):
+		return self.relay_stats.GetStats()
+
+	def FlushRelayStats(self):
+		self.relay_stats.Flush()
@@ -9,9 +9,15 @@
 #
 # *****************************************
 
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+from relay_stats import RelayStats
+
 class GrillPlatform:
 
-	def __init__(self, outpins, inpins, triggerlevel='LOW'):
+	def __init__(self, outpins, inpins, triggerlevel='LOW', clock=None):
 		self.outpins = outpins # { 'power' : 4, 'auger' : 14, 'fan' : 15, 'igniter' : 18 }
 		self.inpins = inpins # { 'selector' : 17 }
 		if triggerlevel == 'LOW': 
@@ -29,35 +35,49 @@ class GrillPlatform:
 		self.outpins['power'] = self.RELAY_ON
 		self.inpins['selector'] = self.RELAY_ON
 
+		# Output on time / switch counters (flushed to disk periodically)
+		self.relay_stats = RelayStats(['power', 'auger', 'fan', 'igniter'], clock=clock)
+		self.relay_stats.Switch('power', True)
+
 	def AugerOn(self):
 		self.outpins['auger'] = self.RELAY_ON
+		self.relay_stats.Switch('auger', True)
 
 	def AugerOff(self):
 		self.outpins['auger'] = self.RELAY_OFF
+		self.relay_stats.Switch('auger', False)
 
 	def FanOn(self):
 		self.outpins['fan'] = self.RELAY_ON
+		self.relay_stats.Switch('fan', True)
 
 	def FanOff(self):
 		self.outpins['fan'] = self.RELAY_OFF
+		self.relay_stats.Switch('fan', False)
 
 	def FanToggle(self):
 		if(self.outpins['fan'] == self.RELAY_ON):
 			self.outpins['fan'] = self.RELAY_OFF
+			self.relay_stats.Switch('fan', False)
 		else:
 			self.outpins['fan'] = self.RELAY_ON
+			self.relay_stats.Switch('fan', True)
 
 	def IgniterOn(self):
 		self.outpins['igniter'] = self.RELAY_ON
+		self.relay_stats.Switch('igniter', True)
 
 	def IgniterOff(self):
 		self.outpins['igniter'] = self.RELAY_OFF
+		self.relay_stats.Switch('igniter', False)
 
 	def PowerOn(self):
 		self.outpins['power'] = self.RELAY_ON
+		self.relay_stats.Switch('power', True)
 
 	def PowerOff(self):
 		self.outpins['power'] = self.RELAY_OFF
+		self.relay_stats.Switch('power', False)
 
 	def GetInputStatus(self):
 		return (self.inpins['selector'])
@@ -70,3 +90,9 @@ class GrillPlatform:
 		for item in self.outpins:
 			self.current[item] = self.outpins[item]
 		return self.current
+
+	def GetRelayStats(self):
+		return self.relay_stats.GetStats()
+
+	def FlushRelayStats(self):
+		self.relay_stats.Flush()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Hopper Level Sampler
+# *****************************************
+#
+# Description: This library reads the hopper level from the distance sensor
+#  (distance_*.py HopperLevel) in a background thread, so the control loops
+#  never wait on the sensor.
+#
+#  A reading is taken every sample_interval seconds, or as soon as Trigger()
+#  is called (i.e. for a hopper_check request).  The readings are smoothed
+#  with a median of the last median_n readings (rejects single bad readings),
+#  followed by an exponential moving average (smoothing factor alpha).  A rise
+#  of more than refill_jump percent is treated as a refill, and restarts the
+#  smoothing from the new reading.  The default is the pellet model's
+#  REFILL_JUMP, so both see the same refills.
+#
+#  The latest level is published to Redis (control:hopper) with the time of
+#  the reading, and is returned by GetLevel() / GetNew().  GetMedian() returns
+#  the median without the moving average, which lags behind the actual level
+#  (used to learn the pellet feed rate).
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import threading
+from collections import deque
+from common import WriteLog, WriteHopper
+from clock import SystemClock
+from pellet_model import REFILL_JUMP
+
+class HopperSampler:
+
+	def __init__(self, dist_device, sample_interval=60, median_n=5, alpha=0.3, refill_jump=REFILL_JUMP, clock=None):
+		# clock: Time source for the reading times (SystemClock by default)
+		if clock is None:
+			clock = SystemClock()
+		self.clock = clock
+		self.dist_device = dist_device
+		self.sample_interval = max(sample_interval, 1)
+		self.alpha = min(max(alpha, 0.01), 1.0)
+		self.refill_jump = refill_jump
+		self.readings = deque(maxlen=max(int(median_n), 1))
+		self.estimate = None
+
+		self.lock = threading.Lock()
+		self.level = None
+		self.median = None
+		self.sample_time = 0
+		self.new_level = False
+		self.trigger = threading.Event()
+		self.sampled = threading.Event()  # Set once the first reading is available
+		self.running = True
+		self.thread = threading.Thread(target=self.Sample, daemon=True)
+		self.thread.start()
+
+	def Sample(self):
+		# Background thread: take a reading every sample_interval seconds or when triggered
+		while self.running:
+			try:
+				raw = self.dist_device.GetLevel()
+			except:
+				event = 'Warning: Error reading the hopper level from the distance sensor.'
+				WriteLog(event)
+				raw = None
+
+			if raw is not None:
+				level, median = self.Smooth(raw)
+				now = self.clock.time()
+				with self.lock:
+					self.level = level
+					self.median = median
+					self.sample_time = now
+					self.new_level = True
+				WriteHopper({'level' : level, 'median' : median, 'raw' : raw, 'time' : now})
+				self.sampled.set()
+
+			self.trigger.wait(timeout=self.sample_interval)
+			self.trigger.clear()
+
+	def Smooth(self, raw):
+		# Returns the smoothed level and the median of the recent readings
+		if (self.estimate is not None) and (raw - self.estimate > self.refill_jump):
+			# Hopper refilled, restart the smoothing
+			self.readings.clear()
+			self.estimate = None
+
+		self.readings.append(raw)
+		ordered = sorted(self.readings)
+		middle = len(ordered) // 2
+		if len(ordered) % 2:
+			median = ordered[middle]
+		else:
+			median = (ordered[middle - 1] + ordered[middle]) / 2
+
+		if self.estimate is None:
+			self.estimate = median
+		else:
+			self.estimate += self.alpha * (median - self.estimate)
+		return int(round(self.estimate)), median
+
+	def Trigger(self):
+		# Request an extra reading (returns immediately)
+		self.trigger.set()
+
+	def WaitFirst(self, timeout=5):
+		# Wait for the first reading, i.e. at startup
+		return self.sampled.wait(timeout=timeout)
+
+	def GetLevel(self):
+		# Returns the latest smoothed level (100 until the first reading is available)
+		with self.lock:
+			if self.level is None:
+				return 100
+			return self.level
+
+	def GetNew(self):
+		# Returns the latest smoothed level if there has been a reading since the last call, otherwise None
+		with self.lock:
+			if not self.new_level:
+				return None
+			self.new_level = False
+			return self.level
+
+	def GetMedian(self):
+		# Returns the median of the recent readings (None until the first reading is available)
+		with self.lock:
+			return self.median
+
+	def SetLevel(self, level=100):
+		return self.dist_device.SetLevel(level)
+
+	def Stop(self):
+		self.running = False
+		self.trigger.set()
+		self.thread.join(timeout=2)
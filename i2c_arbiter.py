@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire I2C Bus Arbiter
+# *****************************************
+#
+# Description: The ADC, the distance sensor and the display can share I2C
+#  bus 1.  This library serializes their transactions, so a display refresh
+#  can't interleave with an ADC register access or a distance reading.
+#
+#  When the bus is busy, waiting transactions are granted in priority order
+#  (ADC first, then the distance sensor, then the display), and in arrival
+#  order within the same priority.  Transactions are not preempted, so each
+#  device should only hold the bus for a single register access / block
+#  transfer (not while waiting for a conversion).
+#
+#  The wait time (bus busy) and transaction time (bus held) of each device
+#  are recorded, see GetBusStats().
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import threading
+import heapq
+import time
+
+# Transaction priorities (lower number is served first)
+PRIORITY_ADC = 0
+PRIORITY_DISTANCE = 1
+PRIORITY_DISPLAY = 2
+
+class BusArbiter:
+
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.busy = False
+		self.waiting = []  # Heap of (priority, sequence) tickets
+		self.sequence = 0
+		self.stats = {}
+
+	def Acquire(self, priority):
+		with self.condition:
+			self.sequence += 1
+			ticket = (priority, self.sequence)
+			heapq.heappush(self.waiting, ticket)
+			while self.busy or (self.waiting[0] != ticket):
+				self.condition.wait()
+			heapq.heappop(self.waiting)
+			self.busy = True
+
+	def Release(self):
+		with self.condition:
+			self.busy = False
+			self.condition.notify_all()
+
+	def Record(self, device, wait_time, busy_time, error):
+		with self.condition:
+			if device not in self.stats:
+				self.stats[device] = {
+					'transactions' : 0,
+					'errors' : 0,
+					'wait_total' : 0.0,
+					'wait_max' : 0.0,
+					'busy_total' : 0.0,
+					'busy_max' : 0.0
+				}
+			stats = self.stats[device]
+			stats['transactions'] += 1
+			if error:
+				stats['errors'] += 1
+			stats['wait_total'] += wait_time
+			stats['wait_max'] = max(stats['wait_max'], wait_time)
+			stats['busy_total'] += busy_time
+			stats['busy_max'] = max(stats['busy_max'], busy_time)
+
+	def GetStats(self):
+		# Returns the transaction count, error count and average / maximum wait and transaction times (ms) of each device
+		bus_stats = {}
+		with self.condition:
+			for device, stats in self.stats.items():
+				bus_stats[device] = {
+					'transactions' : stats['transactions'],
+					'errors' : stats['errors'],
+					'wait_avg_ms' : round(stats['wait_total'] * 1000 / stats['transactions'], 3),
+					'wait_max_ms' : round(stats['wait_max'] * 1000, 3),
+					'busy_avg_ms' : round(stats['busy_total'] * 1000 / stats['transactions'], 3),
+					'busy_max_ms' : round(stats['busy_max'] * 1000, 3)
+				}
+		return bus_stats
+
+	def ResetStats(self):
+		with self.condition:
+			self.stats = {}
+
+# All of the PiFire I2C devices are on bus 1
+_arbiter = BusArbiter()
+
+class BusTransaction:
+	# Context manager holding the bus for one transaction, i.e.
+	#   with BusTransaction('ads1115', PRIORITY_ADC):
+	#       bus.write_i2c_block_data(...)
+
+	def __init__(self, device, priority):
+		self.device = device
+		self.priority = priority
+
+	def __enter__(self):
+		self.requested = time.perf_counter()
+		_arbiter.Acquire(self.priority)
+		self.acquired = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		released = time.perf_counter()
+		_arbiter.Release()
+		_arbiter.Record(self.device, self.acquired - self.requested, released - self.acquired, exc_type is not None)
+		return False
+
+class ArbitratedBus:
+	# Wraps an SMBus style object, so that each method call is one arbitrated transaction
+
+	def __init__(self, bus, device, priority):
+		self._bus = bus
+		self._device = device
+		self._priority = priority
+
+	def __getattr__(self, name):
+		attribute = getattr(self._bus, name)
+		if not callable(attribute):
+			return attribute
+
+		def transaction(*args, **kwargs):
+			with BusTransaction(self._device, self._priority):
+				return attribute(*args, **kwargs)
+		return transaction
+
+def GetBusStats():
+	return _arbiter.GetStats()
+
+def ResetBusStats():
+	_arbiter.ResetStats()
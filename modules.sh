@@ -54,7 +54,7 @@ if [[ $GRILLPLAT = "PROTOTYPE" ]];then
     $SUDO python3 settings.py -g prototype
 fi
 
-ADC=$(whiptail --title "Select your ADC module to use." --radiolist "This module gets temperature data from the attached probes such as the RTD Grill Probe, the food probes, etc." 20 78 2 "ADS1115" "Standard ADC <- Default" ON "PROTOTYPE" "Prototype/Simulated (for test only)" OFF 3>&1 1>&2 2>&3)
+ADC=$(whiptail --title "Select your ADC module to use." --radiolist "This module gets temperature data from the attached probes such as the RTD Grill Probe, the food probes, etc." 20 78 3 "ADS1115" "Standard ADC <- Default" ON "PROTOTYPE" "Prototype/Simulated (for test only)" OFF "SIMULATOR" "Simulated Grill Model (for test only)" OFF 3>&1 1>&2 2>&3)
 
 if [[ $ADC = "ADS1115" ]];then
     $SUDO python3 settings.py -a ads1115
@@ -65,6 +65,10 @@ if [[ $ADC = "PROTOTYPE" ]];then
     $SUDO python3 settings.py -a prototype
 fi
 
+if [[ $ADC = "SIMULATOR" ]];then
+    $SUDO python3 settings.py -a simulator
+fi
+
 UNITS=$(whiptail --title "Select Temperature Units." --radiolist "Select the temperature units to use globally. (this can be changed later)" 20 78 2 "F" "Fahrenheit <- Default" ON "C" "Celsius" OFF 3>&1 1>&2 2>&3)
 
 if [[ $UNITS = "F" ]];then
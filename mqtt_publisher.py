@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire MQTT Publisher
+# *****************************************
+#
+# Description: This library publishes the grill status to an MQTT broker,
+#  so other systems on the network (i.e. home automation) can subscribe to
+#  changes instead of polling /api/current.
+#
+#  Topics (under settings['mqtt']['base_topic'], retained):
+#    temp/grill, temp/probe1, temp/probe2 (temp/probe3... for additional probes)
+#    setpoint/grill, setpoint/probe1, setpoint/probe2
+#    mode, status, hopper_level
+#    availability (online / offline, offline is set by the broker if the connection is lost)
+#
+#  A value is only published when it changes, and the temperatures / hopper
+#  level only when they move by more than the deadband (temp_deadband,
+#  hopper_deadband) since the last published value.  Everything is
+#  published again after a reconnect.
+#
+#  If commands_enabled is set, these command topics are accepted:
+#    command/mode: Startup, Smoke, Hold, Shutdown, Monitor or Stop (only
+#      the mode changes offered by the dash buttons in the current mode are
+#      accepted, see MODE_COMMANDS, and Hold needs a grill set point)
+#    command/setpoint/grill: Grill set point (applied in Hold mode)
+#    command/setpoint/probe1, command/setpoint/probe2: Probe set point
+#      notification (0 to cancel)
+#
+#  Configure() applies new settings, and reconnects if the broker settings
+#  changed.  Stop() publishes availability offline and disconnects.
+#
+#  Requires the paho-mqtt module (pip3 install paho-mqtt).
+#
+#  To check how a command is handled without a broker, run this library with
+#  the command topic (after command/) and payload.  The command is checked
+#  against the current control data, which is not changed:
+#
+#  $ python3 mqtt_publisher.py mode Hold
+#  $ python3 mqtt_publisher.py setpoint/grill 225
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+from common import ReadControl, WriteControl, WriteLog
+try:
+	import paho.mqtt.client as mqtt
+except ImportError:
+	mqtt = None
+
+COMMAND_MODES = ['Startup', 'Smoke', 'Hold', 'Shutdown', 'Monitor', 'Stop']
+MODE_COMMANDS = {  # Modes which can be commanded in each mode (the buttons shown on the dash)
+	'Stop' : ['Startup', 'Monitor', 'Stop'],
+	'Monitor' : ['Startup', 'Monitor', 'Stop'],
+	'Error' : ['Startup', 'Monitor', 'Stop'],
+	'Startup' : ['Startup', 'Smoke', 'Hold', 'Stop'],
+	'Reignite' : ['Startup', 'Smoke', 'Hold', 'Stop'],
+	'Smoke' : ['Smoke', 'Hold', 'Shutdown'],
+	'Hold' : ['Smoke', 'Hold', 'Shutdown'],
+	'Autotune' : ['Smoke', 'Hold', 'Shutdown'],
+	'Shutdown' : ['Smoke', 'Hold', 'Shutdown', 'Stop'],
+	'Manual' : ['Stop']
+}
+PROBE_NAMES = ['grill', 'probe1', 'probe2']
+CONNECTION_SETTINGS = ['enabled', 'host', 'port', 'username', 'password', 'base_topic', 'commands_enabled']  # Changes need a new connection
+
+class MqttPublisher:
+
+	def __init__(self, settings):
+		self.mqtt_settings = None
+		self.last = {}  # Last published value of each topic
+		self.connected = False
+		self.client = None
+		self.Configure(settings)
+
+	def Configure(self, settings):
+		# Apply the settings, and (re)connect if the broker settings changed
+		self.smoke_plus = settings['smoke_plus']['enabled']
+		self.maxtemp = settings['safety']['maxtemp']
+		mqtt_settings = dict(settings['mqtt'])
+		reconnect = (self.mqtt_settings is None) or any(mqtt_settings[key] != self.mqtt_settings[key] for key in CONNECTION_SETTINGS)
+		if not reconnect:
+			self.mqtt_settings = mqtt_settings  # i.e. new deadbands
+			return
+
+		self.Stop()
+		self.mqtt_settings = mqtt_settings
+		self.base_topic = self.mqtt_settings['base_topic'].strip('/')
+		self.last = {}
+
+		if not self.mqtt_settings['enabled']:
+			return
+		if mqtt is None:
+			WriteLog('WARNING: MQTT is enabled, but the paho-mqtt module is not installed.')
+			return
+
+		if hasattr(mqtt, 'CallbackAPIVersion'):
+			# paho-mqtt 2.x
+			self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+		else:
+			self.client = mqtt.Client()
+		if self.mqtt_settings['username'] != '':
+			self.client.username_pw_set(self.mqtt_settings['username'], self.mqtt_settings['password'])
+		self.client.will_set(self.Topic('availability'), 'offline', retain=True)
+		self.client.on_connect = self.OnConnect
+		self.client.on_disconnect = self.OnDisconnect
+		self.client.on_message = self.OnMessage
+		# Connects (and reconnects) in the background, so an unavailable broker doesn't hold up the control program
+		self.client.connect_async(self.mqtt_settings['host'], self.mqtt_settings['port'], keepalive=60)
+		self.client.loop_start()
+
+	def Topic(self, name):
+		return self.base_topic + '/' + name
+
+	def OnConnect(self, client, userdata, flags, rc):
+		if rc != 0:
+			WriteLog('WARNING: MQTT connection to ' + self.mqtt_settings['host'] + ' refused (' + str(rc) + ').')
+			return
+		WriteLog('MQTT connected to ' + self.mqtt_settings['host'] + '.')
+		self.connected = True
+		self.last = {}  # Publish everything again on the next update
+		client.publish(self.Topic('availability'), 'online', retain=True)
+		if self.mqtt_settings['commands_enabled']:
+			client.subscribe(self.Topic('command/#'))
+
+	def OnDisconnect(self, client, userdata, rc):
+		self.connected = False
+
+	def Publish(self, name, value, deadband=0):
+		# Publish the value if it changed by more than the deadband since it was last published
+		last = self.last.get(name)
+		if (last is not None) and (deadband > 0) and isinstance(value, (int, float)) and isinstance(last, (int, float)):
+			if abs(value - last) < deadband:
+				return
+		elif value == last:
+			return
+		self.client.publish(self.Topic(name), str(value), retain=True)
+		self.last[name] = value
+
+	def Update(self, control, pelletdb, in_data=None):
+		# Publish any changes (in_data: current temperatures, only available while a control mode is running)
+		if (self.client is None) or (not self.connected):
+			return
+
+		self.Publish('mode', control['mode'])
+		self.Publish('status', control['status'])
+		for name in PROBE_NAMES:
+			self.Publish('setpoint/' + name, control['setpoints'][name])
+		self.Publish('hopper_level', pelletdb['current']['hopper_level'], self.mqtt_settings['hopper_deadband'])
+
+		if in_data is not None:
+			for index, temp in enumerate(in_data['Temps']):
+				if index < len(PROBE_NAMES):
+					name = PROBE_NAMES[index]
+				else:
+					name = 'probe' + str(index)
+				self.Publish('temp/' + name, round(temp, 1), self.mqtt_settings['temp_deadband'])
+
+	def OnMessage(self, client, userdata, message):
+		command = message.topic[len(self.Topic('command/')):]
+		payload = message.payload.decode('utf-8', 'ignore').strip()
+		try:
+			self.HandleCommand(command, payload)
+		except Exception as e:
+			WriteLog('WARNING: MQTT command ' + command + ' failed: ' + str(e))
+
+	def HandleCommand(self, command, payload, dry_run=False):
+		# Returns True if the command was accepted (dry_run: check the command without writing the control data)
+		control = ReadControl()  # Read Modify Write
+		current_mode = control['mode']
+		rejected = self.ApplyCommand(control, command, payload)
+		if dry_run:
+			if rejected is None:
+				print('Accepted: ' + command + ' ' + payload + ' (mode ' + current_mode + ' -> ' + control['mode'] + ')')
+			else:
+				print('Rejected: ' + command + ' ' + payload + ' (' + rejected + ')')
+			return(rejected is None)
+		if rejected is not None:
+			WriteLog('WARNING: MQTT command ignored, ' + rejected + ': ' + command + ' ' + payload)
+			return(False)
+
+		WriteControl(control)
+		WriteLog('MQTT command: ' + command + ' ' + payload)
+		return(True)
+
+	def ApplyCommand(self, control, command, payload):
+		# Apply the command to control, returns None if accepted or the reason it was rejected
+		if command == 'mode':
+			modes = {mode.lower() : mode for mode in COMMAND_MODES}
+			if payload.lower() not in modes:
+				return('unknown mode')
+			mode = modes[payload.lower()]
+			if mode not in MODE_COMMANDS.get(control['mode'], []):
+				return(mode + ' is not allowed in ' + control['mode'] + ' mode')
+			if (mode == 'Hold') and (control['setpoints']['grill'] <= 0):
+				return('no grill set point for Hold')
+			control['mode'] = mode
+			control['updated'] = True
+			if mode in ['Smoke', 'Hold']:
+				control['s_plus'] = self.smoke_plus
+
+		elif command == 'setpoint/grill':
+			try:
+				set_point = int(float(payload))
+			except ValueError:
+				return('invalid set point')
+			if (set_point <= 0) or (set_point > self.maxtemp):
+				return('grill set point out of range')
+			control['setpoints']['grill'] = set_point
+			if control['mode'] == 'Hold':
+				control['updated'] = True
+
+		elif command in ['setpoint/probe1', 'setpoint/probe2']:
+			probe = command.split('/')[1]
+			try:
+				set_point = int(float(payload))
+			except ValueError:
+				return('invalid set point')
+			if set_point > 0:
+				control['setpoints'][probe] = set_point
+				control['notify_req'][probe] = True
+			else:
+				control['setpoints'][probe] = 0
+				control['notify_req'][probe] = False
+				control['notify_data']['p' + probe[-1] + '_shutdown'] = False
+
+		else:
+			return('unknown command')
+
+		return(None)
+
+	def Stop(self):
+		# A clean disconnect doesn't send the will, so availability is set offline first
+		if self.client is not None:
+			if self.connected:
+				self.client.publish(self.Topic('availability'), 'offline', retain=True)
+			self.client.disconnect()  # Sent after the offline message by the network loop
+			self.client.loop_stop()
+			self.client = None
+			self.connected = False
+
+if __name__ == '__main__':
+	# Check a command against the current control data (see above)
+	import sys
+	from common import ReadSettings
+	if len(sys.argv) != 3:
+		print('Usage: python3 mqtt_publisher.py <command> <payload>  (i.e. mode Hold)')
+		sys.exit(1)
+	settings = ReadSettings()
+	settings['mqtt']['enabled'] = False  # No broker connection
+	publisher = MqttPublisher(settings)
+	accepted = publisher.HandleCommand(sys.argv[1], sys.argv[2], dry_run=True)
+	sys.exit(0 if accepted else 2)
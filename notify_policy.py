@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Notification Policy
+# *****************************************
+#
+# Description: This library decides which notifications are sent, and
+#  merges notifications that happen at nearly the same time.
+#
+#  Cooldown: An event is not sent again until its cooldown (EVENT_POLICY)
+#  has passed since it was last sent.  The temperature achieved and timer
+#  events have no cooldown, as each one is requested (armed) by the user in
+#  the WebUI and the request is cleared when the event is sent, so a target
+#  which is re-armed and reached again within a minute is still notified.
+#
+#  Hysteresis: Threshold events (i.e. Pellet_Level_Low) are sent once when
+#  the threshold is crossed, and are not sent again until the value has
+#  moved back past the clear level (see CheckThreshold), i.e. after the
+#  hopper has been refilled.
+#
+#  Coalescing: Events are held for coalesce_window seconds, and the events
+#  submitted in that window are delivered together (the deliver callback
+#  merges them into one message per provider).  Grill errors are delivered
+#  immediately, along with any events being held.
+#
+#  The policy state (time each event was last sent, and the threshold events
+#  waiting to re-arm) is kept in Redis (control:notify_policy), so it is
+#  kept when the control program restarts the WorkCycle or is restarted.
+#  With a SimulatedClock (--simspeed), the state is kept in memory only, so
+#  the simulated (future) send times never suppress the real notifications.
+#
+#  All times come from the clock passed in (SystemClock by default), so the
+#  policy also runs in simulated time.  With a SimulatedClock, the coalescing
+#  window is scheduled on the clock (CallLater) instead of a threading.Timer.
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import threading
+from common import ReadNotifyPolicy, WriteNotifyPolicy, WriteLog
+from clock import SystemClock, SimulatedClock
+
+# cooldown: Minimum time (s) between notifications of the event
+# threshold: Sent once per threshold crossing (see CheckThreshold)
+# immediate: Delivered without waiting for the coalescing window
+EVENT_POLICY = {
+	'Grill_Temp_Achieved' : {'cooldown' : 0},
+	'Probe1_Temp_Achieved' : {'cooldown' : 0},
+	'Probe2_Temp_Achieved' : {'cooldown' : 0},
+	'Timer_Expired' : {'cooldown' : 0},
+	'Pellet_Empty_Predicted' : {'cooldown' : 3600, 'threshold' : True},
+	'Pellet_Level_Low' : {'cooldown' : 3600, 'threshold' : True},
+	'Grill_Error_00' : {'cooldown' : 60, 'immediate' : True},
+	'Grill_Error_01' : {'cooldown' : 60, 'immediate' : True},
+	'Grill_Error_02' : {'cooldown' : 60, 'immediate' : True},
+	'Grill_Warning' : {'cooldown' : 600}
+}
+DEFAULT_POLICY = {'cooldown' : 60}
+
+PELLET_LEVEL_HYSTERESIS = 10  # Pellet_Level_Low re-arms once the level is this much (%) above the warning level
+PREDICTED_EMPTY_HYSTERESIS = 1.5  # Pellet_Empty_Predicted re-arms once the time to empty is this many times the warning time
+
+class NotifyPolicy:
+
+	def __init__(self, deliver, coalesce_window=10, clock=None):
+		# deliver: Called with the list of (event, message) held in the coalescing window
+		# clock: Time source (SystemClock by default)
+		if clock is None:
+			clock = SystemClock()
+		self.clock = clock
+		self.persist = not isinstance(clock, SimulatedClock)  # Simulated time must not reach the saved state
+		self.deliver = deliver
+		self.coalesce_window = coalesce_window
+		self.lock = threading.Lock()
+		self.batch = []
+		self.scheduled = False  # A flush of the batch is scheduled
+		self.generation = 0  # Incremented on every flush, so a scheduled flush of a batch already delivered is ignored
+		self.timer = None
+		self.state = {'last_sent' : {}, 'disarmed' : []}
+		if not self.persist:
+			return
+		try:
+			self.state = ReadNotifyPolicy()
+		except Exception as e:
+			WriteLog('WARNING: Unable to read the notification policy state, starting with no cooldowns: ' + str(e))
+
+	def GetPolicy(self, event):
+		return EVENT_POLICY.get(event, DEFAULT_POLICY)
+
+	def Allow(self, event, now=None):
+		# Returns True if the event should be sent now (and records it as sent)
+		if now is None:
+			now = self.clock.time()
+		policy = self.GetPolicy(event)
+		with self.lock:
+			if event in self.state['disarmed']:
+				return False
+			last_sent = self.state['last_sent'].get(event, 0)
+			if now - last_sent < policy['cooldown']:
+				return False
+			self.state['last_sent'][event] = now
+			if policy.get('threshold', False):
+				self.state['disarmed'].append(event)
+			self.SaveState()
+		return True
+
+	def CheckThreshold(self, event, value, trigger, clear):
+		# For a low threshold event: returns True if value is at or below trigger, and
+		#  re-arms the event once value has risen to clear (clear > trigger)
+		if value >= clear:
+			with self.lock:
+				if event in self.state['disarmed']:
+					self.state['disarmed'].remove(event)
+					self.SaveState()
+		return value <= trigger
+
+	def SaveState(self):
+		# Called with the lock held
+		if not self.persist:
+			return
+		try:
+			WriteNotifyPolicy(self.state)
+		except Exception as e:
+			WriteLog('WARNING: Unable to save the notification policy state: ' + str(e))
+
+	def Submit(self, event, message):
+		# Hold the message for the coalescing window (or deliver now for immediate events)
+		with self.lock:
+			self.batch.append((event, message))
+			immediate = self.GetPolicy(event).get('immediate', False) or (self.coalesce_window <= 0)
+			if (not immediate) and (not self.scheduled):
+				self.scheduled = True
+				self.Schedule(self.generation)
+		if immediate:
+			self.Flush()
+
+	def Schedule(self, generation):
+		# Called with the lock held, flush the batch after the coalescing window
+		if hasattr(self.clock, 'CallLater'):
+			self.clock.CallLater(self.coalesce_window, lambda: self.Flush(generation))
+		else:
+			self.timer = threading.Timer(self.coalesce_window, self.Flush, args=(generation,))
+			self.timer.daemon = True
+			self.timer.start()
+
+	def Flush(self, generation=None):
+		# generation: Set by a scheduled flush, which is skipped if the batch was already delivered
+		with self.lock:
+			if (generation is not None) and (generation != self.generation):
+				return
+			batch = self.batch
+			self.batch = []
+			self.scheduled = False
+			self.generation += 1
+			if self.timer is not None:
+				self.timer.cancel()
+				self.timer = None
+		if batch:
+			self.deliver(batch)
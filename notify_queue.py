@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Notification Queue
+# *****************************************
+#
+# Description: This library delivers the notifications (IFTTT, Pushbullet,
+#  Pushover, Firebase) in the background, so a slow or dead network can't
+#  stall the control loops.
+#
+#  The control program builds each notification as an HTTP request and adds
+#  it to the queue with Enqueue(), which returns immediately.  Each provider
+#  has its own worker thread, so the providers are delivered in parallel
+#  while the notifications for one provider are delivered in order.
+#
+#  Each worker keeps a keep-alive session (requests.Session) to its provider,
+#  so a burst of notifications reuses one connection instead of a new TCP /
+#  TLS handshake per message.  The session is closed after a network error,
+#  and reopened for the next attempt.
+#
+#  Each request uses the provider timeout (PROVIDER_TIMEOUTS).  A failed
+#  delivery (network error, timeout, HTTP 429 or 5xx) is retried with an
+#  exponential backoff, up to MAX_ATTEMPTS times or until the notification
+#  is older than MAX_AGE.  Other HTTP errors (i.e. a bad API key) are not
+#  retried.
+#
+#  Undelivered notifications are kept in a spool file (notify_spool.json),
+#  and are delivered when the control program is restarted.  To limit writes
+#  to the SD card, the spool is not written for notifications which are
+#  delivered on the first attempt.  It is written when a notification first
+#  fails (so it survives a restart while it is being retried), when a spooled
+#  notification runs out of retries, and on shutdown (Stop).  Delivered
+#  notifications are removed from the spool file in one batch, once every
+#  queue is empty.
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import threading
+import json
+import os
+import time
+import requests
+from common import WriteLog
+
+PROVIDER_TIMEOUTS = {  # Request timeout (s) for each provider
+	'ifttt' : 10,
+	'pushbullet' : 10,
+	'pushover' : 10,
+	'firebase' : 10
+}
+DEFAULT_TIMEOUT = 10
+MAX_ATTEMPTS = 8  # Delivery attempts before a notification is dropped
+BACKOFF_BASE = 5  # Delay (s) before the first retry, doubled for each retry
+BACKOFF_MAX = 300  # Maximum delay (s) between retries
+MAX_AGE = 3600  # Notifications older than this (s) are dropped
+
+class NotifyQueue:
+
+	def __init__(self, spool_filename='notify_spool.json'):
+		self.spool_filename = spool_filename
+		self.condition = threading.Condition()
+		self.pending = {}  # Undelivered notifications for each provider, in order
+		self.workers = {}
+		self.sessions = {}  # Keep-alive session of each provider (only used by its worker)
+		self.spooled = False  # True while the spool file holds notifications
+		self.LoadSpool()
+
+	def Enqueue(self, provider, description, url, data=None, json_data=None, headers=None, auth=None):
+		# Add a notification (HTTP POST request) for delivery, returns immediately
+		notification = {
+			'provider' : provider,
+			'description' : description,
+			'url' : url,
+			'data' : data,
+			'json' : json_data,
+			'headers' : headers,
+			'auth' : auth,
+			'created' : time.time(),
+			'attempts' : 0,
+			'next_try' : 0
+		}
+		with self.condition:
+			self.pending.setdefault(provider, []).append(notification)
+			self.StartWorker(provider)
+			self.condition.notify_all()
+
+	def StartWorker(self, provider):
+		# Called with the condition held
+		if provider not in self.workers:
+			worker = threading.Thread(target=self.Worker, args=(provider,), daemon=True)
+			self.workers[provider] = worker
+			worker.start()
+
+	def Worker(self, provider):
+		while True:
+			with self.condition:
+				while True:
+					queue = self.pending.get(provider, [])
+					if queue:
+						delay = queue[0]['next_try'] - time.time()
+						if delay <= 0:
+							notification = queue[0]
+							break
+						self.condition.wait(timeout=delay)
+					else:
+						self.condition.wait()
+
+			result = self.Deliver(notification)
+
+			with self.condition:
+				if result == 'retry':
+					notification['attempts'] += 1
+					if (notification['attempts'] >= MAX_ATTEMPTS) or (time.time() - notification['created'] > MAX_AGE):
+						WriteLog('WARNING: ' + provider + ' notification dropped after ' + str(notification['attempts']) + ' attempts: ' + notification['description'])
+						result = 'drop'
+					else:
+						notification['next_try'] = time.time() + min(BACKOFF_BASE * (2 ** (notification['attempts'] - 1)), BACKOFF_MAX)
+				if result != 'retry':
+					self.pending[provider].remove(notification)
+				if (result == 'retry') and (notification['attempts'] == 1):
+					self.SaveSpool()  # Keep the failed notification across a restart
+				elif self.spooled and ((result == 'drop') or not any(self.pending.values())):
+					self.SaveSpool()  # Remove the dropped or delivered notifications from the spool
+
+	def GetSession(self, provider):
+		if provider not in self.sessions:
+			self.sessions[provider] = requests.Session()
+		return self.sessions[provider]
+
+	def CloseSession(self, provider):
+		session = self.sessions.pop(provider, None)
+		if session is not None:
+			session.close()
+
+	def Deliver(self, notification):
+		# Returns 'sent', 'retry' or 'drop'
+		provider = notification['provider']
+		auth = notification['auth']
+		if auth is not None:
+			auth = tuple(auth)
+		try:
+			r = self.GetSession(provider).post(notification['url'], data=notification['data'], json=notification['json'], headers=notification['headers'], auth=auth, timeout=PROVIDER_TIMEOUTS.get(provider, DEFAULT_TIMEOUT))
+		except Exception as e:
+			self.CloseSession(provider)
+			WriteLog('WARNING: ' + provider + ' notification failed (attempt ' + str(notification['attempts'] + 1) + '): ' + notification['description'] + ' (' + str(e) + ')')
+			return 'retry'
+
+		if (r.status_code >= 200) and (r.status_code < 300):
+			WriteLog(provider + ' notification sent: ' + notification['description'])
+			return 'sent'
+		elif (r.status_code == 429) or (r.status_code >= 500):
+			WriteLog('WARNING: ' + provider + ' notification failed (attempt ' + str(notification['attempts'] + 1) + '): ' + notification['description'] + ' (HTTP ' + str(r.status_code) + ')')
+			return 'retry'
+		else:
+			WriteLog('WARNING: ' + provider + ' notification rejected: ' + notification['description'] + ' (HTTP ' + str(r.status_code) + ': ' + r.text[:200] + ')')
+			return 'drop'
+
+	def LoadSpool(self):
+		try:
+			with open(self.spool_filename, 'r') as spool_file:
+				spooled = json.load(spool_file)
+		except(IOError, OSError, ValueError):
+			return
+		if not spooled:
+			return
+		with self.condition:
+			self.spooled = True
+			for notification in spooled:
+				notification['next_try'] = 0
+				self.pending.setdefault(notification['provider'], []).append(notification)
+			for provider in self.pending:
+				self.StartWorker(provider)
+		WriteLog('Resending ' + str(len(spooled)) + ' undelivered notification(s).')
+
+	def SaveSpool(self):
+		# Called with the condition held
+		spooled = [notification for queue in self.pending.values() for notification in queue]
+		try:
+			if spooled:
+				temp_filename = self.spool_filename + '.tmp'
+				with open(temp_filename, 'w') as spool_file:
+					json.dump(spooled, spool_file, indent=2)
+				os.replace(temp_filename, self.spool_filename)
+			elif os.path.exists(self.spool_filename):
+				os.remove(self.spool_filename)
+		except(IOError, OSError):
+			WriteLog('WARNING: Unable to write the notification spool file.')
+			return
+		self.spooled = bool(spooled)
+
+	def Stop(self):
+		# Save the undelivered notifications when the control program exits
+		with self.condition:
+			if self.spooled or any(self.pending.values()):
+				self.SaveSpool()
+
+	def GetPending(self):
+		# Returns the number of undelivered notifications for each provider
+		with self.condition:
+			return {provider : len(queue) for provider, queue in self.pending.items()}
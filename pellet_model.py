@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Pellet Consumption Model
+# *****************************************
+#
+# Description: This library estimates the pellet consumption from the auger
+#  on time, and predicts the time until the hopper runs empty.
+#
+#  The auger on time is integrated from the grill platform output state on
+#  every control loop.  When a new hopper level reading is available, the
+#  drop in level since the last reference reading is divided by the auger
+#  on time over the same period, which gives the feed rate (percent of the
+#  hopper per second of auger on time).  The feed rate is learned per pellet
+#  profile (pelletdb['feed_rates'][pelletid]), as the pellet size and
+#  density change how much is fed per second.
+#
+#  Between hopper readings, the level is estimated from the auger on time
+#  since the reference reading.  The time to empty is the estimated level
+#  divided by the feed rate and the recent auger duty cycle.
+#
+# *****************************************
+
+MIN_DROP = 5  # Minimum drop in hopper level (%) before the feed rate is updated
+MIN_AUGER_TIME = 120  # Minimum auger on time (s) before the feed rate is updated
+REFILL_JUMP = 10  # A rise in hopper level (%) which is treated as a refill (also used by the hopper sampler)
+MAX_WEIGHT = 0.2  # Weight of a new observation once the feed rate is established
+MAX_UPDATE_INTERVAL = 2  # Longest time (s) integrated by one update, a few control loop periods
+
+class PelletModel:
+
+	def __init__(self, duty_window=600):
+		# duty_window: Time constant (s) of the moving average of the auger duty cycle
+		self.duty_window = duty_window
+		self.pelletid = None
+		self.rate = None  # Feed rate (% of the hopper per second of auger on time)
+		self.samples = 0
+		self.auger_time = 0.0  # Auger on time (s) since the model was started
+		self.auger_on = False
+		self.last_update = None
+		self.duty = None
+		self.level = None  # Last hopper level reading
+		self.anchor_level = None  # Reference hopper level reading for the feed rate
+		self.anchor_auger = 0.0  # Auger on time at the reference reading
+
+	def SetPellets(self, pelletid, feed_rates):
+		# Select the feed rate of the pellet profile (i.e. when new pellets are loaded)
+		if pelletid == self.pelletid:
+			return
+		self.pelletid = pelletid
+		if pelletid in feed_rates:
+			self.rate = feed_rates[pelletid]['rate']
+			self.samples = feed_rates[pelletid]['samples']
+		else:
+			self.rate = None
+			self.samples = 0
+		self.anchor_level = None
+
+	def Update(self, auger_on, now):
+		# Integrate the auger on time and duty cycle since the last update
+		if self.last_update is not None:
+			dt = min(now - self.last_update, MAX_UPDATE_INTERVAL)  # A stalled loop doesn't count as auger on time
+			if dt > 0:
+				if self.auger_on:
+					self.auger_time += dt
+				sample = 1.0 if self.auger_on else 0.0
+				if self.duty is None:
+					self.duty = sample
+				else:
+					self.duty += min(dt / self.duty_window, 1.0) * (sample - self.duty)
+		self.auger_on = auger_on
+		self.last_update = now
+
+	def Stop(self):
+		# Called when a control mode starts and ends, so the time between modes isn't integrated
+		self.auger_on = False
+		self.last_update = None
+
+	def Reading(self, level):
+		# Add a hopper level reading, returns True if the feed rate was updated
+		self.level = level
+		if (self.anchor_level is None) or (level - self.anchor_level > REFILL_JUMP):
+			# First reading or hopper refilled, start a new reference
+			self.anchor_level = level
+			self.anchor_auger = self.auger_time
+			return False
+
+		drop = self.anchor_level - level
+		auger_time = self.auger_time - self.anchor_auger
+		if (drop < MIN_DROP) or (auger_time < MIN_AUGER_TIME):
+			return False
+
+		observed = drop / auger_time
+		if self.rate is None:
+			self.rate = observed
+		else:
+			self.rate += max(1.0 / (self.samples + 1), MAX_WEIGHT) * (observed - self.rate)
+		self.samples += 1
+		self.anchor_level = level
+		self.anchor_auger = self.auger_time
+		return True
+
+	def IsActive(self, now, timeout=60):
+		# True if the auger state has been updated recently (i.e. the grill is in a feeding mode)
+		return (self.last_update is not None) and (now - self.last_update < timeout)
+
+	def GetFeedRate(self):
+		return {'rate' : self.rate, 'samples' : self.samples}
+
+	def EstimatedLevel(self):
+		# Hopper level estimated from the auger on time since the reference reading
+		if (self.anchor_level is None) or (self.rate is None):
+			return self.level
+		return max(self.anchor_level - (self.rate * (self.auger_time - self.anchor_auger)), 0)
+
+	def TimeToEmpty(self):
+		# Seconds until the hopper is empty at the recent auger duty cycle (None if unknown)
+		level = self.EstimatedLevel()
+		if (level is None) or (self.rate is None) or (not self.duty):
+			return None
+		return level / (self.rate * self.duty)
+
+	def GetPrediction(self, now):
+		time_to_empty = self.TimeToEmpty()
+		level = self.EstimatedLevel()
+		prediction = {
+			'pelletid' : self.pelletid,
+			'level' : None if level is None else round(level, 1),
+			'feed_rate' : self.rate,
+			'samples' : self.samples,
+			'duty' : None if self.duty is None else round(self.duty, 3),
+			'auger_time' : round(self.auger_time, 1),
+			'time_to_empty' : None if time_to_empty is None else int(time_to_empty),
+			'time' : now
+		}
+		return prediction
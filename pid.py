@@ -23,14 +23,19 @@
 # *****************************************
 # Imported Libraries
 # *****************************************
-import time
 from common import ReadSettings
+from clock import SystemClock
 
 # *****************************************
 # Class Definition
 # *****************************************
 class PID:
-	def __init__(self,  PB, Ti, Td):
+	def __init__(self,  PB, Ti, Td, clock=None):
+		# clock: Time source (SystemClock by default, SimulatedClock for accelerated simulation)
+		if clock is None:
+			clock = SystemClock()
+		self.clock = clock
+
 		self.CalculateGains(PB,Ti,Td)
 
 		self.P = 0.0
@@ -60,7 +65,7 @@ class PID:
 		self.P = self.Kp*error + self.Center #P = 1 for PB/2 under setPoint, P = 0 for PB/2 over setPoint
 
 		#I
-		dT = time.time() - self.LastUpdate
+		dT = self.clock.time() - self.LastUpdate
 		#if self.P > 0 and self.P < 1: #Ensure we are in the PB, otherwise do not calculate I to avoid windup
 		self.Inter += error*dT
 		self.Inter = max(self.Inter, -self.Inter_max)
@@ -78,7 +83,7 @@ class PID:
 		#Update for next cycle
 		self.error = error
 		self.Last = Current
-		self.LastUpdate = time.time()
+		self.LastUpdate = self.clock.time()
 
 		return self.u
 
@@ -87,7 +92,7 @@ class PID:
 		self.error = 0.0
 		self.Inter = 0.0
 		self.Derv = 0.0
-		self.LastUpdate = time.time()
+		self.LastUpdate = self.clock.time()
 
 	def setGains(self, PB, Ti, Td):
 		self.CalculateGains(PB,Ti,Td)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Probe Lookup Table Library
+# *****************************************
+#
+# Description: This library converts the ADC voltage (mV) at the probe
+#  voltage divider to a temperature, using a lookup table which is built
+#  once per probe profile instead of evaluating the Steinhart-Hart equation
+#  on every reading.
+#
+#  The table holds the temperature at every step_mv across the input range
+#  (0 - Vs), in the requested units.  Readings between two table entries are
+#  linearly interpolated.  Readings in the first / last step of the range,
+#  where the curve is too steep to interpolate, are calculated directly.
+#
+#  Tables are cached per profile and units, so switching modes (which calls
+#  SetProfiles() again) does not rebuild them.
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import math
+
+# Realistic temperature range (F), readings outside of this range are reported as 0
+MIN_TEMP_F = 0
+MAX_TEMP_F = 600
+
+# Probe fault detection, as a fraction of the divider supply voltage (Vs)
+SHORTED_FRACTION = 0.005  # Below this the thermistor is shorted (i.e. < ~50 Ohms with a 10k divider)
+DISCONNECTED_FRACTION = 0.99  # Above this the thermistor is open / unplugged (i.e. > ~1M Ohms with a 10k divider)
+
+_table_cache = {}
+
+def SteinhartHart(Tr, a, b, c):
+	# 1/T = A + B(ln(R)) + C(ln(R))^3
+	# T = 1/(a + b[ln(ohm)] + c[ln(ohm)]^3)
+	lnohm = math.log(Tr) # ln(ohms)
+	t1 = (b*lnohm) # b[ln(ohm)]
+	t2 = c * math.pow(lnohm,3) # c[ln(ohm)]^3
+	tempK = 1/(a + t1 + t2) # calculate temperature in Kelvin
+	return tempK
+
+def GetTable(probe_profile, units='F', step_mv=1.0):
+	# Returns the (cached) lookup table for the probe profile in the given units
+	key = (probe_profile['A'], probe_profile['B'], probe_profile['C'], probe_profile['Vs'], probe_profile['Rd'], units, step_mv)
+	if key not in _table_cache:
+		_table_cache[key] = ProbeTable(probe_profile, units=units, step_mv=step_mv)
+	return _table_cache[key]
+
+class ProbeTable:
+
+	def __init__(self, probe_profile, units='F', step_mv=1.0):
+		self.a = probe_profile['A']
+		self.b = probe_profile['B']
+		self.c = probe_profile['C']
+		self.Vs = probe_profile['Vs']
+		self.Rd = probe_profile['Rd']
+		self.units = units
+		self.step = step_mv
+		self.max_mv = self.Vs * 1000
+
+		# Realistic temperature range in the table units
+		if units == 'F':
+			self.min_temp, self.max_temp = MIN_TEMP_F, MAX_TEMP_F
+		else:
+			self.min_temp, self.max_temp = (MIN_TEMP_F - 32) * (5/9), (MAX_TEMP_F - 32) * (5/9)
+
+		# Table entries at k * step for k = 0 .. count (entry 0 is unused, as Tr = 0 at 0mV)
+		self.count = int(math.ceil(self.max_mv / self.step)) - 1
+		self.temps = [0.0] * (self.count + 1)
+		for k in range(1, self.count + 1):
+			self.temps[k] = self.Calculate(k * self.step)
+
+	def Resistance(self, adc_value):
+		# Thermistor resistance (Ohms) from the voltage divider (R2 = ( Vout * R1 ) / ( Vin - Vout ))
+		Vo = adc_value / 1000 # mV to V of ADC (at the divider)
+		return (Vo * self.Rd) / (self.Vs - Vo)
+
+	def Calculate(self, adc_value):
+		# Temperature in the table units, calculated directly (NaN if the equation is not defined)
+		try:
+			tempC = SteinhartHart(self.Resistance(adc_value), self.a, self.b, self.c) - 273.15 # Kelvin to Celsius
+		except (ValueError, ZeroDivisionError):
+			return float('nan')
+		if self.units == 'F':
+			return tempC * (9/5) + 32 # Celsius to Farenheit
+		return tempC
+
+	def Interpolate(self, adc_value):
+		# Temperature for an ADC value (mV) inside the input range, without the bounds check
+		position = adc_value / self.step
+		k = int(position)
+		if (k >= 1) and (k < self.count):
+			return self.temps[k] + ((self.temps[k + 1] - self.temps[k]) * (position - k))
+		return self.Calculate(adc_value)
+
+	def Convert(self, adc_value):
+		# Returns the temperature and thermistor resistance for the ADC value (mV)
+		if (adc_value <= 0) or (adc_value >= self.max_mv):
+			return 0.0, 0
+
+		temp = self.Interpolate(adc_value)
+
+		# Check bounds for realistic temperature values (0-600F), else report 0
+		if not ((temp >= self.min_temp) and (temp <= self.max_temp)):
+			temp = 0.0
+
+		Vo = adc_value / 1000
+		return temp, (Vo * self.Rd) / (self.Vs - Vo)
+
+	def Status(self, adc_value):
+		# Returns the probe state for the ADC value (mV): 'ok', 'shorted', 'disconnected' or 'out_of_range'
+		if adc_value <= self.max_mv * SHORTED_FRACTION:
+			return 'shorted'
+		if adc_value >= self.max_mv * DISCONNECTED_FRACTION:
+			return 'disconnected'
+		temp = self.Interpolate(adc_value)
+		if not ((temp >= self.min_temp) and (temp <= self.max_temp)):
+			return 'out_of_range'
+		return 'ok'
+
+	def ConvertMany(self, adc_values):
+		# Batch conversion of a list of ADC values (mV), i.e. for oversampled or logged raw data
+		convert = self.Convert
+		return [convert(adc_value) for adc_value in adc_values]
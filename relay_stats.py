@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Relay Statistics Library
+# *****************************************
+#
+# Description: This library keeps usage counters for the grill platform
+#  outputs (power, auger, fan, igniter), to help plan relay and igniter
+#  replacement.
+#
+#  For each output, the cumulative on time and switch count (number of times
+#  the output was switched on) are kept for the lifetime of the counter file,
+#  and for the current session (since the control program started).
+#
+#  The counters are kept in memory and written to relay_stats.json at most
+#  every flush_interval seconds (checked when an output is switched or the
+#  statistics are read), rather than on every switch, to limit writes to
+#  the SD card.
+#
+#  When the control loops run on a SimulatedClock (--simspeed), the counters
+#  are kept for the session only and the counter file is neither read nor
+#  written, so simulated switching is never added to the real relay history.
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import json
+import os
+from clock import SystemClock, SimulatedClock
+
+class RelayStats:
+
+	def __init__(self, outputs, filename='relay_stats.json', flush_interval=300, clock=None):
+		# outputs: Names of the outputs to track
+		# clock: Time source (SystemClock by default)
+		# filename: Counter file (None to keep the counters in memory only)
+		if clock is None:
+			clock = SystemClock()
+		self.clock = clock
+		if isinstance(clock, SimulatedClock):
+			filename = None  # Simulated time must not reach the real relay history
+		self.filename = filename
+		self.flush_interval = flush_interval
+
+		now = self.clock.time()
+		self.lifetime = {}
+		self.session = {}
+		self.on_since = {}  # Time each output was switched on (None if off)
+		for output in outputs:
+			self.lifetime[output] = {'on_time' : 0.0, 'switches' : 0}
+			self.session[output] = {'on_time' : 0.0, 'switches' : 0}
+			self.on_since[output] = None
+		self.session_start = now
+		self.created = now
+		self.Load()
+		self.last_flush = now
+		self.dirty = False
+
+	def Load(self):
+		if self.filename is None:
+			return
+		try:
+			with open(self.filename, 'r') as stats_file:
+				stored = json.load(stats_file)
+		except(IOError, OSError, ValueError):
+			return
+		self.created = stored.get('created', self.created)
+		for output, counters in stored.get('outputs', {}).items():
+			if output in self.lifetime:
+				self.lifetime[output]['on_time'] = counters.get('on_time', 0.0)
+				self.lifetime[output]['switches'] = counters.get('switches', 0)
+
+	def Switch(self, output, state):
+		# Record the output state (True = on), only changes of state are counted
+		now = self.clock.time()
+		if state and (self.on_since[output] is None):
+			self.on_since[output] = now
+			self.lifetime[output]['switches'] += 1
+			self.session[output]['switches'] += 1
+			self.dirty = True
+		elif (not state) and (self.on_since[output] is not None):
+			on_time = now - self.on_since[output]
+			self.lifetime[output]['on_time'] += on_time
+			self.session[output]['on_time'] += on_time
+			self.on_since[output] = None
+			self.dirty = True
+		self.CheckFlush(now)
+
+	def CheckFlush(self, now):
+		if (now - self.last_flush >= self.flush_interval) and (self.dirty or any(since is not None for since in self.on_since.values())):
+			self.Flush(now)
+
+	def Flush(self, now=None):
+		# Write the lifetime counters (including the time of any outputs which are on) to disk
+		if now is None:
+			now = self.clock.time()
+		if self.filename is None:
+			self.last_flush = now
+			self.dirty = False
+			return
+		stats = self.GetStats(now, check_flush=False)
+		stored = {
+			'created' : self.created,
+			'updated' : now,
+			'outputs' : {output : stats['outputs'][output]['lifetime'] for output in stats['outputs']}
+		}
+		try:
+			temp_filename = self.filename + '.tmp'
+			with open(temp_filename, 'w') as stats_file:
+				json.dump(stored, stats_file, indent=2)
+			os.replace(temp_filename, self.filename)
+		except(IOError, OSError):
+			return
+		self.last_flush = now
+		self.dirty = False
+
+	def GetStats(self, now=None, check_flush=True):
+		# Returns the lifetime and session on time (s) and switch counts of each output
+		if now is None:
+			now = self.clock.time()
+		stats = {
+			'created' : self.created,
+			'session_start' : self.session_start,
+			'session_time' : now - self.session_start,
+			'outputs' : {}
+		}
+		for output in self.lifetime:
+			running = 0.0
+			if self.on_since[output] is not None:
+				running = now - self.on_since[output]
+			stats['outputs'][output] = {
+				'lifetime' : {
+					'on_time' : round(self.lifetime[output]['on_time'] + running, 1),
+					'switches' : self.lifetime[output]['switches']
+				},
+				'session' : {
+					'on_time' : round(self.session[output]['on_time'] + running, 1),
+					'switches' : self.session[output]['switches']
+				}
+			}
+		if check_flush:
+			self.CheckFlush(now)
+		return stats
@@ -178,6 +178,13 @@ $(document).ready(function(){
             $("#active_group").show();
             $("#stop_btn").hide();
             $("#error_btn").hide();
+        } else if (data.current_mode == 'Autotune') {
+            document.getElementById("hold_btn").className = "btn btn-info border border-secondary text-white";
+            document.getElementById("hold_btn").innerHTML = "Autotune " + data.set_points['grill'] + "°" + units;
+            $("#inactive_group").hide();
+            $("#active_group").show();
+            $("#stop_btn").hide();
+            $("#error_btn").hide();
         } else if (data.current_mode == 'Shutdown') {
             document.getElementById("shutdown_btn").className = "btn btn-danger border border-secondary";
             $("#inactive_group").hide();
@@ -282,6 +289,13 @@ $(document).ready(function(){
                     ]);
                 };
     
+                // Show probe faults (disconnected, shorted, etc.)
+                if(data.probe_status) {
+                    UpdateProbeStatus("GrillStatus", data.probe_status[0]);
+                    UpdateProbeStatus("Probe1Status", data.probe_status[1]);
+                    UpdateProbeStatus("Probe2Status", data.probe_status[2]);
+                };
+
                 // Update notify buttons if state changes
 
                 if(notify_req_last['grill'] != data.notify_req['grill']) { 
@@ -339,7 +353,7 @@ $(document).ready(function(){
                         document.getElementById("monitor_btn").className = "btn btn-outline-secondary border border-secondary";
                     } else if (last_mode == 'Smoke') {
                         document.getElementById("smoke_btn").className = "btn btn-outline-warning border border-secondary text-secondary";
-                    } else if (last_mode == 'Hold') {
+                    } else if ((last_mode == 'Hold') || (last_mode == 'Autotune')) {
                         document.getElementById("hold_btn").className = "btn btn-outline-secondary border border-secondary";
                         document.getElementById("hold_btn").innerHTML = "Hold";
                     } else if (last_mode == 'Shutdown') {
@@ -408,6 +422,14 @@ $(document).ready(function(){
                         document.getElementById("hold_btn").innerHTML = data.set_points['grill'] + "°" + units;
                         $("#stop_btn").hide();
                         $("#error_btn").hide();
+                    } else if (data.current_mode == 'Autotune') {
+                        $("#inactive_group").hide();
+                        $("#active_group").show();
+                        $("#splus_btn").hide();
+                        document.getElementById("hold_btn").className = "btn btn-info border border-secondary text-white";
+                        document.getElementById("hold_btn").innerHTML = "Autotune " + data.set_points['grill'] + "°" + units;
+                        $("#stop_btn").hide();
+                        $("#error_btn").hide();
                     } else if (data.current_mode == 'Shutdown') {
                         $("#inactive_group").hide();
                         $("#splus_btn").hide();
@@ -459,6 +481,7 @@ $(document).ready(function(){
 
         // Returned Data: 
         // 'data.hopper_level' 
+        // 'data.time_to_empty' (seconds, null if unknown)
         if (data.hopper_level > 70) { 
             document.getElementById("HopperStatus").className = "btn btn-outline-success btn-block shadow";
         } else if (data.hopper_level > 30) {
@@ -469,6 +492,7 @@ $(document).ready(function(){
 
         document.getElementById("HopperLevel").innerHTML = data.hopper_level;
         document.getElementById("PelletName").innerHTML = data.cur_pellets;
+        UpdateTimeToEmpty(data.time_to_empty);
     });
 
     setInterval(function(){
@@ -484,6 +508,7 @@ $(document).ready(function(){
 
             // Returned Data: 
             // 'data.hopper_level' 
+            // 'data.time_to_empty' (seconds, null if unknown)
             if (data.hopper_level > 70) { 
                 document.getElementById("HopperStatus").className = "btn btn-outline-success btn-block shadow";
             } else if (data.hopper_level > 30) {
@@ -494,9 +519,45 @@ $(document).ready(function(){
 
             document.getElementById("HopperLevel").innerHTML = data.hopper_level;
             document.getElementById("PelletName").innerHTML = data.cur_pellets;
+            UpdateTimeToEmpty(data.time_to_empty);
         });
     }, 150000);
 
 
 
 }); // End of Document Ready Function
+
+// Show / hide the fault badge for a probe
+function UpdateProbeStatus(id, status) {
+    var badge = document.getElementById(id);
+    if (badge == null) {
+        return;
+    };
+    if (status == 'ok') {
+        $("#" + id).hide();
+    } else {
+        var labels = {
+            'disconnected' : 'Disconnected',
+            'shorted' : 'Shorted',
+            'out_of_range' : 'Out of Range',
+            'error' : 'Read Error'
+        };
+        badge.innerHTML = "<i class=\"fas fa-exclamation-triangle\"></i> " + (labels[status] || status);
+        $("#" + id).show();
+    };
+};
+
+// Show the predicted time until the hopper is empty
+function UpdateTimeToEmpty(time_to_empty) {
+    var label = document.getElementById("TimeToEmpty");
+    if (label == null) {
+        return;
+    };
+    if (time_to_empty == null) {
+        label.innerHTML = "";
+    } else {
+        var hours = Math.floor(time_to_empty / 3600);
+        var minutes = Math.floor((time_to_empty % 3600) / 60);
+        label.innerHTML = " (~" + hours + "h " + minutes + "m left)";
+    };
+};
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire Temperature Filter Library
+# *****************************************
+#
+# Description: This library provides per probe filters that are applied to
+#  the temperatures from ReadAllPorts() before they are averaged by the
+#  TempQueue and used by the control modes.
+#
+#  Filter types:
+#   'none' - Pass the readings through unchanged
+#   'median' - Median of the last N readings (rejects single spikes)
+#   'exponential' - Exponential moving average with smoothing factor alpha
+#   'kalman' - 1-D Kalman filter.  The probe temperature is modeled as a
+#     random walk (process noise in deg^2 per second, scaled by the time
+#     between readings) observed with measurement noise (deg^2).
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+from collections import deque
+
+FILTER_TYPES = ['none', 'median', 'exponential', 'kalman']
+
+ADC_TEMP_KEYS = ['GrillTemp', 'Probe1Temp', 'Probe2Temp']
+ADC_TR_KEYS = ['GrillTr', 'Probe1Tr', 'Probe2Tr']
+
+def DefaultFilterSettings():
+	filter_settings = {
+		'type' : 'none',
+		'median_n' : 5, # Number of readings for the median filter
+		'alpha' : 0.3, # Smoothing factor for the exponential filter (0-1, higher follows faster)
+		'process_noise' : 0.05, # Kalman process noise (deg^2 per second)
+		'measurement_noise' : 4.0 # Kalman measurement noise (deg^2)
+	}
+	return filter_settings
+
+class PassFilter:
+
+	def update(self, value, now):
+		return value
+
+	def reset(self):
+		pass
+
+class MedianFilter:
+
+	def __init__(self, n=5):
+		self.values = deque(maxlen=max(int(n), 1))
+
+	def update(self, value, now):
+		self.values.append(value)
+		ordered = sorted(self.values)
+		middle = len(ordered) // 2
+		if len(ordered) % 2:
+			return ordered[middle]
+		return (ordered[middle - 1] + ordered[middle]) / 2
+
+	def reset(self):
+		self.values.clear()
+
+class ExponentialFilter:
+
+	def __init__(self, alpha=0.3):
+		self.alpha = min(max(alpha, 0.01), 1.0)
+		self.estimate = None
+
+	def update(self, value, now):
+		if self.estimate is None:
+			self.estimate = value
+		else:
+			self.estimate += self.alpha * (value - self.estimate)
+		return self.estimate
+
+	def reset(self):
+		self.estimate = None
+
+class KalmanFilter:
+
+	def __init__(self, process_noise=0.05, measurement_noise=4.0):
+		self.q = process_noise
+		self.r = measurement_noise
+		self.reset()
+
+	def update(self, value, now):
+		if self.estimate is None:
+			# Initialize with the first reading
+			self.estimate = value
+			self.variance = self.r
+			self.last_update = now
+			return self.estimate
+
+		# Predict: random walk, uncertainty grows with the time since the last reading
+		dt = max(now - self.last_update, 0)
+		self.variance += self.q * dt
+		self.last_update = now
+
+		# Update with the new reading
+		gain = self.variance / (self.variance + self.r)
+		self.estimate += gain * (value - self.estimate)
+		self.variance *= (1 - gain)
+		return self.estimate
+
+	def reset(self):
+		self.estimate = None
+		self.variance = 0.0
+		self.last_update = 0
+
+def CreateFilter(filter_settings):
+	# Returns a filter object for the probe filter settings
+	settings = DefaultFilterSettings()
+	settings.update(filter_settings)
+
+	if settings['type'] == 'median':
+		return MedianFilter(n=settings['median_n'])
+	elif settings['type'] == 'exponential':
+		return ExponentialFilter(alpha=settings['alpha'])
+	elif settings['type'] == 'kalman':
+		return KalmanFilter(process_noise=settings['process_noise'], measurement_noise=settings['measurement_noise'])
+	return PassFilter()
+
+def CreateProbeFilters(settings):
+	# Returns a list of filters for the grill probe, probe 1 and probe 2 (additional channels are added by FilterADCData)
+	return [CreateFilter(filter_settings) for filter_settings in settings['probe_settings']['probe_filters']]
+
+def FilterADCData(filters, adc_data, now):
+	# Returns a copy of adc_data with the probe filters applied to the temperatures
+	adc_data = dict(adc_data)
+	if 'Temps' not in adc_data:
+		# ADC modules with a fixed set of probes only report the grill, probe 1 and probe 2 keys
+		adc_data['Temps'] = [adc_data[key] for key in ADC_TEMP_KEYS]
+		adc_data['Trs'] = [adc_data[key] for key in ADC_TR_KEYS]
+
+	temps = list(adc_data['Temps'])
+	while len(filters) < len(temps):
+		filters.append(CreateFilter({}))  # Channels without filter settings use the default filter
+	for channel in range(len(temps)):
+		temps[channel] = filters[channel].update(temps[channel], now)
+
+	adc_data['Temps'] = temps
+	return adc_data
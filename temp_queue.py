@@ -1,59 +1,100 @@
-import statistics
+import math
 
 '''
-Class to track temperature averages coming from the ADC and 
-handle errors gracefully (hopefully).  
+Class to track temperature averages coming from the ADC and
+handle errors gracefully (hopefully).
+
+The queue is a fixed size ring buffer.  The running sum and the sum of
+squared deviations (Welford) are updated as samples enter and leave the window, so
+enqueue() and average() take constant time regardless of the queue length.
+The running values are recalculated exactly every RECALC_INTERVAL samples to
+remove any accumulated floating point error.
 '''
 
+RECALC_INTERVAL = 1000
+
 class TempQueue():
 	def __init__(self, qlength=10, units='F'):
-		self.queue = []
 		self.units = units
 
 		if(qlength < 2):
 			self.qlength = 2 # Set minimum qlength to 2
-		else: 
+		else:
 			self.qlength = qlength
-		
+
+		self.queue = []  # Ring buffer, filled on the first enqueue
+		self.index = 0  # Position of the oldest sample in the ring buffer
+		self.total = 0  # Running sum of the queue
+		self.mean = 0.0
+		self.m2 = 0.0  # Sum of squared deviations from the mean
+		self.updates = 0
+
 		if(units == 'F'):
 			self.stdev_max = 4.75  # Standard Deviation Maximum for degrees F
 		else:
 			self.stdev_max = 2.25  # Standard Deviation Maximum for degrees C
 		self.last_average = 0
+		self.cached_average = None
 
 	def enqueue(self, value):
-		while (len(self.queue) < (self.qlength + 1)):
-			self.queue.insert(0, value)
-		self.queue.pop()
+		if(len(self.queue) == 0):
+			# Fill the queue with the first value
+			self.queue = [value] * self.qlength
+			self.total = value * self.qlength
+			self.mean = self.total / self.qlength
+			self.m2 = 0.0
+		else:
+			# Replace the oldest value, and update the running mean / sum of squared deviations
+			old = self.queue[self.index]
+			self.queue[self.index] = value
+			self.index = (self.index + 1) % self.qlength
+			old_mean = self.mean
+			self.total += value - old
+			self.mean = self.total / self.qlength
+			self.m2 += (value - old) * ((value - self.mean) + (old - old_mean))
+
+			self.updates += 1
+			if(self.updates >= RECALC_INTERVAL):
+				self.recalculate()
+
+		self.cached_average = None
 		return(self.average())
 
+	def recalculate(self):
+		self.total = sum(self.queue)
+		self.mean = self.total / self.qlength
+		self.m2 = sum([(value - self.mean) ** 2 for value in self.queue])
+		self.updates = 0
+
+	def stdev(self):
+		return(math.sqrt(max(self.m2, 0) / (self.qlength - 1)))
+
 	def average(self):
+		if(self.cached_average is not None):
+			# No new samples since the last call
+			return(self.cached_average)
+
 		if(len(self.queue) < self.qlength):
-			# Handle case if queue isn't full 
+			# Handle case if queue isn't full
 			self.last_average = 0
 			return(0)
 		elif(self.last_average == 0):
 			# Handle case if lastaverage isn't initialized
-			average = (sum(self.queue) / self.qlength)
+			average = self.mean
 			self.last_average = average
-			if(self.units == 'F'):
-				return(int(average))  # Give integer for F units
-			else: 
-				return(round(average, 1))  # Give one digit of decimal for C units
 		else:
 			# Handle normal case
 			# Get standard deviation from temperatures in the queue
-			stdev = statistics.stdev(self.queue)
-			if(stdev < self.stdev_max):
+			if(self.stdev() < self.stdev_max):
 				# If the standard deviation is less than the max deviation, calculate the average temperature as normal
-				average = (sum(self.queue) / self.qlength)
+				average = self.mean
 				self.last_average = average
 			else:
 				# If the standard deviation exceeds the max deviation, keep the last average value
 				average = self.last_average
 
-			if(self.units == 'F'):
-				return(int(average))  # Give integer for F units
-			else: 
-				return(round(average, 1))  # Give one digit of decimal for C units
-
+		if(self.units == 'F'):
+			self.cached_average = int(average)  # Give integer for F units
+		else:
+			self.cached_average = round(average, 1)  # Give one digit of decimal for C units
+		return(self.cached_average)
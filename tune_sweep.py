@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# *****************************************
+# PiFire PID Parameter Sweep
+# *****************************************
+#
+# Description: This script searches for Hold mode controller parameters
+#  (cycle_data PB, Ti, Td, HoldCycleTime, u_min, u_max) by running the
+#  benchmark scenarios (see benchmark.py) against the simulated grill for
+#  each candidate parameter set.  Candidates are evaluated in parallel on all
+#  CPU cores, each worker process using its own scratch directory and Redis
+#  database.
+#
+#  Candidates are ranked by a score combining the control quality metrics
+#  (lower is better), and the winner can be written back to settings.json.
+#
+# Usage:
+#
+#  $ python3 tune_sweep.py -n 32                       # Random search with 32 candidates
+#  $ python3 tune_sweep.py -m grid --PB 40,60,80 --Ti 120,180,240
+#  $ python3 tune_sweep.py -n 64 --apply               # Write the winner to settings.json
+#
+# *****************************************
+
+# *****************************************
+# Imported Libraries
+# *****************************************
+
+import os
+import random
+import shutil
+import argparse
+import itertools
+import tempfile
+import multiprocessing
+from common import ReadSettings, WriteSettings, WriteLog
+import benchmark
+
+# Search ranges for the random search (min, max)
+PARAMETER_RANGES = {
+	'PB' : (20.0, 120.0),
+	'Ti' : (60.0, 600.0),
+	'Td' : (0.0, 90.0),
+	'HoldCycleTime' : (10, 40),
+	'u_min' : (0.05, 0.25),
+	'u_max' : (0.6, 1.0)
+}
+
+DEFAULT_SCENARIOS = ['cold_start_225', 'setpoint_step_350', 'lid_open']
+
+MAX_REDIS_DB = 15  # Databases 1-15 are used by the workers (0 is used by PiFire)
+
+# *****************************************
+# Function Definitions
+# *****************************************
+
+def Score(results):
+	# *****************************************
+	# Combine the metrics of all scenarios into a single score (lower is better)
+	# *****************************************
+	score = 0
+	for name in results:
+		metrics = results[name]
+		score += metrics.get('rms_error', 100) + (0.5 * metrics.get('overshoot', 100)) + (metrics.get('settling', 7200) / 120)
+		if metrics.get('final_mode') == 'Error':
+			score += 1000  # Penalize runs that ended in a safety shutdown
+	return score / max(len(results), 1)
+
+def RandomCandidates(count, seed=None):
+	rng = random.Random(seed)
+	candidates = []
+	for index in range(count):
+		candidate = {}
+		for key, (low, high) in PARAMETER_RANGES.items():
+			if isinstance(low, int):
+				candidate[key] = rng.randint(low, high)
+			else:
+				candidate[key] = round(rng.uniform(low, high), 2)
+		candidate['u_max'] = max(candidate['u_max'], candidate['u_min'] + 0.1)
+		candidates.append(candidate)
+	return candidates
+
+def GridCandidates(grid):
+	keys = list(grid.keys())
+	candidates = []
+	for values in itertools.product(*[grid[key] for key in keys]):
+		candidates.append(dict(zip(keys, values)))
+	return candidates
+
+def InitWorker(db_queue, parent_dir):
+	# Each worker gets its own Redis database and scratch directory
+	redis_db = db_queue.get()
+	workdir = tempfile.mkdtemp(prefix='worker_', dir=parent_dir)
+	benchmark.SetupEnvironment(workdir, redis_db=redis_db)
+
+def EvaluateCandidate(task):
+	candidate, scenarios, seed = task
+	results = {}
+	for name in scenarios:
+		results[name] = benchmark.RunScenario(name, cycle_data=candidate, seed=seed)
+	return candidate, results, Score(results)
+
+def ParseList(value, cast=float):
+	return [cast(item) for item in value.split(',')]
+
+#==============================================================================
+#                                   Main Program
+#==============================================================================
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Search Hold mode controller parameters using the grill simulator.')
+	parser.add_argument('-m','--method',type=str, default='random', choices=['random', 'grid'], help='Search method (default random).',required=False)
+	parser.add_argument('-n','--samples',type=int, default=32, help='Number of candidates for the random search (default 32).',required=False)
+	parser.add_argument('-p','--processes',type=int, default=min(multiprocessing.cpu_count(), MAX_REDIS_DB), help='Number of worker processes (default all CPU cores, max 15).',required=False)
+	parser.add_argument('-s','--scenario',type=str, action='append', help='Scenario to evaluate (may be repeated).  Default: ' + ', '.join(DEFAULT_SCENARIOS),required=False)
+	parser.add_argument('-r','--seed',type=int, default=0, help='Random seed for the search and the simulated probe noise.',required=False)
+	parser.add_argument('-t','--top',type=int, default=5, help='Number of ranked results to print (default 5).',required=False)
+	parser.add_argument('-a','--apply', action='store_true', help='Write the winning parameters to settings.json.',required=False)
+	for key in PARAMETER_RANGES:
+		parser.add_argument('--' + key,type=str, help=f'Comma separated values of {key} for the grid search (default is the current setting).',required=False)
+	args = parser.parse_args()
+
+	settings = ReadSettings()
+	scenarios = args.scenario if args.scenario else DEFAULT_SCENARIOS
+	for name in scenarios:
+		if name not in benchmark.SCENARIOS:
+			parser.error(f'Unknown scenario: {name}')
+
+	if args.method == 'grid':
+		grid = {}
+		for key in PARAMETER_RANGES:
+			value = getattr(args, key)
+			if value is not None:
+				grid[key] = ParseList(value, int if key == 'HoldCycleTime' else float)
+			else:
+				grid[key] = [settings['cycle_data'][key]]
+		candidates = GridCandidates(grid)
+	else:
+		candidates = RandomCandidates(args.samples, seed=args.seed)
+	# Always evaluate the current settings as a reference
+	current = {key : settings['cycle_data'][key] for key in PARAMETER_RANGES}
+	if current not in candidates:
+		candidates.insert(0, current)
+
+	processes = max(1, min(args.processes, MAX_REDIS_DB, len(candidates)))
+	print(f'Evaluating {len(candidates)} candidates x {len(scenarios)} scenarios on {processes} processes...')
+
+	parent_dir = tempfile.mkdtemp(prefix='pifire_sweep_')
+	db_queue = multiprocessing.Queue()
+	for redis_db in range(1, processes + 1):
+		db_queue.put(redis_db)
+
+	ranked = []
+	try:
+		with multiprocessing.Pool(processes, initializer=InitWorker, initargs=(db_queue, parent_dir)) as pool:
+			tasks = [(candidate, scenarios, args.seed) for candidate in candidates]
+			for index, (candidate, results, score) in enumerate(pool.imap_unordered(EvaluateCandidate, tasks)):
+				ranked.append((score, candidate, results))
+				print(f'[{index + 1}/{len(candidates)}] score {score:.2f} {candidate}')
+	finally:
+		shutil.rmtree(parent_dir, ignore_errors=True)
+
+	ranked.sort(key=lambda item: item[0])
+
+	print('\nTop results:')
+	for score, candidate, results in ranked[:args.top]:
+		marker = ' (current)' if candidate == current else ''
+		print(f'  {score:8.2f}  {candidate}{marker}')
+		for name in results:
+			metrics = ', '.join([f'{metric}={results[name].get(metric)}' for metric in benchmark.METRICS])
+			print(f'            {name}: {metrics}')
+
+	best_score, best, best_results = ranked[0]
+	if args.apply:
+		if best == current:
+			print('\nThe current settings scored best.  No changes written.')
+		else:
+			settings = ReadSettings()
+			settings['cycle_data'].update(best)
+			WriteSettings(settings)
+			WriteLog('PID parameter sweep: Updated cycle data to ' + str(best))
+			print('\nWrote winning parameters to settings.json')